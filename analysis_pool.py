@@ -0,0 +1,187 @@
+"""
+⚙️ ANALYSIS POOL
+=================
+Spreads smell prediction for large repositories across worker processes.
+
+Each worker loads the ML models once (pool initializer) and then scores
+whole batches of files with predict_smell_batch; batches are dispatched in
+order and results are yielded in input order, so the output is identical
+to scoring the files serially. Small inputs skip the pool entirely.
+
+Pre-computed CK metrics are looked up in the calling process and sent
+along with each batch: only that process's CK store is refreshed when a
+precompute finishes, so a worker's own store could be out of date. At most
+two batches per worker are in flight, so a large repository's sources are
+not all copied into the pool's queue at once.
+
+Analyses under a deadline score one batch at a time (predict_batch) with
+a timeout, so one pathological file cannot hold the request past its
+deadline. The timed-out batch still finishes in its worker.
+
+The pool runs batches first come, first served. So that an interactive
+batch (bulk=False) never queues behind a whole repository, bulk batches
+are only submitted while fewer than `processes` of them are in the pool;
+interactive batches are submitted at once and wait for one batch at most.
+"""
+
+import io
+import os
+import threading
+import time
+from contextlib import redirect_stdout
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import predict_smell_extended as detector
+from ck_precompute import SPAWN_CONTEXT
+
+# Below this many files the pool's IPC costs more than it saves
+PARALLEL_MIN_FILES = 128
+
+# Batches in flight per worker process in predict_batches
+BATCHES_PER_PROCESS = 2
+
+# Models of the current worker process (set by _init_worker)
+_WORKER_MODELS: Optional[Dict] = None
+
+
+def _init_worker(latency_budget_ms: Optional[float]):
+    """Pool initializer: load the models once per worker process."""
+    global _WORKER_MODELS
+    with redirect_stdout(io.StringIO()):           # One load banner (the server's) is enough
+        _WORKER_MODELS = detector.load_models(latency_budget_ms)
+
+
+def _chunk(codes: List[str], file_paths: List[Optional[str]], use_extended: bool) -> Tuple:
+    """A batch for _predict_chunk, with its CK metrics looked up in this (the calling) process."""
+    return codes, file_paths, detector.lookup_ck_metrics(codes, file_paths), use_extended
+
+
+def _predict_chunk(chunk: Tuple) -> detector.BatchPrediction:
+    codes, file_paths, ck_metrics, use_extended = chunk
+    return detector.predict_smell_batch(codes, _WORKER_MODELS, use_extended=use_extended, file_paths=file_paths,
+                                        ck_metrics=ck_metrics)
+
+
+class AnalysisPool:
+    """
+    Lazily started process pool for predict_smell_batch.
+
+    Args:
+        processes: Worker processes (default: CPU count); 1 disables the pool
+        latency_budget_ms: Passed to load_models in every worker
+        min_files: Inputs smaller than this are scored in-process
+    """
+
+    def __init__(self, processes: Optional[int] = None, latency_budget_ms: Optional[float] = None,
+                 min_files: int = PARALLEL_MIN_FILES):
+        self.processes = processes or os.cpu_count() or 1
+        self.latency_budget_ms = latency_budget_ms
+        self.min_files = min_files
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._bulk_slots: Optional[threading.BoundedSemaphore] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=SPAWN_CONTEXT,
+                initializer=_init_worker,
+                initargs=(self.latency_budget_ms,),
+            )
+            self._bulk_slots = threading.BoundedSemaphore(self.processes)
+        return self._executor
+
+    def _submit(self, chunk: Tuple, bulk: bool, timeout: Optional[float] = None) -> Future:
+        """
+        Submit a batch to the pool; a bulk batch first waits (up to timeout
+        seconds) until fewer than `processes` bulk batches are in the pool.
+
+        Raises:
+            concurrent.futures.TimeoutError: No bulk slot freed up in time
+        """
+        pool = self._pool()
+        if not bulk:
+            return pool.submit(_predict_chunk, chunk)
+        if not self._bulk_slots.acquire(timeout=timeout):
+            raise FutureTimeout()
+        try:
+            future = pool.submit(_predict_chunk, chunk)
+        except BaseException:
+            self._bulk_slots.release()
+            raise
+        future.add_done_callback(lambda _: self._bulk_slots.release())
+        return future
+
+    def predict_batches(self, codes: List[str], file_paths: List[Optional[str]], batch_size: int,
+                        models: Optional[Dict] = None,
+                        bulk: bool = False) -> Iterator[Tuple[int, detector.BatchPrediction]]:
+        """
+        Score files in batches of batch_size (bulk: repository work, which
+        gives way to interactive batches in the pool).
+
+        Yields:
+            (offset of the batch's first file, its BatchPrediction), in input order.
+            Closing the iterator early cancels batches that have not started.
+            In the pool, BATCHES_PER_PROCESS batches per worker are submitted
+            ahead of the one being yielded.
+        """
+        offsets = range(0, len(codes), batch_size)
+        if self.processes <= 1 or len(codes) < self.min_files:
+            for start in offsets:
+                end = start + batch_size
+                yield start, detector.predict_smell_batch(codes[start:end], models, use_extended=True,
+                                                          file_paths=file_paths[start:end])
+            return
+
+        window = self.processes * BATCHES_PER_PROCESS
+        pending = iter(offsets)
+        futures = deque()
+
+        def submit_next():
+            start = next(pending, None)
+            if start is not None:
+                futures.append((start, self._submit(_chunk(
+                    codes[start:start + batch_size], file_paths[start:start + batch_size], True), bulk)))
+
+        try:
+            for _ in range(window):
+                submit_next()
+            while futures:
+                start, future = futures.popleft()
+                submit_next()
+                yield start, future.result()
+        finally:
+            for _, future in futures:
+                future.cancel()
+
+    def predict_batch(self, codes: List[str], file_paths: List[Optional[str]], models: Optional[Dict] = None,
+                      use_extended: bool = True, timeout: Optional[float] = None,
+                      bulk: bool = False) -> detector.BatchPrediction:
+        """
+        Score one batch in a worker, whatever its size.
+
+        Args:
+            timeout: Seconds to wait for the result, waiting for a bulk slot
+                included (None: no limit). With the pool disabled
+                (processes=1) the batch runs in-process and the timeout
+                cannot interrupt it.
+            bulk: Repository work, which gives way to interactive batches
+
+        Raises:
+            concurrent.futures.TimeoutError: The batch took longer than timeout
+        """
+        if self.processes <= 1:
+            return detector.predict_smell_batch(codes, models, use_extended=use_extended, file_paths=file_paths)
+        started = time.monotonic()
+        future = self._submit(_chunk(codes, file_paths, use_extended), bulk, timeout)
+        try:
+            return future.result(None if timeout is None else max(timeout - (time.monotonic() - started), 0.0))
+        finally:
+            future.cancel()                   # Not started yet: drop it; running: it finishes unseen
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
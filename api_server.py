@@ -5,38 +5,206 @@ REST API for Unity integration - Converts Java code analysis into
 building metrics for 3D city visualization.
 
 Run with: python api_server.py
+Production: python api_server.py --prod [--workers N] [--max-requests N] [--port P]
+            (preforked workers sharing the preloaded models; requests that need
+            the server's in-memory state all go to one of them, see prefork_server.py)
 API runs on: http://localhost:5000
 
 Endpoints:
 - POST /analyze/code       - Analyze single Java code snippet
+- POST /analyze/batch      - Analyze an array of Java code snippets in one call
 - POST /analyze/file       - Analyze a single .java file
 - POST /analyze/repo       - Analyze all Java files in a directory
+- POST /analyze/repo/delta - Only the buildings/edges changed since a city version
+- POST /analyze/repo/districts - Per-package summaries of a large repository
+- POST /analyze/repo/district  - Buildings of one district (drill-down)
 - POST /analyze/github     - Clone and analyze a GitHub repository
+- POST /analyze/archive    - Analyze an uploaded zip/tar archive (e.g. from CI)
+- GET  /jobs/<id>          - Progress / result of an async repo or GitHub analysis
+- GET  /jobs/<id>/events   - Live progress of an async analysis (server-sent events)
+- DELETE /jobs/<id>        - Cancel an async analysis
 - GET  /health             - Health check endpoint
+- GET  /metrics            - Prometheus metrics (latency per endpoint and stage, caches, queues)
+
+/analyze/repo and /analyze/github also stream NDJSON ("stream": true or
+Accept: application/x-ndjson): one "building" record per file as soon as it
+is scored, then relationship records, a "layout" record, then a "summary"
+record.
+
+Repository cities carry a "layout": building positions from a squarified
+treemap with one district per package (see city_layout.py), cached per
+repository and city version.
 """
 
 import os
 import sys
 import json
+import hashlib
 import tempfile
 import shutil
 import subprocess
+import time
+import multiprocessing
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextlib import closing
 from pathlib import Path
-from dataclasses import dataclass, asdict
-from typing import List, Dict, Optional, Any
-from flask import Flask, request, jsonify
+from dataclasses import dataclass, asdict, field
+from typing import List, Dict, Iterator, Optional, Any, Tuple
+import numpy as np
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 
 # Import our smell detection module
 import predict_smell_extended as detector
+from ck_store import get_ck_store, warmup_ck_store
+from ck_precompute import CKPrecomputer, content_hash
+from job_manager import DONE, FINISHED_STATES, Job, JobManager, QueueFullError
+from analysis_pool import AnalysisPool
+from single_flight import SingleFlight
+from lane_scheduler import LaneScheduler, LaneTimeout
+import city_codec
+from layout_store import LayoutStore, edge_dict
+from city_layout import CityLayoutCache
+from districts import district_buildings, summarize_districts
+from archive_reader import ArchiveError, ArchiveTooLarge, read_java_sources
+import server_metrics
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Unity WebGL builds
 
-# Load models once at startup
-print("Loading ML models...")
-MODELS = detector.load_models()
-print("✓ Models loaded!")
+# EDUCODE_LATENCY_BUDGET_MS picks a point on the pruned ensemble's latency/F1 frontier
+LATENCY_BUDGET_MS = os.environ.get("EDUCODE_LATENCY_BUDGET_MS")
+
+# Spawned pool workers (analysis, CK precompute) re-import this module as
+# __mp_main__; they load what they need themselves, so skip the startup work
+IS_WORKER_PROCESS = multiprocessing.parent_process() is not None
+
+if IS_WORKER_PROCESS:
+    MODELS = None
+else:
+    # Load models once at startup
+    print("Loading ML models...")
+    MODELS = detector.load_models(float(LATENCY_BUDGET_MS) if LATENCY_BUDGET_MS else None)
+    print(f"✓ Models loaded ({detector.model_state(MODELS)})!")
+    
+    # Build the CK metrics snapshot now instead of inside the first requests
+    print(f"✓ CK metrics snapshot ready ({warmup_ck_store(detector.BASE / 'ck_metrics')} classes)")
+
+
+def refresh_ck_store():
+    """Pick up CSVs written by the background CK precompute."""
+    store = get_ck_store()
+    if store is not None:
+        store.refresh()
+
+
+def loaded_ck_paths(project_key: str, files: Dict[str, str]) -> Dict[str, str]:
+    """
+    CK_PRECOMPUTE.current_paths, limited to the rows this process's CK
+    store has loaded: a building keyed as having CK metrics then really
+    was computed from them, so it is not reused with approximate ones.
+    """
+    store = get_ck_store()
+    if store is None:
+        return {}
+    return {rel: path for rel, path in CK_PRECOMPUTE.current_paths(project_key, files).items()
+            if store.lookup_path(path) is not None}
+
+
+# Submitted repositories get full CK metrics computed in the background, so
+# later requests for the same repository run in accurate ML mode
+CK_PRECOMPUTE = CKPrecomputer(on_update=refresh_ck_store,
+                              max_projects=int(os.environ.get("EDUCODE_CK_MAX_PROJECTS", 64)))
+
+# Asynchronous repo/GitHub analyses ("async": true); queue depth is bounded
+JOBS = JobManager(workers=int(os.environ.get("EDUCODE_JOB_WORKERS", 2)),
+                  max_queued=int(os.environ.get("EDUCODE_MAX_QUEUED_JOBS", 16)))
+
+# Deadline-bound analyses run in smaller batches to re-plan more often, and
+# keep this share of the budget for relationship extraction
+DEADLINE_BATCH_FILES = 16
+RELATIONSHIP_RESERVE = 0.1
+
+# Last analyses per repository: unchanged files are not reanalyzed, and
+# /analyze/repo/delta sends only what changed since a given city version
+LAYOUTS = LayoutStore(max_repos=int(os.environ.get("EDUCODE_LAYOUT_REPOS", 32)))
+
+# Building positions (squarified treemap) per repository and city version
+CITY_LAYOUTS = CityLayoutCache(max_repos=int(os.environ.get("EDUCODE_LAYOUT_REPOS", 32)))
+
+# /analyze/repo/districts analyzes every file up to this cap (not the first
+# max_files), since clients only fetch the buildings of districts on screen
+MAX_DISTRICT_FILES = int(os.environ.get("EDUCODE_MAX_DISTRICT_FILES", 20000))
+
+# Caps for /analyze/archive uploads (bytes uploaded, archive entries,
+# uncompressed bytes read). Sources live under a virtual root, never on disk
+MAX_ARCHIVE_BYTES = int(os.environ.get("EDUCODE_MAX_ARCHIVE_BYTES", 100 * 1024 * 1024))
+MAX_ARCHIVE_MEMBERS = int(os.environ.get("EDUCODE_MAX_ARCHIVE_MEMBERS", 50000))
+MAX_ARCHIVE_UNPACKED_BYTES = int(os.environ.get("EDUCODE_MAX_ARCHIVE_UNPACKED_BYTES", 512 * 1024 * 1024))
+ARCHIVE_ROOT = "/archive"
+
+# Identical in-flight analyses (same ETag) share one computation
+ANALYSIS_FLIGHTS = SingleFlight()
+
+# Interactive snippet requests and bulk repository analyses get separate
+# capacity, so long repo jobs cannot starve editor/snippet calls
+INTERACTIVE, BULK = "interactive", "bulk"
+SCHEDULER = LaneScheduler({
+    INTERACTIVE: (int(os.environ.get("EDUCODE_INTERACTIVE_SLOTS", 8)), 30.0),
+    BULK: (int(os.environ.get("EDUCODE_BULK_SLOTS", 2)), None),
+})
+
+API_VERSION = "1.0.0"
+
+# Everything besides the input that decides analysis results; part of every ETag
+ANALYZER_TAG = f"{API_VERSION}|{LATENCY_BUDGET_MS}|{','.join(sorted(MODELS or {}))}"
+
+# Largest snippet array accepted by /analyze/batch
+MAX_BATCH_SNIPPETS = int(os.environ.get("EDUCODE_MAX_BATCH_SNIPPETS", 1000))
+
+# Idle /jobs/<id>/events streams get a keepalive comment this often
+SSE_KEEPALIVE_S = 15.0
+
+# Files per predict_smell_batch call (also the progress/cancellation granularity)
+ANALYSIS_BATCH_FILES = 64
+
+# Large repositories are scored across worker processes (models loaded once per worker)
+ANALYSIS_PROCESSES = os.environ.get("EDUCODE_ANALYSIS_PROCESSES")
+ANALYSIS_POOL = AnalysisPool(int(ANALYSIS_PROCESSES) if ANALYSIS_PROCESSES else None,
+                             latency_budget_ms=float(LATENCY_BUDGET_MS) if LATENCY_BUDGET_MS else None)
+
+# Prometheus metrics (GET /metrics): request latency per endpoint, time per
+# analysis stage, cache hit rates, and queue depths read at scrape time
+METRICS = server_metrics.Registry()
+REQUESTS = METRICS.counter("educode_requests_total", "HTTP requests by endpoint and status",
+                           ("endpoint", "method", "status"))
+REQUEST_SECONDS = METRICS.histogram("educode_request_duration_seconds",
+                                    "Time until the response is returned (streams: until the first byte)",
+                                    ("endpoint", "method"))
+STAGE_SECONDS = METRICS.histogram("educode_stage_duration_seconds",
+                                  "Time per analysis stage (file_read, clone, metrics, detectors, ml, "
+                                  "relationships, layout, serialization)", ("stage",))
+CACHE_LOOKUPS = METRICS.counter("educode_cache_lookups_total",
+                                "Cache lookups (etag, single_flight, buildings) by result", ("cache", "result"))
+METRICS.counter_callback("educode_layout_cache_lookups_total", "City layout cache lookups by result",
+                         ("result",), lambda: {("hit",): CITY_LAYOUTS.hits, ("miss",): CITY_LAYOUTS.misses})
+METRICS.gauge("educode_lane_tasks", "Tasks per scheduler lane and state", ("lane", "state"),
+              lambda: {(name, state): lane[state] for name, lane in SCHEDULER.stats().items()
+                       for state in ("running", "waiting")})
+METRICS.counter_callback("educode_lane_rejected_total", "Tasks refused after waiting for a lane slot",
+                         ("lane",), lambda: {(name, ): lane["rejected"] for name, lane in SCHEDULER.stats().items()})
+METRICS.gauge("educode_jobs", "Async analysis jobs per state", ("state",),
+              lambda: {(state, ): count for state, count in JOBS.stats().items()})
+METRICS.gauge("educode_analyses_in_flight", "Distinct analyses currently running (after coalescing)", (),
+              ANALYSIS_FLIGHTS.in_flight)
+METRICS.gauge("educode_ck_precompute_busy", "1 while a CK metrics precompute is queued or running", (),
+              lambda: int(CK_PRECOMPUTE.busy()))
+
+
+def record_batch_timings(batch: detector.BatchPrediction):
+    """Feed a batch's metric extraction / ML / detector times into the stage histogram."""
+    for stage, seconds in batch.timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # DATA STRUCTURES FOR UNITY
@@ -90,6 +258,16 @@ class CityLayout:
     average_quality: float
 
 
+@dataclass
+class Truncation:
+    """Which parts of a city were cut short to meet a request's deadline"""
+    extended_smells: bool = False   # Extended detectors skipped for some files
+    relationships: bool = False     # No connections extracted
+    files: bool = False             # Only a sample of the files became buildings
+    analyzed_files: int = 0
+    total_files: int = 0
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # HELPER FUNCTIONS
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -126,15 +304,12 @@ def calculate_quality_score(result) -> float:
     
     # Reduce score based on number and severity of smells
     score = 1.0
-    severe_smells = {"GodClass", "GodMethod", "SwallowedException"}
-    medium_smells = {"LongMethod", "FeatureEnvy", "GlobalMutableState"}
-    
     for smell, conf in result.all_smells:
         if smell == "Clean":
             continue
-        if smell in severe_smells:
+        if smell in SEVERE_SMELLS:
             score -= 0.3 * conf
-        elif smell in medium_smells:
+        elif smell in MEDIUM_SMELLS:
             score -= 0.2 * conf
         else:
             score -= 0.1 * conf
@@ -142,6 +317,40 @@ def calculate_quality_score(result) -> float:
     return max(0.0, min(1.0, score))
 
 
+# Penalty per unit confidence, matching calculate_quality_score
+SEVERE_SMELLS = {"GodClass", "GodMethod", "SwallowedException"}
+MEDIUM_SMELLS = {"LongMethod", "FeatureEnvy", "GlobalMutableState"}
+
+
+def smell_severity_weights(smells: List[str]) -> np.ndarray:
+    """Quality penalty weight for each smell name (Clean costs nothing)."""
+    return np.array([
+        0.0 if s == "Clean" else 0.3 if s in SEVERE_SMELLS else 0.2 if s in MEDIUM_SMELLS else 0.1
+        for s in smells
+    ], dtype=np.float64)
+
+
+def calculate_quality_scores(batch) -> np.ndarray:
+    """
+    Vectorized calculate_quality_score over a detector.BatchPrediction.
+    
+    Model-smell and extended-smell hits are merged into one matrix (max per
+    smell, as all_smells deduplicates), weighted by severity and summed per row.
+    """
+    vocab = list(batch.smells) + [s for s in batch.extended_smells if s not in batch.smells]
+    column = {s: j for j, s in enumerate(vocab)}
+    
+    hits = np.zeros((len(batch), len(vocab)), dtype=np.float64)
+    hits[:, :len(batch.smells)] = batch.model_hits()
+    if len(batch.extended_indices):
+        ext_columns = np.array([column[s] for s in batch.extended_smells])[batch.extended_indices]
+        np.maximum.at(hits, (batch.extended_rows(), ext_columns), batch.extended_confidence)
+    
+    scores = np.clip(1.0 - hits @ smell_severity_weights(vocab), 0.0, 1.0)
+    scores[np.array(batch.primary_smells, dtype=object) == "Clean"] = 1.0
+    return scores
+
+
 def extract_class_name(code: str, file_path: str = "") -> str:
     """Extract class name from Java code or filename"""
     import re
@@ -161,8 +370,190 @@ def extract_class_name(code: str, file_path: str = "") -> str:
 def analyze_code_for_building(code: str, file_path: str = "") -> BuildingMetrics:
     """Analyze Java code and return building metrics for Unity"""
     
-    # Run smell detection
-    result = detector.predict_smell(code, MODELS, use_extended=True)
+    # Run smell detection (a batch of one: same result as predict_smell, plus stage timings)
+    batch = detector.predict_smell_batch([code], MODELS, use_extended=True)
+    record_batch_timings(batch)
+    result = batch.results[0]
+    return building_from_result(code, file_path, result, calculate_quality_score(result))
+
+
+def analyze_codes_for_buildings(java_files: Dict[str, str], root: str,
+                                ck_paths: Optional[Dict[str, str]] = None,
+                                job: Optional[Job] = None) -> List[BuildingMetrics]:
+    """
+    Analyze many Java files in batches and return their buildings.
+    
+    Args:
+        java_files: Mapping of absolute file path to source code
+        root: Directory that building file paths are made relative to
+        ck_paths: Relative path -> CK store path for files with precomputed metrics
+        job: Background job to report progress to after each batch
+    
+    Returns:
+        One BuildingMetrics per file, in input order
+    """
+    return list(iter_buildings(java_files, root, ck_paths, job))
+
+
+def analyze_snippets_for_buildings(codes: List[str], filenames: List[str]) -> List[BuildingMetrics]:
+    """
+    Batched analyze_code_for_building: one BuildingMetrics per snippet, in order.
+    
+    Args:
+        codes: Java sources
+        filenames: Display file name of each snippet ("" if unknown)
+    """
+    buildings = []
+    batches = ANALYSIS_POOL.predict_batches(codes, [None] * len(codes), ANALYSIS_BATCH_FILES, models=MODELS)
+    with closing(batches):
+        for start, batch in batches:
+            chunk = slice(start, start + len(batch))
+            record_batch_timings(batch)
+            qualities = calculate_quality_scores(batch)
+            buildings.extend(
+                building_from_result(code, filename, result, float(quality))
+                for code, filename, result, quality in zip(codes[chunk], filenames[chunk], batch.results, qualities)
+            )
+    return buildings
+
+
+def iter_buildings(java_files: Dict[str, str], root: str,
+                   ck_paths: Optional[Dict[str, str]] = None,
+                   job: Optional[Job] = None, done: int = 0,
+                   total: Optional[int] = None) -> Iterator[BuildingMetrics]:
+    """
+    Same as analyze_codes_for_buildings, but yields each batch's buildings
+    as soon as the batch is scored instead of collecting them all.
+    
+    Job progress counts `done` files as already finished, out of `total`
+    (default: the files given), e.g. when reused buildings make up the rest.
+    """
+    paths = [os.path.relpath(fp, root) for fp in java_files]
+    codes = list(java_files.values())
+    ck_paths = ck_paths or {}
+    total = len(codes) + done if total is None else total
+    
+    if job and codes:
+        job.publish("files_started", files=paths[:ANALYSIS_BATCH_FILES])
+    batches = ANALYSIS_POOL.predict_batches(codes, [ck_paths.get(p) for p in paths],
+                                            ANALYSIS_BATCH_FILES, models=MODELS, bulk=True)
+    with closing(batches):                  # Cancelling a job drops its remaining batches
+        for start, batch in batches:
+            analyzed = start + len(batch)
+            if job:
+                job.report(done + analyzed, total)
+                job.check_cancelled()
+            chunk = slice(start, start + len(batch))
+            record_batch_timings(batch)
+            qualities = calculate_quality_scores(batch)
+            for code, path, result, quality in zip(codes[chunk], paths[chunk], batch.results, qualities):
+                yield building_from_result(code, path, result, float(quality))
+            if job and analyzed < len(codes):
+                job.publish("files_started", files=paths[analyzed:analyzed + ANALYSIS_BATCH_FILES])
+
+
+@dataclass
+class Deadline:
+    """Time budget of one request, counted from start (its arrival, see start_deadline)"""
+    budget_s: float
+    start: float = field(default_factory=time.perf_counter)
+    
+    def remaining(self) -> float:
+        return self.budget_s - (time.perf_counter() - self.start)
+    
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.start) * 1000, 1)
+
+
+def iter_incremental_buildings(java_files: Dict[str, str], root: str, ck_paths: Dict[str, str],
+                               layout_key: str, file_keys: Dict[str, str],
+                               job: Optional[Job] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Building dicts in file order, reusing the last analysis (LAYOUTS) of
+    every file whose key (content hash, CK metrics used) is unchanged and
+    analyzing only the rest.
+    """
+    cached = LAYOUTS.cached_buildings(layout_key, file_keys)
+    paths = [os.path.relpath(fp, root) for fp in java_files]
+    changed = {fp: code for (fp, code), path in zip(java_files.items(), paths) if path not in cached}
+    CACHE_LOOKUPS.inc(len(paths) - len(changed), cache="buildings", result="hit")
+    CACHE_LOOKUPS.inc(len(changed), cache="buildings", result="miss")
+    if job:
+        job.report(len(cached), len(paths))
+    analyzed = iter_buildings(changed, root, ck_paths, job=job, done=len(cached), total=len(paths))
+    with closing(analyzed):
+        for path in paths:
+            yield cached[path] if path in cached else asdict(next(analyzed))
+
+
+def iter_buildings_by_deadline(java_files: Dict[str, str], root: str, ck_paths: Dict[str, str],
+                               job: Optional[Job], deadline: Deadline,
+                               truncation: Truncation) -> Iterator[BuildingMetrics]:
+    """
+    iter_buildings under a time budget. Before each batch the cost of the
+    remaining files is projected from the last batch; while it exceeds
+    the time left, analysis degrades one step at a time:
+    
+        1. extended detectors are skipped for the remaining files
+        2. relationship extraction is given up (its reserve is freed)
+        3. an evenly spaced sample of the remaining files is analyzed
+    
+    Steps taken are recorded in truncation. If no time is left (e.g. it
+    was spent waiting for a lane slot) no file is analyzed. Batches run in
+    the analysis pool with the time left as timeout; a batch that does not
+    finish in time ends the analysis (its files count as truncated).
+    """
+    paths = [os.path.relpath(fp, root) for fp in java_files]
+    codes = list(java_files.values())
+    reserve = deadline.budget_s * RELATIONSHIP_RESERVE
+    
+    pending = list(range(len(codes)))
+    use_extended = True
+    per_file = None                          # Seconds per file at the current step
+    while pending:
+        if deadline.remaining() <= 0:
+            truncation.files = True
+            break
+        if per_file is not None:
+            available = deadline.remaining() - (0 if truncation.relationships else reserve)
+            if per_file * len(pending) > available:
+                if use_extended:
+                    use_extended, truncation.extended_smells = False, True
+                    per_file = None          # Measure the cheaper analysis first
+                    continue
+                if not truncation.relationships:
+                    truncation.relationships = True
+                    continue
+                fits = max(int(available / per_file), 0)
+                truncation.files = True
+                pending = [pending[int(i * len(pending) / fits)] for i in range(fits)] if fits else []
+                if not pending:
+                    break
+        
+        chunk, pending = pending[:DEADLINE_BATCH_FILES], pending[DEADLINE_BATCH_FILES:]
+        if job:
+            job.publish("files_started", files=[paths[i] for i in chunk])
+        started = time.perf_counter()
+        try:
+            batch = ANALYSIS_POOL.predict_batch([codes[i] for i in chunk], [ck_paths.get(paths[i]) for i in chunk],
+                                                MODELS, use_extended=use_extended,
+                                                timeout=max(deadline.remaining(), 0.0), bulk=True)
+        except FutureTimeout:
+            truncation.files = True
+            break
+        record_batch_timings(batch)
+        qualities = calculate_quality_scores(batch)
+        per_file = (time.perf_counter() - started) / len(chunk)
+        for i, result, quality in zip(chunk, batch.results, qualities):
+            yield building_from_result(codes[i], paths[i], result, float(quality))
+        truncation.analyzed_files += len(chunk)
+        if job:
+            job.report(truncation.analyzed_files, truncation.analyzed_files + len(pending))
+            job.check_cancelled()
+
+
+def building_from_result(code: str, file_path: str, result, quality: float) -> BuildingMetrics:
+    """Build the Unity building for an already computed PredictionResult"""
     
     # Calculate building dimensions from metrics
     metrics = result.details.get("metrics", {})
@@ -178,7 +569,6 @@ def analyze_code_for_building(code: str, file_path: str = "") -> BuildingMetrics
     # Get quality color and convert to single int
     color_rgb = get_quality_color(result.primary_smell, result.primary_confidence)
     color_int = (int(color_rgb[0] * 255) << 16) | (int(color_rgb[1] * 255) << 8) | int(color_rgb[2] * 255)
-    quality = calculate_quality_score(result)
     
     # Format all smells for Unity
     all_smells = []
@@ -245,101 +635,83 @@ def analyze_code_for_building(code: str, file_path: str = "") -> BuildingMetrics
     )
 
 
-def extract_relationships(java_files: Dict[str, str]) -> Dict[str, List[Dict]]:
+RELATIONSHIP_KINDS = ("inheritance", "associations", "compositions", "dependencies", "aggregations")
+
+
+# One class's candidate relationships: (class name or None, [(kind, to, type)])
+RelationshipFacts = Tuple[Optional[str], List[Tuple[str, str, str]]]
+
+
+def relationship_facts(code: str) -> RelationshipFacts:
     """
-    Extract relationships between classes for city connections.
-    Returns inheritance, associations, compositions, dependencies, aggregations.
+    The class a Java source declares and every relationship it could have,
+    before knowing which referenced types are classes of the repository
+    (see resolve_relationships). Lets the source be dropped right after it
+    is analyzed.
     """
     import re
     
-    relationships = {
-        "inheritance": [],
-        "associations": [],
-        "compositions": [],
-        "dependencies": [],
-        "aggregations": []
-    }
+    # Get current class name
+    class_match = re.search(r'(?:public\s+)?class\s+(\w+)', code)
+    if not class_match:
+        return None, []
+    candidates = []
     
-    # Build class name to file mapping
-    class_names = set()
-    for path, code in java_files.items():
-        match = re.search(r'(?:public\s+)?class\s+(\w+)', code)
-        if match:
-            class_names.add(match.group(1))
-    
-    for path, code in java_files.items():
-        # Get current class name
-        class_match = re.search(r'(?:public\s+)?class\s+(\w+)', code)
-        if not class_match:
-            continue
-        current_class = class_match.group(1)
-        
-        # INHERITANCE: extends keyword -> Bridges
-        extends_match = re.search(r'extends\s+(\w+)', code)
-        if extends_match:
-            parent = extends_match.group(1)
-            if parent in class_names:
-                relationships["inheritance"].append({
-                    "from": current_class,
-                    "to": parent,
-                    "type": "extends"
-                })
-        
-        # IMPLEMENTS -> Also bridges
-        implements_match = re.search(r'implements\s+([\w\s,]+)', code)
-        if implements_match:
-            interfaces = [i.strip() for i in implements_match.group(1).split(',')]
-            for iface in interfaces:
-                if iface in class_names:
-                    relationships["inheritance"].append({
-                        "from": current_class,
-                        "to": iface,
-                        "type": "implements"
-                    })
-        
-        # COMPOSITION: Private final fields of other classes -> Annexes
-        comp_pattern = r'private\s+final\s+(\w+)\s+\w+\s*[;=]'
-        for match in re.finditer(comp_pattern, code):
-            field_type = match.group(1)
-            if field_type in class_names and field_type != current_class:
-                relationships["compositions"].append({
-                    "from": current_class,
-                    "to": field_type
-                })
-        
-        # AGGREGATION: Private non-final fields -> Shared Courtyards
-        agg_pattern = r'private\s+(?!final)(\w+)\s+\w+\s*[;=]'
-        for match in re.finditer(agg_pattern, code):
-            field_type = match.group(1)
-            if field_type in class_names and field_type != current_class:
-                relationships["aggregations"].append({
-                    "from": current_class,
-                    "to": field_type
-                })
-        
-        # ASSOCIATION: Public fields or method params -> Roads
-        assoc_pattern = r'public\s+(\w+)\s+\w+\s*[;=\(]'
-        for match in re.finditer(assoc_pattern, code):
-            field_type = match.group(1)
-            if field_type in class_names and field_type != current_class:
-                relationships["associations"].append({
-                    "from": current_class,
-                    "to": field_type
-                })
-        
-        # DEPENDENCY: new ClassName() or method calls -> Utility Lines
-        new_pattern = r'new\s+(\w+)\s*\('
-        for match in re.finditer(new_pattern, code):
-            created_type = match.group(1)
-            if created_type in class_names and created_type != current_class:
-                # Avoid duplicates with composition
-                existing_comp = [c for c in relationships["compositions"] 
-                               if c["from"] == current_class and c["to"] == created_type]
-                if not existing_comp:
-                    relationships["dependencies"].append({
-                        "from": current_class,
-                        "to": created_type
-                    })
+    # INHERITANCE: extends keyword -> Bridges
+    extends_match = re.search(r'extends\s+(\w+)', code)
+    if extends_match:
+        candidates.append(("inheritance", extends_match.group(1), "extends"))
+    
+    # IMPLEMENTS -> Also bridges
+    implements_match = re.search(r'implements\s+([\w\s,]+)', code)
+    if implements_match:
+        for iface in implements_match.group(1).split(','):
+            candidates.append(("inheritance", iface.strip(), "implements"))
+    
+    # COMPOSITION: Private final fields of other classes -> Annexes
+    for match in re.finditer(r'private\s+final\s+(\w+)\s+\w+\s*[;=]', code):
+        candidates.append(("compositions", match.group(1), ""))
+    
+    # AGGREGATION: Private non-final fields -> Shared Courtyards
+    for match in re.finditer(r'private\s+(?!final)(\w+)\s+\w+\s*[;=]', code):
+        candidates.append(("aggregations", match.group(1), ""))
+    
+    # ASSOCIATION: Public fields or method params -> Roads
+    for match in re.finditer(r'public\s+(\w+)\s+\w+\s*[;=\(]', code):
+        candidates.append(("associations", match.group(1), ""))
+    
+    # DEPENDENCY: new ClassName() or method calls -> Utility Lines
+    for match in re.finditer(r'new\s+(\w+)\s*\(', code):
+        candidates.append(("dependencies", match.group(1), ""))
+    
+    return class_match.group(1), candidates
+
+
+def resolve_relationships(facts: List[RelationshipFacts]) -> Dict[str, List[Dict]]:
+    """
+    Relationships between the classes of a repository, from the
+    relationship_facts of its files (in file order).
+    Returns inheritance, associations, compositions, dependencies, aggregations.
+    """
+    relationships = {kind: [] for kind in RELATIONSHIP_KINDS}
+    class_names = {current_class for current_class, _ in facts if current_class}
+    composed = set()
+    
+    for current_class, candidates in facts:
+        for kind, target, rel_type in candidates:
+            if target not in class_names:
+                continue
+            if kind == "inheritance":
+                relationships[kind].append({"from": current_class, "to": target, "type": rel_type})
+                continue
+            if target == current_class:
+                continue
+            # Avoid duplicates with composition
+            if kind == "dependencies" and (current_class, target) in composed:
+                continue
+            if kind == "compositions":
+                composed.add((current_class, target))
+            relationships[kind].append({"from": current_class, "to": target})
     
     # Remove duplicates
     for rel_type in relationships:
@@ -355,18 +727,27 @@ def extract_relationships(java_files: Dict[str, str]) -> Dict[str, List[Dict]]:
     return relationships
 
 
+def extract_relationships(java_files: Dict[str, str]) -> Dict[str, List[Dict]]:
+    """
+    Extract relationships between classes for city connections.
+    Returns inheritance, associations, compositions, dependencies, aggregations.
+    """
+    return resolve_relationships([relationship_facts(code) for code in java_files.values()])
+
+
 def clone_github_repo(repo_url: str) -> str:
     """Clone a GitHub repository and return the temp directory path"""
     temp_dir = tempfile.mkdtemp(prefix="educode_")
     
     try:
         # Clone the repository
-        subprocess.run(
-            ["git", "clone", "--depth", "1", repo_url, temp_dir],
-            check=True,
-            capture_output=True,
-            text=True
-        )
+        with STAGE_SECONDS.time(stage="clone"):
+            subprocess.run(
+                ["git", "clone", "--depth", "1", repo_url, temp_dir],
+                check=True,
+                capture_output=True,
+                text=True
+            )
         return temp_dir
     except subprocess.CalledProcessError as e:
         shutil.rmtree(temp_dir, ignore_errors=True)
@@ -375,6 +756,11 @@ def clone_github_repo(repo_url: str) -> str:
 
 def find_java_files(directory: str) -> Dict[str, str]:
     """Find all .java files in a directory and return path -> code mapping"""
+    with STAGE_SECONDS.time(stage="file_read"):
+        return _read_java_files(directory)
+
+
+def _read_java_files(directory: str) -> Dict[str, str]:
     java_files = {}
     
     for root, dirs, files in os.walk(directory):
@@ -393,17 +779,476 @@ def find_java_files(directory: str) -> Dict[str, str]:
     return java_files
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# CITY PIPELINE (shared by synchronous requests and background jobs)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class AnalysisError(Exception):
+    """An analysis that cannot produce a city, with the HTTP status to report."""
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def in_lane(lane: str, fn, *args, deadline: Optional[Deadline] = None):
+    """
+    Run fn(*args) in a scheduler slot of lane (AnalysisError 503 if none
+    frees up in time).
+    
+    Under a deadline the wait for a slot is part of the budget: once the
+    deadline passes in the queue, fn runs without a slot and, having no
+    time left, answers at once with a fully truncated city.
+    """
+    try:
+        with SCHEDULER.slot(lane, deadline.remaining() if deadline else None):
+            return fn(*args)
+    except LaneTimeout as e:
+        if deadline is None or deadline.remaining() > 0:
+            raise AnalysisError(str(e), 503)
+    return fn(*args)
+
+
+def in_lane_records(lane: str, records: Iterator[Dict[str, Any]],
+                    deadline: Optional[Deadline] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream records while holding a slot of lane (taken when streaming
+    starts; under a deadline, as for in_lane).
+    """
+    try:
+        with SCHEDULER.slot(lane, deadline.remaining() if deadline else None):
+            yield from records
+            return
+    except LaneTimeout:
+        if deadline is None or deadline.remaining() > 0:
+            raise
+    yield from records
+
+
+def bulk_job(job: Job, fn, *args):
+    """
+    Job function running fn(job, *args) in the bulk lane. While every bulk
+    slot is taken the job is "waiting", and cancelling it ends the wait.
+    """
+    if SCHEDULER.lanes[BULK].full():
+        job.set_waiting(True)
+    with SCHEDULER.slot(BULK, interrupt=job.check_cancelled):
+        job.set_waiting(False)
+        return fn(job, *args)
+
+
+def iter_city_records(java_files: Dict[str, str], root: str, project_key: str,
+                      max_files: int = 100, job: Optional[Job] = None,
+                      deadline: Optional[Deadline] = None,
+                      precompute_ck: bool = True,
+                      layout_key: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Analyze a repository's Java files into city records for Unity.
+    
+    Args:
+        java_files: Mapping of absolute file path to source code
+        root: Repository root (building paths are relative to it)
+        project_key: Identifies the repository for the CK metrics precompute
+        max_files: Maximum number of files turned into buildings
+        job: Background job to report progress to / check for cancellation
+        deadline: Time budget of the request (started at its arrival, so
+            queueing and cloning count); analysis degrades to meet it and
+            the summary gets a "truncated" record of what was cut (see
+            Truncation)
+        precompute_ck: Precompute CK metrics for the repository in the
+            background (False: buildings keep the approximate metrics)
+        layout_key: Key the city is remembered under in LAYOUTS and
+            CITY_LAYOUTS (default: project_key; see districts_key)
+    
+    Yields:
+        {"record": "building", ...BuildingMetrics} per file as soon as its batch
+        is scored, then {"record": "<relationship kind>", "from", "to", "type"}
+        per relationship, then a single {"record": "layout", ...} with the
+        building positions (see CityLayoutCache.layout), then a single
+        {"record": "summary", ...}
+    """
+    # Precompute full CK metrics for the whole repository in the background
+    if precompute_ck:
+        relative_files = {os.path.relpath(fp, root): code for fp, code in java_files.items()}
+        ck_status = CK_PRECOMPUTE.submit(project_key, relative_files)
+        ck_paths = loaded_ck_paths(project_key, relative_files)
+        del relative_files
+    else:
+        ck_status, ck_paths = {"state": "skipped"}, {}
+    
+    layout_key = layout_key or project_key
+    
+    # Limit number of files
+    if len(java_files) > max_files:
+        java_files = dict(list(java_files.items())[:max_files])
+    
+    # Analyze all files in batches. Buildings are not kept: besides running
+    # totals, only their layout inputs (path, LOC, WMC) and, for LAYOUTS,
+    # their encoded JSON are. Sources are reduced to their relationship
+    # facts as their buildings come out, and this function lets go of them
+    # once the last building is out; they are only freed then if the caller
+    # does not hold java_files itself (streamed responses do not, jobs and
+    # whole-city responses do until the city is built). Without a deadline,
+    # files unchanged since the last analysis reuse their building
+    total = clean_count = 0
+    quality_sum = 0.0
+    truncation = Truncation(total_files=len(java_files))
+    recorder = None
+    paths, loc, wmc = [], [], []
+    sources = iter(java_files.items())
+    facts: List[RelationshipFacts] = []
+    facts_s = 0.0
+    
+    def add_facts(until: Optional[str] = None):
+        """Relationship facts of the next sources, up to the one of building path until (None: all)."""
+        nonlocal facts_s
+        started = time.perf_counter()
+        for fp, code in sources:
+            facts.append(relationship_facts(code))
+            if os.path.relpath(fp, root) == until:
+                break
+        facts_s += time.perf_counter() - started
+    
+    if deadline:
+        file_keys = None
+        buildings = (asdict(b) for b in
+                     iter_buildings_by_deadline(java_files, root, ck_paths, job, deadline, truncation))
+    else:
+        file_keys = {rel: f"{content_hash(code)}:{int(rel in ck_paths)}"
+                     for rel, code in ((os.path.relpath(fp, root), code) for fp, code in java_files.items())}
+        buildings = iter_incremental_buildings(java_files, root, ck_paths, layout_key, file_keys, job)
+        recorder = LAYOUTS.begin(layout_key)
+    for building in buildings:
+        total += 1
+        clean_count += building["primary_smell"] == "Clean"
+        quality_sum += building["quality_score"]
+        if job:
+            job.publish("file_done", file=building["file_path"], class_name=building["class_name"],
+                        primary_smell=building["primary_smell"], quality_score=building["quality_score"],
+                        done=total, total=len(java_files), clean_count=clean_count,
+                        average_quality=round(quality_sum / total, 3))
+        paths.append(building["file_path"])
+        loc.append(building["loc"])
+        wmc.append(building["wmc"])
+        if recorder is not None:
+            recorder.add(building, file_keys.get(building["file_path"]))
+        if not truncation.relationships:
+            add_facts(building["file_path"])
+        yield {"record": "building", **building}
+    
+    # Extract relationships (unless the deadline has no room left for them)
+    if deadline and deadline.remaining() <= 0:
+        truncation.relationships = True
+    edges = []
+    if not truncation.relationships:
+        add_facts()                          # Files left out of the city still count as classes
+    del java_files, sources
+    if not truncation.relationships:
+        started = time.perf_counter()
+        relationships = resolve_relationships(facts)
+        STAGE_SECONDS.observe(facts_s + time.perf_counter() - started, stage="relationships")
+        for kind in RELATIONSHIP_KINDS:
+            for rel in relationships[kind]:
+                edges.append((kind, rel["from"], rel["to"], rel.get("type", "")))
+                yield {"record": kind, **rel}
+    
+    summary = {
+        "record": "summary",
+        "total_classes": total,
+        "clean_count": clean_count,
+        "smell_count": total - clean_count,
+        "average_quality": round(quality_sum / total, 3) if total else 0,
+        "ck_metrics": ck_status
+    }
+    if deadline:
+        summary["truncated"] = {**asdict(truncation), "deadline_ms": round(deadline.budget_s * 1000),
+                                "elapsed_ms": deadline.elapsed_ms()}
+    else:
+        summary["version"] = recorder.commit(edges)
+    
+    # Positions are cached per city version (truncated cities have none)
+    with STAGE_SECONDS.time(stage="layout"):
+        layout = CITY_LAYOUTS.layout(layout_key, summary.get("version"), paths, loc, wmc)
+    yield {"record": "layout", **layout}
+    yield summary
+
+
+def assemble_city(records: Iterator[Dict[str, Any]]) -> Dict[str, Any]:
+    """Collect city records into the CityLayout JSON dict."""
+    city: Dict[str, Any] = {"buildings": [], **{kind: [] for kind in RELATIONSHIP_KINDS}}
+    for record in records:
+        kind = record.pop("record")
+        if kind == "building":
+            city["buildings"].append(record)
+        elif kind == "layout":
+            city["layout"] = record
+        elif kind == "summary":
+            city.update(record)
+        else:
+            city[kind].append(record)
+    return city
+
+
+def build_city(java_files: Dict[str, str], root: str, project_key: str, max_files: int = 100,
+               job: Optional[Job] = None, deadline: Optional[Deadline] = None,
+               precompute_ck: bool = True) -> Dict[str, Any]:
+    """
+    Analyze a repository's Java files into the city layout for Unity.
+    
+    Returns:
+        CityLayout as a JSON-ready dict (arguments as for iter_city_records)
+    """
+    return assemble_city(iter_city_records(java_files, root, project_key, max_files, job, deadline,
+                                           precompute_ck))
+
+
+def load_directory(directory: str) -> Dict[str, str]:
+    """Java files of a local directory (AnalysisError if there are none)."""
+    java_files = find_java_files(directory)
+    if not java_files:
+        raise AnalysisError("No Java files found in directory", 404)
+    return java_files
+
+
+def directory_city_records(directory: str, max_files: int = 100, job: Optional[Job] = None,
+                           deadline: Optional[Deadline] = None,
+                           layout_key: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """City records for a local directory (raises before the first record if there is nothing to analyze)."""
+    java_files = load_directory(directory)
+    return iter_city_records(java_files, directory, os.path.abspath(directory), max_files, job, deadline,
+                             layout_key=layout_key)
+
+
+def github_city_records(repo_url: str, max_files: int = 100, job: Optional[Job] = None,
+                        deadline: Optional[Deadline] = None,
+                        layout_key: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    City records for a GitHub repository. The clone happens up front; the
+    temp dir is removed once the records are exhausted or closed. The
+    clone counts against the deadline; with none left, nothing is cloned
+    and the city is empty and truncated.
+    """
+    if deadline and deadline.remaining() <= 0:
+        return iter_city_records({}, "", repo_url, max_files, job, deadline, precompute_ck=False,
+                                 layout_key=layout_key)
+    
+    # Clone the repository
+    temp_dir = clone_github_repo(repo_url)
+    try:
+        if job:
+            job.check_cancelled()
+        java_files = find_java_files(temp_dir)
+        if not java_files:
+            raise AnalysisError("No Java files found in repository", 404)
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    
+    def records():
+        try:
+            for record in iter_city_records(java_files, temp_dir, repo_url, max_files, job, deadline,
+                                            layout_key=layout_key):
+                if record["record"] == "summary":
+                    record["repo_url"] = repo_url
+                yield record
+        finally:
+            # Cleanup temp directory
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    return records()
+
+
+def analyze_directory(job: Optional[Job], directory: str, max_files: int = 100,
+                      deadline: Optional[Deadline] = None, layout_key: Optional[str] = None) -> Dict[str, Any]:
+    """City layout for a local directory (job is None for synchronous requests)."""
+    return assemble_city(directory_city_records(directory, max_files, job, deadline, layout_key))
+
+
+def analyze_github_repo(job: Optional[Job], repo_url: str, max_files: int = 100,
+                        deadline: Optional[Deadline] = None, layout_key: Optional[str] = None) -> Dict[str, Any]:
+    """City layout for a GitHub repository (cloned to a temp dir, then removed)."""
+    return assemble_city(github_city_records(repo_url, max_files, job, deadline, layout_key))
+
+
+def analyze_archive_files(job: Optional[Job], java_files: Dict[str, str], project_key: str,
+                          max_files: int = 100, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    """
+    City layout for the Java sources of an uploaded archive (under
+    ARCHIVE_ROOT). Uploads are anonymous, so no CK metrics are precomputed
+    (they would be written to ck_metrics/ and never evicted).
+    """
+    return build_city(java_files, ARCHIVE_ROOT, project_key, max_files, job, deadline,
+                      precompute_ck=False)
+
+
+def content_etag(*parts: str) -> str:
+    """ETag value over the analyzer configuration and the given input parts."""
+    digest = hashlib.sha1(ANALYZER_TAG.encode())
+    for part in parts:
+        digest.update(b"\0")
+        digest.update(part.encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest()
+
+
+def directory_etag(directory: str, java_files: Dict[str, str], max_files: int,
+                   project_key: Optional[str] = None, precompute_ck: bool = True) -> str:
+    """
+    ETag of a directory's city: file paths and contents (in analysis order),
+    max_files, and which files have up-to-date precomputed CK metrics
+    loaded (see loaded_ck_paths).
+    project_key defaults to the directory's absolute path.
+    """
+    project_key = project_key or os.path.abspath(directory)
+    relative_files = {os.path.relpath(fp, directory): code for fp, code in java_files.items()}
+    ck_current = loaded_ck_paths(project_key, relative_files) if precompute_ck else {}
+    parts = ["repo", project_key, str(max_files), ",".join(sorted(ck_current))]
+    for rel, code in relative_files.items():
+        parts += [rel, code]
+    return content_etag(*parts)
+
+
+def remote_head(repo_url: str) -> Optional[str]:
+    """Commit id of a remote repository's HEAD (None if it cannot be resolved)."""
+    try:
+        out = subprocess.run(["git", "ls-remote", repo_url, "HEAD"], check=True,
+                             capture_output=True, text=True, timeout=30).stdout
+    except (subprocess.SubprocessError, OSError):
+        return None
+    return out.split()[0] if out.strip() else None
+
+
+def etag_response(etag: Optional[str], key: Any, fn, *args, city: bool = False) -> Response:
+    """
+    Answer 304 when the client already holds etag, otherwise return
+    fn(*args) as JSON tagged with etag. Identical in-flight requests (same
+    key) share one computation and are marked X-Coalesced.
+    
+    ETags are weak: the city's informational "ck_metrics" progress may
+    differ while the analysis itself is unchanged. Cities cut short by a
+    deadline are not tagged. Cities (city=True) are sent in the binary
+    columnar encoding when the client's Accept header prefers it.
+    """
+    binary = city and wants_binary_city()
+    if etag and binary:
+        etag += ".bin"                      # Each representation has its own tag
+    if etag and request.if_none_match.contains_weak(etag):
+        CACHE_LOOKUPS.inc(cache="etag", result="hit")
+        response = Response(status=304)
+    else:
+        if etag:
+            CACHE_LOOKUPS.inc(cache="etag", result="miss")
+        result, shared = ANALYSIS_FLIGHTS.do(key, fn, *args)
+        CACHE_LOOKUPS.inc(cache="single_flight", result="hit" if shared else "miss")
+        response = city_response(result) if city else jsonify(result)
+        if shared:
+            response.headers['X-Coalesced'] = 'true'
+        if city and is_truncated(result):
+            etag = None
+    if etag:
+        response.set_etag(etag, weak=True)
+    if city:
+        response.vary.add('Accept')
+    return response
+
+
+def wants_binary_city() -> bool:
+    """The client prefers the binary columnar city encoding over JSON."""
+    return request.accept_mimetypes.best_match(['application/json', city_codec.MIME_TYPE]) == city_codec.MIME_TYPE
+
+
+def city_response(city: Dict[str, Any]) -> Response:
+    """A city layout as JSON, or binary (city_codec) if the client asked for it."""
+    with STAGE_SECONDS.time(stage="serialization"):
+        if wants_binary_city():
+            return Response(city_codec.encode(city), mimetype=city_codec.MIME_TYPE)
+        return jsonify(city)
+
+
+def is_truncated(city: Dict[str, Any]) -> bool:
+    """Whether a deadline cut any part of the city short."""
+    truncated = city.get("truncated") or {}
+    return any(truncated.get(part) for part in ("extended_smells", "relationships", "files"))
+
+
+def parse_deadline(data: Dict[str, Any]) -> Optional[float]:
+    """The request's "deadline_ms" (None if absent; AnalysisError if invalid)."""
+    deadline_ms = data.get('deadline_ms')
+    if deadline_ms is None:
+        return None
+    if isinstance(deadline_ms, bool) or not isinstance(deadline_ms, (int, float)) or deadline_ms <= 0:
+        raise AnalysisError("'deadline_ms' must be a positive number of milliseconds", 400)
+    return float(deadline_ms)
+
+
+def start_deadline(deadline_ms: Optional[float]) -> Optional[Deadline]:
+    """The current request's Deadline, counted from its arrival (None without deadline_ms)."""
+    if deadline_ms is None:
+        return None
+    return Deadline(deadline_ms / 1000, start=request.environ.get('educode.started', time.perf_counter()))
+
+
+def wants_stream(data: Dict[str, Any]) -> bool:
+    """NDJSON streaming was asked for ("stream": true or Accept: application/x-ndjson)."""
+    return bool(data.get('stream')) or request.accept_mimetypes.best == 'application/x-ndjson'
+
+
+def ndjson_response(records: Iterator[Dict[str, Any]]) -> Response:
+    """
+    Stream city records as NDJSON, one record per line. A failure after the
+    response has started is reported as a final {"record": "error"} line.
+    """
+    def generate():
+        serializing = 0.0
+        with closing(records):              # Client disconnects stop the analysis
+            try:
+                for record in records:
+                    started = time.perf_counter()
+                    line = json.dumps(record) + "\n"
+                    serializing += time.perf_counter() - started
+                    yield line
+            except Exception as e:
+                yield json.dumps({"record": "error", "error": str(e)}) + "\n"
+            finally:
+                STAGE_SECONDS.observe(serializing, stage="serialization")
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # API ENDPOINTS
 # ═══════════════════════════════════════════════════════════════════════════════
 
+@app.before_request
+def start_request_timer():
+    request.environ['educode.started'] = time.perf_counter()
+
+
+@app.after_request
+def record_request(response: Response) -> Response:
+    """Count the request and observe its latency (per route pattern, so job ids do not add series)."""
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    started = request.environ.get('educode.started')
+    if started is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+    REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics (text exposition format, see server_metrics.py)"""
+    return Response(METRICS.render(), content_type=server_metrics.CONTENT_TYPE)
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (with per-lane load and queue times)"""
     return jsonify({
         "status": "healthy",
-        "models_loaded": MODELS is not None,
-        "version": "1.0.0"
+        "models_loaded": detector.model_state(MODELS) == "full",
+        "model_state": detector.model_state(MODELS),
+        "model_components": detector.model_components(MODELS),
+        "version": API_VERSION,
+        "lanes": SCHEDULER.stats()
     })
 
 
@@ -418,7 +1263,8 @@ def analyze_code():
         "filename": "Example.java"  (optional)
     }
     
-    Returns: BuildingMetrics for the class
+    Returns: BuildingMetrics for the class (ETag over the code; a matching
+    If-None-Match gets 304)
     """
     data = request.get_json()
     
@@ -429,8 +1275,51 @@ def analyze_code():
     filename = data.get('filename', '')
     
     try:
-        building = analyze_code_for_building(code, filename)
-        return jsonify(asdict(building))
+        etag = content_etag("code", filename, code)
+        return etag_response(etag, etag, in_lane, INTERACTIVE,
+                             lambda: asdict(analyze_code_for_building(code, filename)))
+    except AnalysisError as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """
+    Analyze many Java code snippets in one request (batched metric
+    extraction and model inference).
+    
+    Request body (a bare array is accepted too):
+    {
+        "files": [
+            {"code": "public class A { ... }", "filename": "A.java"},
+            {"code": "public class B { ... }"}
+        ]
+    }
+    
+    Returns: {"buildings": [BuildingMetrics, ...]} in request order
+    """
+    data = request.get_json(silent=True)
+    files = data.get('files') if isinstance(data, dict) else data
+    
+    if not isinstance(files, list):
+        return jsonify({"error": "Expected a 'files' array in request body"}), 400
+    if len(files) > MAX_BATCH_SNIPPETS:
+        return jsonify({"error": f"Too many snippets ({len(files)}), at most {MAX_BATCH_SNIPPETS} per request"}), 413
+    
+    codes, filenames = [], []
+    for i, item in enumerate(files):
+        if not isinstance(item, dict) or not isinstance(item.get('code'), str):
+            return jsonify({"error": f"Missing 'code' in files[{i}]"}), 400
+        codes.append(item['code'])
+        filenames.append(item.get('filename') or '')
+    
+    try:
+        buildings = in_lane(INTERACTIVE, analyze_snippets_for_buildings, codes, filenames)
+        return jsonify({"buildings": [asdict(b) for b in buildings]})
+    except AnalysisError as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -459,8 +1348,10 @@ def analyze_file():
         with open(file_path, 'r', encoding='utf-8') as f:
             code = f.read()
         
-        building = analyze_code_for_building(code, file_path)
+        building = in_lane(INTERACTIVE, analyze_code_for_building, code, file_path)
         return jsonify(asdict(building))
+    except AnalysisError as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -471,11 +1362,33 @@ def analyze_repo():
     Analyze all Java files in a local directory.
     Returns complete city layout with buildings and relationships.
     
+    The first request schedules a background CK metrics precompute for the
+    directory ("ck_metrics" in the response reports its state); once it is
+    ready, unchanged files are scored in accurate ML mode.
+    
+    Responses carry an ETag derived from the files' contents: a request with
+    a matching If-None-Match gets 304 without reanalysis, and identical
+    requests arriving while one is being analyzed share its result.
+    
     Request body:
     {
         "directory": "/path/to/project",
-        "max_files": 100  (optional, default 100)
+        "max_files": 100,  (optional, default 100)
+        "async": true,     (optional: return 202 + job id, poll GET /jobs/<id>)
+        "stream": true,    (optional: NDJSON, one building per line as files finish,
+                            then relationship lines, a layout line and a summary line)
+        "deadline_ms": 2000 (optional: time budget from the request's arrival)
     }
+    
+    With "Accept: application/x-educode-city" the city is sent in the
+    compact columnar binary encoding (see city_codec.py) instead of JSON.
+    
+    Under a deadline the analysis degrades step by step as time runs out -
+    extended detectors skipped, then relationships, then only a sample of
+    the files analyzed - and the city gets a "truncated" entry with the
+    steps taken (see Truncation). Time spent waiting for a bulk slot
+    counts: if the deadline passes in the queue, the city is empty and
+    fully truncated.
     """
     data = request.get_json()
     
@@ -489,52 +1402,218 @@ def analyze_repo():
         return jsonify({"error": f"Directory not found: {directory}"}), 404
     
     try:
-        # Find all Java files
-        java_files = find_java_files(directory)
-        
-        if not java_files:
-            return jsonify({"error": "No Java files found in directory"}), 404
-        
-        # Limit number of files
-        if len(java_files) > max_files:
-            java_files = dict(list(java_files.items())[:max_files])
-        
-        # Analyze each file
-        buildings = []
-        clean_count = 0
-        
-        for file_path, code in java_files.items():
-            relative_path = os.path.relpath(file_path, directory)
-            building = analyze_code_for_building(code, relative_path)
-            buildings.append(asdict(building))
-            if building.primary_smell == "Clean":
-                clean_count += 1
-        
-        # Extract relationships
-        relationships = extract_relationships(java_files)
-        
-        # Calculate averages
-        avg_quality = sum(b["quality_score"] for b in buildings) / len(buildings) if buildings else 0
-        
-        city = {
-            "buildings": buildings,
-            "inheritance": relationships["inheritance"],
-            "associations": relationships["associations"],
-            "compositions": relationships["compositions"],
-            "dependencies": relationships["dependencies"],
-            "aggregations": relationships["aggregations"],
-            "total_classes": len(buildings),
-            "clean_count": clean_count,
-            "smell_count": len(buildings) - clean_count,
-            "average_quality": round(avg_quality, 3)
-        }
-        
-        return jsonify(city)
+        deadline_ms = parse_deadline(data)
+        deadline = start_deadline(deadline_ms)
+        if data.get('async'):
+            return submit_job("repo", analyze_directory, directory, max_files, deadline)
+        if wants_stream(data):
+            return ndjson_response(in_lane_records(BULK, directory_city_records(directory, max_files,
+                                                                                deadline=deadline), deadline))
+        java_files = load_directory(directory)
+        etag = directory_etag(directory, java_files, max_files)
+        return etag_response(etag, (etag, deadline_ms), lambda: in_lane(
+            BULK, build_city, java_files, directory, os.path.abspath(directory), max_files, None, deadline,
+            deadline=deadline), city=True)
+    except AnalysisError as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def project_key_of(data: Dict[str, Any]) -> str:
+    """Repository key of a request body with "directory" or "repo_url"."""
+    if 'directory' in data:
+        return os.path.abspath(data['directory'])
+    return data['repo_url']
+
+
+def districts_key(project_key: str) -> str:
+    """
+    Key of a repository's districts city in LAYOUTS and CITY_LAYOUTS. It
+    covers up to MAX_DISTRICT_FILES files, so it is kept apart from the
+    max_files city of /analyze/repo: drill-down requests never see the
+    smaller city, and neither city's reuse is undone by the other.
+    """
+    return project_key + "#districts"
+
+
+def analyze_project(data: Dict[str, Any], max_files: int,
+                    layout_key: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Analyze the "directory" or "repo_url" of a request body in the bulk lane.
+    
+    Args:
+        layout_key: Key the city is remembered under (default: the project key)
+    
+    Returns:
+        (project key, city layout dict)
+    """
+    if 'directory' in data:
+        directory = data['directory']
+        if not os.path.isdir(directory):
+            raise AnalysisError(f"Directory not found: {directory}", 404)
+        return project_key_of(data), in_lane(BULK, analyze_directory, None, directory, max_files, None,
+                                             layout_key)
+    return project_key_of(data), in_lane(BULK, analyze_github_repo, None, data['repo_url'], max_files, None,
+                                         layout_key)
+
+
+@app.route('/analyze/repo/delta', methods=['POST'])
+def analyze_repo_delta():
+    """
+    Reanalyze a repository and return only what changed since a city
+    version (the "version" of an earlier /analyze/repo, /analyze/github or
+    delta response). Files unchanged since the last analysis are not
+    reanalyzed.
+    
+    Request body:
+    {
+        "directory": "/path/to/project",   (or "repo_url": "https://github.com/...")
+        "since": "3f2a9c0d1e4b5a67",       (optional: version the client has)
+        "max_files": 100                   (optional)
+    }
+    
+    Returns:
+    {
+        "version": "...", "since": "...",
+        "full": false,                     (true: since unknown, everything is "added")
+        "buildings": {"added": [...], "changed": [...], "removed": [file_path, ...]},
+        "relationships": {"added": [{"kind", "from", "to", "type"}], "removed": [...]},
+        "layout": {...},                   (positions of all buildings, with a
+                                            "file_path" column)
+        "total_classes", "clean_count", "smell_count", "average_quality", "ck_metrics"
+    }
+    """
+    data = request.get_json()
+    
+    if not data or ('directory' not in data and 'repo_url' not in data):
+        return jsonify({"error": "Missing 'directory' or 'repo_url' in request body"}), 400
+    
+    try:
+        project_key, city = analyze_project(data, data.get('max_files', 100))
+        edges = [(kind, rel["from"], rel["to"], rel.get("type", ""))
+                 for kind in RELATIONSHIP_KINDS for rel in city[kind]]
+        delta = LAYOUTS.delta(project_key, data.get('since'), city, edges)
+        summary = {k: v for k, v in city.items() if k != "buildings" and k not in RELATIONSHIP_KINDS}
+        # Without the full building list, positions are keyed by file path
+        layout = summary["layout"]
+        summary["layout"] = {**layout, "buildings": {**layout["buildings"],
+                                                     "file_path": [b["file_path"] for b in city["buildings"]]}}
+        return jsonify({**summary, **delta})
+    except AnalysisError as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/analyze/repo/districts', methods=['POST'])
+def analyze_repo_districts():
+    """
+    Level-of-detail overview of a (large) repository: one summary per
+    package directory instead of every building. Fetch the buildings of the
+    districts on screen with /analyze/repo/district.
+    
+    Every Java file is analyzed (up to EDUCODE_MAX_DISTRICT_FILES), and the
+    city is remembered under its own key (see districts_key), so drill-down
+    requests and later overviews do not reanalyze unchanged files.
+    
+    Request body:
+    {
+        "directory": "/path/to/project",   (or "repo_url": "https://github.com/...")
+        "max_level": 1                     (optional: only districts up to this depth)
+    }
+    
+    Returns:
+    {
+        "version": "...",
+        "districts": [{"name", "parent", "level", "children",
+                       "buildings", "direct_buildings", "loc",
+                       "clean_count", "smell_count", "average_quality",
+                       "smells": {smell: buildings},
+                       "plot": {"x", "z", "width", "depth"}  (districts with files)}],
+        "layout": {"width", "depth"},
+        "total_classes", "clean_count", "smell_count", "average_quality", "ck_metrics"
+    }
+    """
+    data = request.get_json()
+    
+    if not data or ('directory' not in data and 'repo_url' not in data):
+        return jsonify({"error": "Missing 'directory' or 'repo_url' in request body"}), 400
     
+    try:
+        project_key = project_key_of(data)
+        _, city = analyze_project(data, MAX_DISTRICT_FILES, districts_key(project_key))
+        layout = city["layout"]
+        plots = {d["name"]: {k: d[k] for k in ("x", "z", "width", "depth")} for d in layout["districts"]}
+        districts = []
+        for district in summarize_districts(city["buildings"], data.get('max_level')):
+            summary = asdict(district)
+            if district.name in plots:
+                summary["plot"] = plots[district.name]
+            districts.append(summary)
+        
+        overview = {k: v for k, v in city.items()
+                    if k not in ("buildings", "layout") and k not in RELATIONSHIP_KINDS}
+        return jsonify({**overview, "districts": districts,
+                        "layout": {"width": layout["width"], "depth": layout["depth"]}})
+    except AnalysisError as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/analyze/repo/district', methods=['POST'])
+def analyze_repo_district():
+    """
+    Buildings of one district of the last /analyze/repo/districts overview
+    of a repository, without reanalysis.
+    
+    Request body:
+    {
+        "directory": "/path/to/project",   (or "repo_url": "https://github.com/...")
+        "district": "src/main/java/org/example/service",
+        "recursive": false,                (optional: include subdistricts)
+        "version": "3f2a9c0d1e4b5a67"      (optional: 409 if the repository has
+                                            been reanalyzed since)
+    }
+    
+    Returns:
+    {
+        "version": "...", "district": "...",
+        "buildings": [...],
+        "layout": {"x", "z", "width", "depth"},   (columns aligned with buildings)
+        "relationships": [{"kind", "from", "to", "type"}]  (touching these buildings)
+    }
+    """
+    data = request.get_json()
+    
+    if not data or ('directory' not in data and 'repo_url' not in data) or 'district' not in data:
+        return jsonify({"error": "Missing 'district' and 'directory' or 'repo_url' in request body"}), 400
+    
+    layout_key = districts_key(project_key_of(data))
+    latest = LAYOUTS.latest(layout_key)
+    if latest is None:
+        return jsonify({"error": "Repository not analyzed yet, request /analyze/repo/districts first"}), 404
+    version, buildings, edges = latest
+    if data.get('version') and data['version'] != version:
+        return jsonify({"error": "Repository was reanalyzed, reload the districts", "version": version}), 409
+    
+    selected = district_buildings(buildings, data['district'], bool(data.get('recursive')))
+    if not selected:
+        return jsonify({"error": f"District not found: {data['district']}"}), 404
+    
+    layout = CITY_LAYOUTS.cached(layout_key, version)
+    classes = {buildings[i]["class_name"] for i in selected}
+    return jsonify({
+        "version": version,
+        "district": data['district'],
+        "buildings": [buildings[i] for i in selected],
+        "layout": {k: [layout["buildings"][k][i] for i in selected] for k in ("x", "z", "width", "depth")}
+                  if layout else None,
+        "relationships": [edge_dict(e) for e in sorted(edges) if e[1] in classes or e[2] in classes],
+    })
+
+
 @app.route('/analyze/github', methods=['POST'])
 def analyze_github():
     """
@@ -543,10 +1622,15 @@ def analyze_github():
     Request body:
     {
         "repo_url": "https://github.com/username/repo",
-        "max_files": 100  (optional)
+        "max_files": 100,  (optional)
+        "async": true,     (optional: return 202 + job id, poll GET /jobs/<id>)
+        "stream": true,    (optional: NDJSON records, as for /analyze/repo)
+        "deadline_ms": 2000 (optional: as for /analyze/repo; the clone counts too)
     }
     
-    Returns: Complete city layout
+    Returns: Complete city layout (CK metrics are precomputed per repo URL,
+    as for /analyze/repo). The ETag is derived from the remote HEAD commit,
+    so an unchanged repository gets 304 without being cloned.
     """
     data = request.get_json()
     
@@ -556,81 +1640,258 @@ def analyze_github():
     repo_url = data['repo_url']
     max_files = data.get('max_files', 100)
     
-    temp_dir = None
     try:
-        # Clone the repository
-        temp_dir = clone_github_repo(repo_url)
-        
-        # Find and analyze Java files
-        java_files = find_java_files(temp_dir)
-        
-        if not java_files:
-            return jsonify({"error": "No Java files found in repository"}), 404
-        
-        # Limit files
-        if len(java_files) > max_files:
-            java_files = dict(list(java_files.items())[:max_files])
-        
-        # Analyze each file
-        buildings = []
-        clean_count = 0
-        
-        for file_path, code in java_files.items():
-            relative_path = os.path.relpath(file_path, temp_dir)
-            building = analyze_code_for_building(code, relative_path)
-            buildings.append(asdict(building))
-            if building.primary_smell == "Clean":
-                clean_count += 1
-        
-        # Extract relationships
-        relationships = extract_relationships(java_files)
-        
-        # Calculate averages
-        avg_quality = sum(b["quality_score"] for b in buildings) / len(buildings) if buildings else 0
-        
-        city = {
-            "repo_url": repo_url,
-            "buildings": buildings,
-            "inheritance": relationships["inheritance"],
-            "associations": relationships["associations"],
-            "compositions": relationships["compositions"],
-            "dependencies": relationships["dependencies"],
-            "aggregations": relationships["aggregations"],
-            "total_classes": len(buildings),
-            "clean_count": clean_count,
-            "smell_count": len(buildings) - clean_count,
-            "average_quality": round(avg_quality, 3)
-        }
-        
-        return jsonify(city)
+        deadline_ms = parse_deadline(data)
+        deadline = start_deadline(deadline_ms)
+        if data.get('async'):
+            return submit_job("github", analyze_github_repo, repo_url, max_files, deadline)
+        if wants_stream(data):
+            return ndjson_response(in_lane_records(BULK, github_city_records(repo_url, max_files,
+                                                                             deadline=deadline), deadline))
+        head = remote_head(repo_url)
+        etag = content_etag("github", repo_url, head, str(max_files),
+                            json.dumps(CK_PRECOMPUTE.status(repo_url), sort_keys=True)) if head else None
+        return etag_response(etag, ("github", repo_url, max_files, head, deadline_ms), lambda: in_lane(
+            BULK, analyze_github_repo, None, repo_url, max_files, deadline, deadline=deadline), city=True)
+    except AnalysisError as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/analyze/archive', methods=['POST'])
+def analyze_archive():
+    """
+    Analyze the Java files of a zip or tar (.tar, .tar.gz, .tgz, ...)
+    archive sent as the request body, e.g. from CI:
+    
+        curl --data-binary @src.zip "http://localhost:5000/analyze/archive?project=my-service"
+    
+    Only *.java members are read, in memory (see archive_reader.py), with
+    caps on the upload size (EDUCODE_MAX_ARCHIVE_BYTES), the number of
+    entries (EDUCODE_MAX_ARCHIVE_MEMBERS) and the uncompressed bytes
+    (EDUCODE_MAX_ARCHIVE_UNPACKED_BYTES); exceeding one gives 413. No CK
+    metrics are precomputed for archives (summary "ck_metrics" is
+    "skipped"), so classes are scored from the approximate metrics.
+    
+    Query parameters (the body is the archive):
+        project=name      (optional: repository name; uploads of the same
+                           project reuse unchanged buildings)
+        max_files=100     (optional)
+        async=1, stream=1, deadline_ms=2000   (optional: as for /analyze/repo)
+    
+    Returns: Complete city layout, as for /analyze/repo (with ETag).
+    """
+    if request.mimetype.startswith('multipart/'):
+        return jsonify({"error": "Send the archive itself as the request body, not as a form upload"}), 415
+    if request.content_length is not None and request.content_length > MAX_ARCHIVE_BYTES:
+        return jsonify({"error": f"Archive larger than {MAX_ARCHIVE_BYTES} bytes"}), 413
+    
+    data: Dict[str, Any] = {"stream": request.args.get('stream', '') in ('1', 'true')}
+    try:
+        max_files = int(request.args.get('max_files', 100))
+        if 'deadline_ms' in request.args:
+            data['deadline_ms'] = float(request.args['deadline_ms'])
+    except ValueError:
+        return jsonify({"error": "'max_files' and 'deadline_ms' must be numbers"}), 400
     
+    try:
+        deadline_ms = parse_deadline(data)
+        deadline = start_deadline(deadline_ms)
+        with STAGE_SECONDS.time(stage="file_read"):
+            sources = read_java_sources(request.stream, MAX_ARCHIVE_BYTES, MAX_ARCHIVE_MEMBERS,
+                                        MAX_ARCHIVE_UNPACKED_BYTES)
+        if not sources:
+            return jsonify({"error": "No Java files found in archive"}), 404
+        java_files = {f"{ARCHIVE_ROOT}/{path}": code for path, code in sources.items()}
+        project = request.args.get('project')
+        project_key = f"archive:{project}" if project else \
+            "archive:" + content_etag(*(part for item in sources.items() for part in item))[:16]
+        
+        if request.args.get('async', '') in ('1', 'true'):
+            return submit_job("archive", analyze_archive_files, java_files, project_key, max_files, deadline)
+        if wants_stream(data):
+            return ndjson_response(in_lane_records(BULK, iter_city_records(java_files, ARCHIVE_ROOT, project_key,
+                                                                           max_files, deadline=deadline,
+                                                                           precompute_ck=False), deadline))
+        etag = directory_etag(ARCHIVE_ROOT, java_files, max_files, project_key, precompute_ck=False)
+        return etag_response(etag, (etag, deadline_ms), lambda: in_lane(
+            BULK, analyze_archive_files, None, java_files, project_key, max_files, deadline, deadline=deadline),
+                             city=True)
+    except ArchiveTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except ArchiveError as e:
+        return jsonify({"error": str(e)}), 400
+    except AnalysisError as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+def submit_job(kind: str, fn, *args):
+    """Queue an analysis job and answer 202 with where to poll it."""
+    try:
+        job = JOBS.submit(kind, bulk_job, fn, *args)
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 429
+    return jsonify({
+        "job_id": job.id,
+        "state": job.state,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events"
+    }), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Job status: state, progress (files done/total), ETA, and the city
+    layout under "result" once the state is "done".
     
-    finally:
-        # Cleanup temp directory
-        if temp_dir and os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir, ignore_errors=True)
+    With "Accept: application/x-educode-city", a finished job answers with
+    just its city in the binary encoding (status fields are not included).
+    """
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    if job.state == DONE and wants_binary_city():
+        return city_response(job.result)
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Server-sent events for a job, from the start (or after Last-Event-ID):
+    
+        state          - job state and progress (first and last event)
+        files_started  - files of the batch now being scored
+        file_done      - file, class_name, primary_smell, quality_score,
+                         done/total and the running clean_count / average_quality
+    
+    The stream ends after the job's finished state event. Event ids count
+    every event of the job; ids missing from the stream were dropped from
+    the job's log (see job_manager.MAX_JOB_EVENTS) - a finished job only
+    replays its state events.
+    """
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    last_id = request.headers.get('Last-Event-ID', '')
+    sent = int(last_id) + 1 if last_id.isdigit() else 0
+    
+    def generate():
+        nonlocal sent
+        while True:
+            events = job.wait_events(sent, SSE_KEEPALIVE_S)
+            if not events:
+                yield ": keepalive\n\n"     # Keeps proxies from closing an idle stream
+                continue
+            for event_id, event in events:
+                data = {k: v for k, v in event.items() if k != "event"}
+                yield f"id: {event_id}\nevent: {event['event']}\ndata: {json.dumps(data)}\n\n"
+                sent = event_id + 1
+                if event["event"] == "state" and event["state"] in FINISHED_STATES:
+                    return
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job."""
+    job = JOBS.cancel(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(job.to_dict(include_result=False))
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # MAIN
 # ═══════════════════════════════════════════════════════════════════════════════
 
+def parse_flag(name: str, default: int) -> int:
+    """Integer command line option: --name N"""
+    if name in sys.argv:
+        idx = sys.argv.index(name)
+        if idx + 1 < len(sys.argv):
+            return int(sys.argv[idx + 1])
+    return default
+
+
+# Endpoints whose answers do not depend on what this process has served
+# before; with --prod every other request goes to the primary worker, which
+# holds the jobs, city versions, layouts and CK precompute (prefork_server.py)
+STATELESS_PATHS = frozenset({'/analyze/code', '/analyze/batch', '/analyze/file', '/health'})
+
+
+def needs_state(environ) -> bool:
+    return environ.get('PATH_INFO', '') not in STATELESS_PATHS
+
+
+def can_recycle_worker() -> bool:
+    """A --prod worker may exit once it holds no job (pending or still to be collected) and no CK precompute runs."""
+    return not any(JOBS.stats().values()) and not CK_PRECOMPUTE.busy()
+
+
+def size_analysis_pool(slot: int, workers: int):
+    """
+    Size a --prod worker's analysis pool (unless EDUCODE_ANALYSIS_PROCESSES
+    fixes it). Worker 0, the primary, runs every repository analysis, so
+    its pool gets all CPUs; the other workers only need theirs for large
+    /analyze/batch requests and split the CPUs between them.
+    """
+    if not ANALYSIS_PROCESSES:
+        cpus = os.cpu_count() or 1
+        ANALYSIS_POOL.processes = cpus if slot == 0 else max(cpus // workers, 1)
+
+
 if __name__ == '__main__':
-    print("""
+    port = parse_flag("--port", 5000)
+    prod = "--prod" in sys.argv
+    running = f"Running on: http://localhost:{port} ({'prefork' if prod else 'development'} server)"
+    print(f"""
 ╔═══════════════════════════════════════════════════════════════════════════════╗
 ║                     EduCode - Code Smell Detection API                        ║
 ╠═══════════════════════════════════════════════════════════════════════════════╣
 ║  Endpoints:                                                                   ║
 ║    POST /analyze/code     - Analyze Java code snippet                         ║
+║    POST /analyze/batch    - Analyze many Java code snippets                   ║
 ║    POST /analyze/file     - Analyze a local .java file                        ║
 ║    POST /analyze/repo     - Analyze local directory                           ║
+║    POST /analyze/repo/delta - Changes since a city version                    ║
+║    POST /analyze/repo/districts - Per-package summaries (large repos)         ║
+║    POST /analyze/repo/district  - Buildings of one district                   ║
 ║    POST /analyze/github   - Clone and analyze GitHub repo                     ║
+║    POST /analyze/archive  - Analyze uploaded zip/tar archive                  ║
+║    GET  /jobs/<id>        - Async analysis progress / result                  ║
+║    GET  /jobs/<id>/events - Live analysis progress (SSE)                      ║
+║    DELETE /jobs/<id>      - Cancel async analysis                             ║
 ║    GET  /health           - Health check                                      ║
+║    GET  /metrics          - Prometheus metrics                                ║
 ╠═══════════════════════════════════════════════════════════════════════════════╣
-║  Running on: http://localhost:5000                                            ║
+║  {running:<77}║
 ╚═══════════════════════════════════════════════════════════════════════════════╝
     """)
     
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    if prod:
+        # Models and the CK snapshot are already loaded: workers share them copy-on-write
+        from prefork_server import serve
+        workers = parse_flag("--workers", int(os.environ.get("EDUCODE_WORKERS", os.cpu_count() or 1)))
+        # /metrics adds up the counts of all workers, see server_metrics.py
+        metrics_dir = Path(tempfile.mkdtemp(prefix="educode-metrics-"))
+        
+        def start_worker(slot: int):
+            METRICS.share(metrics_dir)
+            size_analysis_pool(slot, workers)
+        
+        try:
+            serve(app, host='0.0.0.0', port=port, workers=workers,
+                  max_requests=parse_flag("--max-requests", int(os.environ.get("EDUCODE_MAX_REQUESTS", 1000))),
+                  can_recycle=can_recycle_worker, pinned=needs_state,
+                  post_fork=start_worker, worker_exit=METRICS.unshare)
+        finally:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+    else:
+        app.run(host='0.0.0.0', port=port, debug=True)
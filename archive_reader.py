@@ -0,0 +1,164 @@
+"""
+📦 ARCHIVE READER
+==================
+Java sources of an uploaded zip or tar archive (.tar, .tar.gz, .tgz,
+.tar.bz2, .tar.xz), read entirely in memory - nothing is extracted to disk.
+
+Tar archives are read as a stream, member by member, so only the Java
+sources are ever held in memory. Zip archives keep their index at the
+end, so the upload itself is buffered (up to max_upload_bytes) before the
+Java members are decompressed.
+
+Every archive is capped: upload size, number of members, and uncompressed
+bytes read (which also stops decompression bombs). Members outside the
+archive root (absolute or ".." paths), hidden directories and test
+directories are skipped, as find_java_files does for local directories.
+"""
+
+import io
+import posixpath
+import tarfile
+import zipfile
+from typing import Dict, Optional
+
+ZIP_MAGIC = (b"PK\x03\x04", b"PK\x05\x06")
+SKIPPED_DIRS = ("test", "tests")
+READ_CHUNK = 1024 * 1024
+
+
+class ArchiveError(ValueError):
+    """The upload is not a readable zip or tar archive."""
+
+
+class ArchiveTooLarge(ArchiveError):
+    """The upload exceeds one of the archive caps."""
+
+
+class _CappedStream:
+    """Read-only stream raising ArchiveTooLarge after max_bytes (peeked prefix included)."""
+
+    def __init__(self, stream, max_bytes: int, prefix: bytes = b""):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.read_bytes = len(prefix)
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            data, self.prefix = self.prefix, b""
+            chunks = [data]
+            while True:
+                chunk = self._read_capped(READ_CHUNK)
+                if not chunk:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        return data + self._read_capped(size - len(data)) if len(data) < size else data
+
+    def _read_capped(self, size: int) -> bytes:
+        # Never ask the stream for more than one byte past the cap (chunked
+        # uploads have no Content-Length to check up front)
+        data = self.stream.read(min(size, self.max_bytes - self.read_bytes + 1))
+        self.read_bytes += len(data)
+        if self.read_bytes > self.max_bytes:
+            raise ArchiveTooLarge(f"Archive larger than {self.max_bytes} bytes")
+        return data
+
+
+def member_path(name: str) -> Optional[str]:
+    """Normalized relative path of a Java member to analyze, None to skip it."""
+    path = posixpath.normpath(name.replace("\\", "/"))
+    if name.startswith(("/", "\\")) or path == ".." or path.startswith("../") or not path.endswith(".java"):
+        return None
+    if any(part.startswith(".") or part in SKIPPED_DIRS for part in path.split("/")[:-1]):
+        return None
+    return path
+
+
+class _Budget:
+    """Running member count and uncompressed bytes against the caps."""
+
+    def __init__(self, max_members: int, max_unpacked_bytes: int):
+        self.max_members = max_members
+        self.max_unpacked_bytes = max_unpacked_bytes
+        self.members = 0
+        self.unpacked = 0
+
+    def member(self):
+        self.members += 1
+        if self.members > self.max_members:
+            raise ArchiveTooLarge(f"Archive has more than {self.max_members} members")
+
+    def remaining(self) -> int:
+        return self.max_unpacked_bytes - self.unpacked
+
+    def unpack(self, size: int):
+        self.unpacked += size
+        if self.unpacked > self.max_unpacked_bytes:
+            raise ArchiveTooLarge(f"Archive unpacks to more than {self.max_unpacked_bytes} bytes")
+
+
+def read_java_sources(stream, max_upload_bytes: int, max_members: int,
+                      max_unpacked_bytes: int) -> Dict[str, str]:
+    """
+    Java sources of a zip or tar archive read from stream.
+
+    Args:
+        stream: File-like object with the archive (e.g. the request body)
+        max_upload_bytes: Largest archive accepted
+        max_members: Most archive entries (of any kind) accepted
+        max_unpacked_bytes: Most uncompressed bytes read from the archive
+
+    Returns:
+        Relative path -> source code, in archive order
+
+    Raises:
+        ArchiveTooLarge: A cap was exceeded
+        ArchiveError: Not a zip or tar archive
+    """
+    head = stream.read(4)
+    capped = _CappedStream(stream, max_upload_bytes, head)
+    budget = _Budget(max_members, max_unpacked_bytes)
+    if head.startswith(ZIP_MAGIC):
+        return _read_zip(io.BytesIO(capped.read()), budget)
+    return _read_tar(capped, budget)
+
+
+def _read_zip(buffer: io.BytesIO, budget: _Budget) -> Dict[str, str]:
+    sources: Dict[str, str] = {}
+    try:
+        with zipfile.ZipFile(buffer) as archive:
+            for info in archive.infolist():
+                budget.member()
+                path = member_path(info.filename)
+                if info.is_dir() or path is None:
+                    continue
+                # Read at most the remaining budget (+1 to detect overruns), whatever the header claims
+                with archive.open(info) as member:
+                    data = member.read(budget.remaining() + 1)
+                budget.unpack(len(data))
+                sources[path] = data.decode("utf-8", errors="ignore")
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError, EOFError) as e:
+        raise ArchiveError(f"Unreadable zip archive: {e}")
+    return sources
+
+
+def _read_tar(capped: _CappedStream, budget: _Budget) -> Dict[str, str]:
+    sources: Dict[str, str] = {}
+    try:
+        # "r|*": sequential stream of a plain or compressed tar, no seeking
+        with tarfile.open(fileobj=capped, mode="r|*") as archive:
+            for info in archive:
+                budget.member()
+                budget.unpack(info.size)
+                path = member_path(info.name)
+                if not info.isfile() or path is None:
+                    continue
+                member = archive.extractfile(info)
+                if member is not None:
+                    sources[path] = member.read().decode("utf-8", errors="ignore")
+    except tarfile.TarError as e:
+        raise ArchiveError(f"Not a zip or tar archive: {e}")
+    except EOFError as e:
+        raise ArchiveError(f"Truncated tar archive: {e}")
+    return sources
@@ -0,0 +1,239 @@
+"""
+🧱 CITY CODEC
+==============
+Compact columnar binary encoding of a city layout (Accept:
+application/x-educode-city), for repositories with thousands of classes
+where the JSON - field names repeated per building, smells as lists of
+dicts, full recommendation strings - gets large and slow to parse.
+
+Layout (little-endian):
+
+    magic        8 bytes   b"EDUCITY1"
+    header_len   uint32
+    header       header_len bytes of UTF-8 JSON:
+                 {"version", "buildings": N, "strings": [...],
+                  "summary": {every non-list city field},
+                  "relationships": [kinds],
+                  "columns": {name: {"dtype", "offset", "count"}}}
+    padding      to a multiple of 8
+    data         column arrays, each starting at an 8-byte aligned offset
+                 (relative to the start of data)
+
+Columns:
+
+    class_name, file_path, primary_smell       uint32  index into strings
+    color                                      uint32
+    quality_score, smell_confidence, lcom      float32
+    loc, wmc, cbo, dit, rfc                    int32
+    smells.indptr                              uint32  N+1 offsets (CSR)
+    smells.name                                uint32  index into strings
+    smells.confidence                          float32
+    smells.is_primary                          uint8
+    smells.description                         int32   index into strings, -1 = none
+    recommendations.indptr                     uint32  N+1 offsets (CSR)
+    recommendations.text                       uint32  index into strings
+    <kind>.from, <kind>.to                     int32   building index; a class
+                                                       without a building is
+                                                       stored as -(string index + 1)
+    <kind>.type                                int32   index into strings, -1 = none
+    layout.district                            uint32  index into layout["districts"]
+    layout.x, layout.z, layout.width,
+    layout.depth                               float32 building positions
+
+The rest of the city's "layout" (city size, districts) is in the summary.
+
+Every string (class names, paths, smell names, descriptions,
+recommendations, relationship types) is stored once in "strings".
+"""
+
+import json
+import struct
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+MIME_TYPE = "application/x-educode-city"
+MAGIC = b"EDUCITY1"
+VERSION = 1
+
+LAYOUT_COLUMNS = {"district": "<u4", "x": "<f4", "z": "<f4", "width": "<f4", "depth": "<f4"}
+
+RELATIONSHIP_KINDS = ("inheritance", "associations", "compositions", "dependencies", "aggregations")
+
+STRING_COLUMNS = ("class_name", "file_path", "primary_smell")
+NUMERIC_COLUMNS = {
+    "color": "<u4",
+    "quality_score": "<f4",
+    "smell_confidence": "<f4",
+    "loc": "<i4",
+    "wmc": "<i4",
+    "cbo": "<i4",
+    "dit": "<i4",
+    "rfc": "<i4",
+    "lcom": "<f4",
+}
+
+
+class StringTable:
+    """Dictionary encoding: each distinct string gets one index."""
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        idx = self._index.get(value)
+        if idx is None:
+            idx = self._index[value] = len(self.strings)
+            self.strings.append(value)
+        return idx
+
+
+def encode(city: Dict[str, Any]) -> bytes:
+    """
+    Encode a city layout dict (as returned by the /analyze endpoints).
+
+    Returns:
+        The binary payload described in the module docstring
+    """
+    buildings = city.get("buildings", [])
+    strings = StringTable()
+    columns: Dict[str, np.ndarray] = {}
+
+    for name in STRING_COLUMNS:
+        columns[name] = np.array([strings.code(b[name]) for b in buildings], dtype="<u4")
+    for name, dtype in NUMERIC_COLUMNS.items():
+        columns[name] = np.array([b[name] for b in buildings], dtype=np.float64).astype(dtype)
+
+    # Smells and recommendations: CSR (one offsets array plus flat value arrays)
+    smells = [s for b in buildings for s in b["all_smells"]]
+    columns["smells.indptr"] = np.cumsum([0] + [len(b["all_smells"]) for b in buildings], dtype="<u4")
+    columns["smells.name"] = np.array([strings.code(s["name"]) for s in smells], dtype="<u4")
+    columns["smells.confidence"] = np.array([s["confidence"] for s in smells], dtype="<f4")
+    columns["smells.is_primary"] = np.array([bool(s.get("is_primary")) for s in smells], dtype="u1")
+    columns["smells.description"] = np.array(
+        [strings.code(s["description"]) if "description" in s else -1 for s in smells], dtype="<i4")
+    columns["recommendations.indptr"] = np.cumsum([0] + [len(b["recommendations"]) for b in buildings],
+                                                  dtype="<u4")
+    columns["recommendations.text"] = np.array(
+        [strings.code(r) for b in buildings for r in b["recommendations"]], dtype="<u4")
+
+    # Relationship edges as building indices (first building of a class name)
+    building_of: Dict[str, int] = {}
+    for i, b in enumerate(buildings):
+        building_of.setdefault(b["class_name"], i)
+
+    def endpoint(class_name: str) -> int:
+        idx = building_of.get(class_name)
+        return idx if idx is not None else -(strings.code(class_name) + 1)
+
+    kinds = [kind for kind in RELATIONSHIP_KINDS if kind in city]
+    for kind in kinds:
+        edges = city[kind]
+        columns[f"{kind}.from"] = np.array([endpoint(e["from"]) for e in edges], dtype="<i4")
+        columns[f"{kind}.to"] = np.array([endpoint(e["to"]) for e in edges], dtype="<i4")
+        columns[f"{kind}.type"] = np.array([strings.code(e["type"]) if "type" in e else -1 for e in edges],
+                                           dtype="<i4")
+
+    summary = {k: v for k, v in city.items() if k != "buildings" and k not in RELATIONSHIP_KINDS}
+    if "layout" in city:
+        for name, dtype in LAYOUT_COLUMNS.items():
+            columns[f"layout.{name}"] = np.array(city["layout"]["buildings"][name], dtype=dtype)
+        summary["layout"] = {k: v for k, v in city["layout"].items() if k != "buildings"}
+
+    layout, offset, blobs = {}, 0, []
+    for name, array in columns.items():
+        data = array.tobytes()
+        layout[name] = {"dtype": array.dtype.str, "offset": offset, "count": int(array.size)}
+        pad = -len(data) % 8
+        blobs.append(data + b"\0" * pad)
+        offset += len(data) + pad
+
+    header = json.dumps({
+        "version": VERSION,
+        "buildings": len(buildings),
+        "strings": strings.strings,
+        "summary": summary,
+        "relationships": kinds,
+        "columns": layout,
+    }, separators=(",", ":")).encode("utf-8")
+    header_pad = -(len(MAGIC) + 4 + len(header)) % 8
+    return b"".join([MAGIC, struct.pack("<I", len(header)), header, b" " * header_pad] + blobs)
+
+
+def decode_columns(payload: bytes) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """
+    Parse the header and map every column without copying.
+
+    Returns:
+        (header dict, column name -> numpy array view into payload)
+    """
+    if payload[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not an EduCode city payload")
+    (header_len,) = struct.unpack_from("<I", payload, len(MAGIC))
+    start = len(MAGIC) + 4
+    header = json.loads(payload[start:start + header_len].decode("utf-8"))
+    if header.get("version") != VERSION:
+        raise ValueError(f"Unsupported city payload version: {header.get('version')}")
+    data_start = start + header_len + (-(start + header_len) % 8)
+    buffer = memoryview(payload)[data_start:]
+    columns = {
+        name: np.frombuffer(buffer, dtype=col["dtype"], count=col["count"], offset=col["offset"])
+        for name, col in header["columns"].items()
+    }
+    return header, columns
+
+
+def decode(payload: bytes) -> Dict[str, Any]:
+    """Rebuild the city layout dict from a payload (floats come back as float32 values)."""
+    header, cols = decode_columns(payload)
+    strings = header["strings"]
+    n = header["buildings"]
+
+    def floats(name: str) -> List[float]:
+        # float32 -> shortest decimal that round-trips, so 0.968 stays 0.968
+        return [float(np.format_float_positional(v)) for v in cols[name]]
+
+    smell_names = [strings[i] for i in cols["smells.name"].tolist()]
+    smell_conf = floats("smells.confidence")
+    smell_primary = cols["smells.is_primary"].tolist()
+    smell_desc = cols["smells.description"].tolist()
+    smell_ptr = cols["smells.indptr"].tolist()
+    rec_text = [strings[i] for i in cols["recommendations.text"].tolist()]
+    rec_ptr = cols["recommendations.indptr"].tolist()
+    values = {name: [strings[i] for i in cols[name].tolist()] for name in STRING_COLUMNS}
+    for name, dtype in NUMERIC_COLUMNS.items():
+        values[name] = floats(name) if dtype == "<f4" else cols[name].tolist()
+
+    buildings = []
+    for i in range(n):
+        smells = []
+        for j in range(smell_ptr[i], smell_ptr[i + 1]):
+            smell = {"name": smell_names[j], "confidence": smell_conf[j], "is_primary": bool(smell_primary[j])}
+            if smell_desc[j] >= 0:
+                smell["description"] = strings[smell_desc[j]]
+            smells.append(smell)
+        building = {name: values[name][i] for name in STRING_COLUMNS + tuple(NUMERIC_COLUMNS)}
+        building["all_smells"] = smells
+        building["recommendations"] = rec_text[rec_ptr[i]:rec_ptr[i + 1]]
+        buildings.append(building)
+
+    def class_name(idx: int) -> str:
+        return values["class_name"][idx] if idx >= 0 else strings[-idx - 1]
+
+    def edge(f: int, t: int, ty: int) -> Dict[str, str]:
+        rel = {"from": class_name(f), "to": class_name(t)}
+        if ty >= 0:
+            rel["type"] = strings[ty]
+        return rel
+
+    city: Dict[str, Any] = {"buildings": buildings}
+    for kind in header["relationships"]:
+        city[kind] = [edge(f, t, ty) for f, t, ty in zip(cols[f"{kind}.from"].tolist(), cols[f"{kind}.to"].tolist(),
+                                                          cols[f"{kind}.type"].tolist())]
+    city.update(header["summary"])
+    if "layout" in city:
+        city["layout"] = {**city["layout"], "buildings": {
+            name: cols[f"layout.{name}"].tolist() if dtype == "<u4" else floats(f"layout.{name}")
+            for name, dtype in LAYOUT_COLUMNS.items()}}
+    return city
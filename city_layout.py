@@ -0,0 +1,226 @@
+"""
+🏙️ CITY LAYOUT
+===============
+Server-side squarified treemap for the city, so Unity clients get
+building positions instead of each computing the layout themselves.
+
+Packages (the directory of each file) become districts, laid out as a
+squarified treemap of the whole city; the buildings of a district are a
+squarified treemap inside it. A building's footprint area grows with its
+LOC and its method complexity (WMC - BuildingMetrics has no separate
+method count). Every row of the treemap is chosen and placed with numpy
+over all candidate rows at once.
+
+Layouts are cached per repository and city version. When a repository is
+reanalysed and its districts stayed roughly the same size, the previous
+district plots are kept (the city does not jump around) and only
+districts whose buildings changed are laid out again.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from districts import district_of
+
+# Footprint area = LOC + METHOD_AREA * WMC
+METHOD_AREA = 10.0
+# Share of each treemap cell given to streets (district margins, building spacing)
+DISTRICT_MARGIN = 0.04
+BUILDING_MARGIN = 0.12
+# District plots are kept while every district's area changed less than this
+REUSE_TOLERANCE = 0.25
+
+Rect = Tuple[float, float, float, float]      # x, z, width, depth
+
+
+def footprint_areas(loc: np.ndarray, wmc: np.ndarray) -> np.ndarray:
+    return np.maximum(np.asarray(loc, dtype=np.float64), 1.0) + METHOD_AREA * np.maximum(
+        np.asarray(wmc, dtype=np.float64), 0.0)
+
+
+def squarify(areas: np.ndarray, rect: Rect) -> np.ndarray:
+    """
+    Squarified treemap (Bruls et al.) of areas inside rect.
+
+    Args:
+        areas: Positive weights (scaled to fill rect)
+        rect: (x, z, width, depth) to fill
+
+    Returns:
+        (len(areas), 4) array of (x, z, width, depth), in input order
+    """
+    n = len(areas)
+    out = np.zeros((n, 4))
+    if n == 0:
+        return out
+    x, z, w, d = rect
+    order = np.argsort(-areas, kind="stable")
+    a = areas[order] * (w * d / areas.sum())
+
+    i = 0
+    while i < n:
+        side = min(w, d)
+        if side <= 0:
+            out[order[i:]] = (x, z, 0.0, 0.0)
+            break
+        # Worst aspect ratio of every candidate row a[i:i+k]; rows grow while it improves
+        s = np.cumsum(a[i:])
+        worst = np.maximum(side * side * a[i] / (s * s), (s * s) / (side * side * a[i:]))
+        rising = np.flatnonzero(np.diff(worst) > 0)
+        k = int(rising[0]) + 1 if len(rising) else len(s)
+        row, total = a[i:i + k], s[k - 1]
+        thickness = total / side
+        lengths = row / thickness
+        offsets = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+        if w >= d:                          # Column along the left edge
+            cells = np.column_stack([np.full(k, x), z + offsets, np.full(k, thickness), lengths])
+            x, w = x + thickness, w - thickness
+        else:                               # Row along the bottom edge
+            cells = np.column_stack([x + offsets, np.full(k, z), lengths, np.full(k, thickness)])
+            z, d = z + thickness, d - thickness
+        out[order[i:i + k]] = cells
+        i += k
+    return out
+
+
+def inset(cells: np.ndarray, margin: float) -> np.ndarray:
+    """Shrink cells around their centers, leaving margin (share of each side) as street."""
+    shrunk = cells.copy()
+    shrunk[:, 0] += cells[:, 2] * margin / 2
+    shrunk[:, 1] += cells[:, 3] * margin / 2
+    shrunk[:, 2] *= 1 - margin
+    shrunk[:, 3] *= 1 - margin
+    return shrunk
+
+
+@dataclass
+class _District:
+    rect: Rect
+    total: float
+    paths: Tuple[str, ...]
+    areas: Tuple[float, ...]
+    cells: np.ndarray                         # Building rects, aligned with paths
+
+
+@dataclass
+class _CachedLayout:
+    version: Optional[str]
+    side: float
+    districts: "OrderedDict[str, _District]"
+    result: Dict
+
+
+class CityLayoutCache:
+    """
+    Layouts per repository, reused for the same city version and updated
+    district by district for new versions.
+
+    Args:
+        max_repos: Repositories whose last layout is kept
+    """
+
+    def __init__(self, max_repos: int = 32):
+        self.max_repos = max_repos
+        self._layouts: "OrderedDict[str, _CachedLayout]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0             # Same-version requests / layouts computed
+
+    def layout(self, project_key: str, version: Optional[str], paths: List[str],
+               loc: List[float], wmc: List[float]) -> Dict:
+        """
+        Layout of a city's buildings.
+
+        Args:
+            project_key: Repository the city belongs to
+            version: City version (None: not cached, e.g. truncated cities)
+            paths, loc, wmc: Per building, in city order
+
+        Returns:
+            {"width", "depth",
+             "districts": [{"name", "x", "z", "width", "depth"}],
+             "buildings": {"district", "x", "z", "width", "depth"} (columns
+                           aligned with the city's buildings),
+             "recomputed_districts": districts laid out in this call}
+        """
+        with self._lock:
+            previous = self._layouts.get(project_key)
+        if previous is not None and version is not None and previous.version == version:
+            self.hits += 1
+            return previous.result
+
+        self.misses += 1
+        cached = self._build(paths, footprint_areas(loc, wmc), previous)
+        cached.version = version
+        if version is not None:
+            with self._lock:
+                self._layouts[project_key] = cached
+                self._layouts.move_to_end(project_key)
+                while len(self._layouts) > self.max_repos:
+                    self._layouts.popitem(last=False)
+        return cached.result
+
+    def cached(self, project_key: str, version: str) -> Optional[Dict]:
+        """The layout of a city version if it is the repository's cached one."""
+        with self._lock:
+            cached = self._layouts.get(project_key)
+        return cached.result if cached is not None and cached.version == version else None
+
+    def _build(self, paths: List[str], areas: np.ndarray, previous: Optional[_CachedLayout]) -> _CachedLayout:
+        members: "OrderedDict[str, List[int]]" = OrderedDict()
+        for i, path in enumerate(paths):
+            members.setdefault(district_of(path), []).append(i)
+        totals = {name: float(areas[idx].sum()) for name, idx in members.items()}
+
+        # District plots: keep the previous ones while the districts are about the same size
+        if previous is not None and previous.districts.keys() == members.keys() and all(
+                abs(totals[name] - district.total) <= REUSE_TOLERANCE * district.total
+                for name, district in previous.districts.items()):
+            side = previous.side
+            plots = {name: district.rect for name, district in previous.districts.items()}
+        else:
+            previous = None
+            side = float(np.sqrt(sum(totals.values()) / (1 - DISTRICT_MARGIN) ** 2)) if paths else 0.0
+            names = list(members)
+            cells = inset(squarify(np.array([totals[n] for n in names]), (0.0, 0.0, side, side)),
+                          DISTRICT_MARGIN)
+            plots = {name: tuple(float(v) for v in cell) for name, cell in zip(names, cells)}
+
+        n = len(paths)
+        building_cells = np.zeros((n, 4))
+        district_idx = np.zeros(n, dtype=np.int64)
+        districts: "OrderedDict[str, _District]" = OrderedDict()
+        recomputed = 0
+        for d_idx, (name, idx) in enumerate(members.items()):
+            key_paths = tuple(paths[i] for i in idx)
+            key_areas = tuple(float(a) for a in areas[idx])
+            old = previous.districts.get(name) if previous is not None else None
+            if old is not None and old.paths == key_paths and old.areas == key_areas:
+                cells = old.cells
+            else:
+                cells = inset(squarify(areas[idx], plots[name]), BUILDING_MARGIN)
+                recomputed += 1
+            districts[name] = _District(plots[name], totals[name], key_paths, key_areas, cells)
+            building_cells[idx] = cells
+            district_idx[idx] = d_idx
+
+        rounded = np.round(building_cells, 3)
+        result = {
+            "width": round(side, 3),
+            "depth": round(side, 3),
+            "districts": [{"name": name, "x": round(r[0], 3), "z": round(r[1], 3),
+                           "width": round(r[2], 3), "depth": round(r[3], 3)}
+                          for name, r in ((name, d.rect) for name, d in districts.items())],
+            "buildings": {
+                "district": district_idx.tolist(),
+                "x": rounded[:, 0].tolist(),
+                "z": rounded[:, 1].tolist(),
+                "width": rounded[:, 2].tolist(),
+                "depth": rounded[:, 3].tolist(),
+            },
+            "recomputed_districts": recomputed,
+        }
+        return _CachedLayout(None, side, districts, result)
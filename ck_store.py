@@ -0,0 +1,717 @@
+"""
+🗄️ CK METRICS STORE
+====================
+Indexed SQLite store over the pre-computed ck_metrics/*_ck.csv files.
+
+The CSVs are parsed once into ck_metrics/ck_store.sqlite (numeric columns
+stored as REAL) and indexed by normalized path, file name, class name and
+package, with no CSV parsing at startup. A small `sources` manifest records
+each CSV's mtime and size; only CSVs that changed (or appeared / disappeared)
+are reindexed.
+
+Lookups are served from immutable in-memory CKSnapshots built from the
+store and replaced wholesale (one reference swap) after a refresh, so
+reader threads never lock. Lookups never refresh: a daemon thread
+re-checks the CSV directory every REFRESH_INTERVAL_S, and the background
+CK precompute refreshes right after writing a CSV. Every precomputed repository (repo-<slug>_ck.csv,
+see tools/ck_precompute.py) gets a snapshot of its own, reachable only
+through its store paths: writing or dropping one repository's CSV rebuilds
+that small snapshot, not the one over all other rows.
+
+Usage:
+    python ck_store.py            [index changed CSVs and print stats]
+    python ck_store.py --rebuild  [reindex every CSV, ignoring the manifest]
+"""
+
+import os
+import re
+import sys
+import csv
+import sqlite3
+import threading
+import time
+import numpy as np
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+SCRIPT_DIR = Path(__file__).parent.absolute()
+CK_DIR = SCRIPT_DIR / "ck_metrics"
+STORE_NAME = "ck_store.sqlite"
+
+# Bump when the table layout changes; older stores are rebuilt
+STORE_VERSION = 1
+
+CK_COLS = ['LOC', 'WMC', 'METHODS', 'FIELDS', 'PRIVATE_METHODS',
+           'CBO', 'DIT', 'LCOM', 'TCC', 'ATFD', 'MAX_METHOD_LOC', 'NOC']
+
+# How often (seconds) the refresher thread re-checks the CSV directory for changes
+REFRESH_INTERVAL_S = 60.0
+
+# File paths of precomputed repositories (tools/ck_precompute.py project_slug):
+# 'repo-<name>-<10 hex digits>/<relative path>', rows of '<slug>_ck.csv'
+STORE_PATH_PATTERN = re.compile(r'^repo-[\w.-]+-[0-9a-f]{10}/')
+STORE_SOURCE_PATTERN = re.compile(r'^repo-[\w.-]+-[0-9a-f]{10}_ck\.csv$')
+
+
+def normalize_path(file_path: str) -> str:
+    """Normalize a path for matching: forward slashes, lowercase."""
+    return file_path.replace('\\', '/').lower()
+
+
+def file_key(file_path: str) -> str:
+    """Lowercase file name of a (Windows or POSIX) path."""
+    return normalize_path(file_path).rsplit('/', 1)[-1]
+
+
+def path_components(file_path: str) -> List[str]:
+    """Normalized, non-empty path components (drive letters included)."""
+    return [part for part in normalize_path(file_path).split('/') if part and part != '.']
+
+
+def is_store_path(file_path: str) -> bool:
+    """
+    Whether file_path names a precomputed repository's row. Such paths are
+    only matched exactly: a suffix match would pick another project's file.
+    """
+    return STORE_PATH_PATTERN.match(file_path) is not None
+
+
+def is_store_source(name: str) -> bool:
+    """Whether a CSV name is a precomputed repository's (served from its own snapshot)."""
+    return STORE_SOURCE_PATTERN.match(name) is not None
+
+
+def store_source(file_path: str) -> str:
+    """CSV name holding the row of a store path (see is_store_path)."""
+    return file_path.split('/', 1)[0] + '_ck.csv'
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value or 0)
+    except ValueError:
+        return 0.0
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Path-Suffix Trie
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class Vocabulary:
+    """
+    Interned keys (path components, ClassName.java) as dense int32 ids.
+
+    Every distinct key is kept once, UTF-8 encoded in a single bytes blob.
+    Ids are found through an open-addressing table of int32 ids indexed by
+    the key's str hash (linear probing, at most 3/4 full): a lookup
+    probes a slot or two, then compares the stored bytes, so keys whose
+    hashes collide still get different ids - a query never matches another
+    key's rows. str hashes are only stable within one process, which is
+    all a snapshot needs.
+    """
+    __slots__ = ('offsets', 'blob', 'table', 'mask')
+
+    def __init__(self, keys: Iterable[str]):
+        ordered = sorted(set(keys))
+        encoded = [key.encode('utf-8', 'surrogatepass') for key in ordered]
+        self.offsets = array('i', [0])
+        for data in encoded:
+            self.offsets.append(self.offsets[-1] + len(data))
+        self.blob = b''.join(encoded)
+        size = 1
+        while size * 3 < 4 * len(ordered):
+            size *= 2
+        self.mask = size - 1
+        self.table = array('i', [-1]) * size
+        for key_id, key in enumerate(ordered):
+            slot = hash(key) & self.mask
+            while self.table[slot] >= 0:
+                slot = (slot + 1) & self.mask
+            self.table[slot] = key_id
+
+    @classmethod
+    def build(cls, keys: Iterable[str]) -> Tuple["Vocabulary", Dict[str, int]]:
+        """Vocabulary of keys plus a key -> id dict for numbering rows while building."""
+        vocab = cls(keys)
+        ids = {vocab.key(i): i for i in range(len(vocab))}
+        return vocab, ids
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def key(self, key_id: int) -> str:
+        return self.blob[self.offsets[key_id]:self.offsets[key_id + 1]].decode('utf-8', 'surrogatepass')
+
+    def id(self, key: str) -> int:
+        """Id of key, -1 if it is not in the vocabulary."""
+        table, offsets, blob, mask = self.table, self.offsets, self.blob, self.mask
+        encoded = key.encode('utf-8', 'surrogatepass')
+        slot = hash(key) & mask
+        while True:
+            key_id = table[slot]
+            if key_id < 0:
+                return -1
+            if blob[offsets[key_id]:offsets[key_id + 1]] == encoded:
+                return key_id
+            slot = (slot + 1) & mask
+
+    def nbytes(self) -> int:
+        return len(self.blob) + sum(a.itemsize * len(a) for a in (self.offsets, self.table))
+
+
+def _sorted_index(codes: List[Tuple[int, int]]) -> Tuple[array, array]:
+    """(row order, ids in that order) from (id, row) pairs, for bisect range lookups."""
+    codes.sort()
+    return array('i', [row for _, row in codes]), array('i', [code for code, _ in codes])
+
+
+def _rows_with_code(order: array, sorted_codes: array, code: int) -> List[int]:
+    if code < 0:
+        return []
+    lo = bisect_left(sorted_codes, code)
+    hi = bisect_right(sorted_codes, code, lo)
+    return order[lo:hi].tolist()
+
+
+class PathSuffixTrie:
+    """
+    Suffix trie over reversed path components, stored as flat arrays.
+
+    Path components are interned to Vocabulary ids. Rows are sorted by
+    their reversed component ids, so the rows below any trie node form one
+    contiguous range of that order. Nodes are numbered breadth first: the
+    children of a node are consecutive nodes whose edge labels are sorted,
+    and each matching step is one bisect over that node's children - the
+    cost depends on the query's depth, not on how many rows share a file
+    name.
+
+    A node is only expanded while at least two rows share its suffix; a
+    single row continues along the forward directory tree (one node per
+    distinct directory, with parent pointers), so long unique paths cost
+    no trie nodes. Works the same for 'D:\\Projects\\x\\Foo.java',
+    '/home/u/x/Foo.java' and 'x/Foo.java'.
+    """
+    __slots__ = ('vocab', 'rows', 'label', 'row_lo', 'row_hi', 'tail', 'child_lo', 'dir_name', 'dir_parent')
+
+    def __init__(self, paths: List[List[str]], vocab: Vocabulary, ids: Dict[str, int]):
+        """
+        Args:
+            paths: Path components per row (empty for rows without a path)
+            vocab: Vocabulary holding every component
+            ids: Component -> vocabulary id (only used while building)
+        """
+        self.vocab = vocab
+        dirs: Dict[Tuple[int, int], int] = {}
+        self.dir_name = array('i')
+        self.dir_parent = array('i')
+        dir_of: List[int] = []
+        for parts in paths:
+            node = -1
+            for part in parts[:-1]:
+                key = (node, ids[part])
+                child = dirs.get(key)
+                if child is None:
+                    child = dirs[key] = len(self.dir_name)
+                    self.dir_name.append(key[1])
+                    self.dir_parent.append(node)
+                node = child
+            dir_of.append(node)
+
+        keyed = sorted((tuple(ids[part] for part in reversed(parts)), row)
+                       for row, parts in enumerate(paths) if parts)
+        keys = [key for key, _ in keyed]
+        self.rows = array('i', [row for _, row in keyed])
+
+        # Node 0 is the root (no component matched yet)
+        self.label = array('i', [-1])               # Component id on the edge into the node
+        self.row_lo = array('i', [0])               # Rows below the node: rows[row_lo:row_hi]
+        self.row_hi = array('i', [len(keys)])
+        # Rows sharing the suffix: rows[row_lo:tail] are the paths that end here.
+        # Single-row nodes: directory of the row's next component (-1: none)
+        self.tail = array('i', [0])
+        self.child_lo = array('i')                  # Children: child_lo[n]:child_lo[n + 1]
+        depths = [0]
+        node = 0
+        while node < len(self.label):
+            lo, hi, depth = self.row_lo[node], self.row_hi[node], depths[node]
+            self.child_lo.append(len(self.label))
+            if not self._single(node):
+                pos = lo
+                while pos < hi and len(keys[pos]) == depth:
+                    pos += 1
+                self.tail[node] = pos
+                while pos < hi:
+                    code, end = keys[pos][depth], pos + 1
+                    while end < hi and keys[end][depth] == code:
+                        end += 1
+                    self.label.append(code)
+                    self.row_lo.append(pos)
+                    self.row_hi.append(end)
+                    self.tail.append(self._dir_at(dir_of[keyed[pos][1]], depth + 1, len(keys[pos]))
+                                     if end - pos == 1 else end)
+                    depths.append(depth + 1)
+                    pos = end
+            node += 1
+        self.child_lo.append(len(self.label))
+
+    def _single(self, node: int) -> bool:
+        return node > 0 and self.row_hi[node] - self.row_lo[node] == 1
+
+    def _dir_at(self, parent_dir: int, depth: int, path_depth: int) -> int:
+        """Directory holding the component `depth` steps up a path (-1 past its first component)."""
+        if depth >= path_depth:
+            return -1
+        directory = parent_dir
+        for _ in range(depth - 1):
+            directory = self.dir_parent[directory]
+        return directory
+
+    def _walk(self, file_path: str) -> Tuple[int, int, int, int]:
+        """(matched depth, trie node reached, directory still to match, query depth)."""
+        parts = path_components(file_path)
+        vocab_id, label, child_lo = self.vocab.id, self.label, self.child_lo
+        node = depth = 0
+        for part in reversed(parts):
+            lo, hi = child_lo[node], child_lo[node + 1]
+            if lo == hi:
+                break
+            code = vocab_id(part)
+            child = bisect_left(label, code, lo, hi)
+            if child == hi or label[child] != code:
+                break
+            node, depth = child, depth + 1
+        # A single row left: follow its own directories
+        directory, dir_name, dir_parent = self.tail[node] if self._single(node) else -1, self.dir_name, self.dir_parent
+        for part in reversed(parts[:len(parts) - depth]):
+            if directory < 0 or dir_name[directory] != vocab_id(part):
+                break
+            directory, depth = dir_parent[directory], depth + 1
+        return depth, node, directory, len(parts)
+
+    def match(self, file_path: str) -> Tuple[int, List[int]]:
+        """
+        Longest-suffix match.
+
+        Returns:
+            (number of matched trailing components, candidate row indices);
+            (0, []) when not even the file name is known
+        """
+        depth, node, _, _ = self._walk(file_path)
+        if depth == 0:
+            return 0, []
+        return depth, self.rows[self.row_lo[node]:self.row_hi[node]].tolist()
+
+    def exact(self, file_path: str) -> List[int]:
+        """Rows whose normalized path equals file_path."""
+        depth, node, directory, query_depth = self._walk(file_path)
+        if depth == 0 or depth != query_depth or directory >= 0:
+            return []
+        if self._single(node):
+            return [self.rows[self.row_lo[node]]]
+        return self.rows[self.row_lo[node]:self.tail[node]].tolist()
+
+    def nbytes(self) -> int:
+        return sum(a.itemsize * len(a) for a in (self.rows, self.label, self.row_lo, self.row_hi,
+                                                 self.tail, self.child_lo, self.dir_name, self.dir_parent))
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Snapshot (immutable, read without locks)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class CKSnapshot:
+    """
+    Immutable in-memory view of every indexed CK row.
+
+    Rows are numbered 0..N-1 in store order (later rows are more recent).
+    Metric values live in one (N, 12) float32 array; path components and
+    class names are interned once in a Vocabulary (int32 ids) and packages
+    to int32 codes, so a row costs a few dozen bytes instead of a dict of
+    strings.
+
+    Built in one pass over the store and never mutated afterwards, so any
+    number of threads can read it without locking; a refresh builds a new
+    snapshot and swaps the store's reference to it in a single assignment.
+    """
+    __slots__ = ('values', 'flat', 'vocab', 'trie', 'package_code', 'package_index', 'class_order', 'class_sorted')
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows: (file_path, package, class_key, *CK_COLS values) in store order
+        """
+        paths: List[List[str]] = []
+        values = array('f')
+        class_keys: List[Tuple[str, int]] = []
+        self.package_code = array('i')
+        self.package_index: Dict[str, int] = {}
+        for row, (file_path, package, class_key, *metrics) in enumerate(rows):
+            paths.append(path_components(file_path) if file_path else [])
+            values.extend(metrics)
+            if class_key:
+                class_keys.append((class_key, row))
+            package = package or ''
+            code = self.package_index.get(package)
+            if code is None:
+                code = self.package_index[sys.intern(package)] = len(self.package_index)
+            self.package_code.append(code)
+
+        self.flat = values                     # Same buffer, for cheap per-row reads
+        self.values = np.frombuffer(values, dtype=np.float32).reshape(-1, len(CK_COLS))
+        self.vocab, ids = Vocabulary.build(
+            [part for parts in paths for part in parts] + [key for key, _ in class_keys])
+        self.trie = PathSuffixTrie(paths, self.vocab, ids)
+        self.class_order, self.class_sorted = _sorted_index([(ids[key], row) for key, row in class_keys])
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def metrics(self, row: Optional[int]) -> Optional[Dict[str, float]]:
+        if row is None:
+            return None
+        start = row * len(CK_COLS)
+        return dict(zip(CK_COLS, self.flat[start:start + len(CK_COLS)]))
+
+    def _pick(self, candidates: List[int], package: Optional[str]) -> Optional[int]:
+        """Prefer rows in the given package; among equals the most recently indexed wins."""
+        if not candidates:
+            return None
+        code = self.package_index.get(package) if package else None
+        if code is not None:
+            in_package = [row for row in candidates if self.package_code[row] == code]
+            if in_package:
+                return max(in_package)
+        return max(candidates)
+
+    def _class_rows(self, class_key: str) -> List[int]:
+        return _rows_with_code(self.class_order, self.class_sorted, self.vocab.id(class_key))
+
+    def resolve_file(self, file_path: str, package: Optional[str] = None) -> Optional[int]:
+        """
+        Row for a file: longest matching path suffix, then package.
+
+        Falls back to rows whose class name matches the file name
+        (ClassName.java) when no indexed path ends with that file name.
+        """
+        depth, candidates = self.trie.match(file_path)
+        if candidates:
+            return self._pick(candidates, package)
+        return self._pick(self._class_rows(file_key(file_path)), package)
+
+    def resolve_path(self, file_path: str) -> Optional[int]:
+        rows = self.trie.exact(file_path)
+        return max(rows) if rows else None
+
+    def resolve_class(self, class_name: str, package: Optional[str] = None) -> Optional[int]:
+        candidates = self._class_rows(class_name.lower() + '.java')
+        if package is not None:
+            code = self.package_index.get(package)
+            candidates = [row for row in candidates if self.package_code[row] == code]
+        return max(candidates) if candidates else None
+
+    def nbytes(self) -> int:
+        """Bytes held by the snapshot's arrays and vocabulary (excluding the small package table)."""
+        return (self.values.nbytes + self.vocab.nbytes() + self.trie.nbytes()
+                + self.package_code.itemsize * len(self.package_code)
+                + sum(a.itemsize * len(a) for a in (self.class_order, self.class_sorted)))
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Store
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class CKMetricsStore:
+    """
+    SQLite-backed index of CK metric rows, served from an in-memory snapshot.
+
+    SQLite holds the parsed rows and the per-CSV manifest across restarts;
+    lookups only touch the current CKSnapshots: one over every CSV that is
+    not a precomputed repository, and one per precomputed repository.
+    Every thread gets its own
+    connection (sqlite3 connections are not shareable across threads);
+    indexing runs under a lock in one transaction.
+    """
+
+    def __init__(self, ck_dir: Path = CK_DIR, db_path: Optional[Path] = None):
+        self.ck_dir = Path(ck_dir)
+        self.db_path = Path(db_path) if db_path else self.ck_dir / STORE_NAME
+        self._local = threading.local()
+        self._index_lock = threading.Lock()
+        self._snapshot: Optional[CKSnapshot] = None
+        self._repos: Dict[str, CKSnapshot] = {}        # Precomputed repository CSV -> its rows
+        self._create_schema()
+
+    # ── Connections / schema ──
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.create_function("is_store_source", 1, is_store_source, deterministic=True)
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        conn = self._conn()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != STORE_VERSION:
+            conn.executescript("DROP TABLE IF EXISTS metrics; DROP TABLE IF EXISTS sources;")
+        metric_cols = ", ".join(f"{col} REAL" for col in CK_COLS)
+        conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS sources (
+                name TEXT PRIMARY KEY,
+                mtime_ns INTEGER,
+                size INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS metrics (
+                id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL,
+                file_path TEXT,
+                class_name TEXT,
+                package TEXT,
+                path_key TEXT,
+                file_key TEXT,
+                class_key TEXT,
+                {metric_cols}
+            );
+            CREATE INDEX IF NOT EXISTS idx_metrics_path ON metrics(path_key);
+            CREATE INDEX IF NOT EXISTS idx_metrics_file ON metrics(file_key);
+            CREATE INDEX IF NOT EXISTS idx_metrics_class ON metrics(class_key, package);
+            CREATE INDEX IF NOT EXISTS idx_metrics_source ON metrics(source);
+        """)
+        conn.execute(f"PRAGMA user_version = {STORE_VERSION}")
+        conn.commit()
+
+    # ── Indexing ──
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        Reindex CSVs that were added, changed or removed since the last run,
+        then publish a new snapshot if anything changed.
+
+        Args:
+            force: Reindex every CSV regardless of the manifest
+
+        Returns:
+            Number of CSV files (re)indexed or dropped
+        """
+        with self._index_lock:
+            return self._refresh_locked(force)
+
+    def _refresh_locked(self, force: bool = False) -> int:
+        conn = self._conn()
+        on_disk = {}
+        if self.ck_dir.exists():
+            for csv_file in sorted(self.ck_dir.glob("*_ck.csv")):
+                st = csv_file.stat()
+                on_disk[csv_file.name] = (st.st_mtime_ns, st.st_size)
+        indexed = {name: (mtime, size) for name, mtime, size in
+                   conn.execute("SELECT name, mtime_ns, size FROM sources")}
+
+        stale = [name for name in indexed if name not in on_disk]
+        changed = [name for name, sig in on_disk.items() if force or indexed.get(name) != sig]
+        if stale or changed:
+            with conn:
+                for name in stale + changed:
+                    conn.execute("DELETE FROM metrics WHERE source = ?", (name,))
+                    conn.execute("DELETE FROM sources WHERE name = ?", (name,))
+                for name in changed:
+                    try:
+                        self._index_csv(conn, self.ck_dir / name)
+                    except Exception as e:
+                        print(f"⚠️ Error loading {name}: {e}")
+                        continue
+                    conn.execute("INSERT INTO sources VALUES (?, ?, ?)", (name, *on_disk[name]))
+
+        columns = f"file_path, package, class_key, {', '.join(CK_COLS)}"
+        if self._snapshot is None:
+            rebuild_shared = True
+            repos: Dict[str, CKSnapshot] = {}
+            repo_sources = [name for name in on_disk if is_store_source(name)]
+        else:
+            rebuild_shared = any(not is_store_source(name) for name in stale + changed)
+            repos = dict(self._repos)
+            repo_sources = [name for name in stale + changed if is_store_source(name)]
+        # Only the repositories that changed get new snapshots
+        for name in repo_sources:
+            repos.pop(name, None)
+            rows = conn.execute(f"SELECT {columns} FROM metrics WHERE source = ? ORDER BY id", (name,))
+            snapshot = CKSnapshot(rows)
+            if len(snapshot):
+                repos[name] = snapshot
+        if rebuild_shared:
+            # Atomic swaps: readers see the old or the new snapshot
+            self._snapshot = CKSnapshot(conn.execute(
+                f"SELECT {columns} FROM metrics WHERE NOT is_store_source(source) ORDER BY id"))
+        self._repos = repos
+        return len(stale) + len(changed)
+
+    def _index_csv(self, conn: sqlite3.Connection, csv_file: Path):
+        placeholders = ", ".join("?" * (7 + len(CK_COLS)))
+        columns = "source, file_path, class_name, package, path_key, file_key, class_key, " + ", ".join(CK_COLS)
+        with open(csv_file, 'r', encoding='utf-8', errors='ignore') as f:
+            rows = []
+            for row in csv.DictReader(f):
+                file_path = row.get('file_path', '') or ''
+                class_name = row.get('class_name', '') or ''
+                rows.append((
+                    csv_file.name, file_path, class_name, row.get('package', '') or '',
+                    normalize_path(file_path) if file_path else None,
+                    file_key(file_path) if file_path else None,
+                    class_name.lower() + '.java' if class_name else None,
+                    *(_to_float(row.get(col)) for col in CK_COLS),
+                ))
+        conn.executemany(f"INSERT INTO metrics ({columns}) VALUES ({placeholders})", rows)
+
+    def start_refresher(self, interval_s: float = REFRESH_INTERVAL_S):
+        """Refresh every interval_s seconds on a daemon thread, off the request path."""
+        def run():
+            while True:
+                time.sleep(interval_s)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"⚠️ CK metrics refresh failed: {e}")
+
+        threading.Thread(target=run, name="ck-store-refresh", daemon=True).start()
+
+    def _after_fork(self):
+        """In a forked child: no inherited connections or locks (their threads are gone)."""
+        self._local = threading.local()
+        self._index_lock = threading.Lock()
+
+    def snapshot(self) -> CKSnapshot:
+        """
+        Current snapshot of the rows outside precomputed repositories.
+
+        Only reads the published snapshot; it is built here just once, by
+        the first caller (concurrent first callers wait for it and share it).
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.refresh()
+            snapshot = self._snapshot
+        return snapshot
+
+    # ── Lookups ──
+
+    def lookup_file(self, file_path: str, package: Optional[str] = None) -> Optional[Dict[str, float]]:
+        """
+        Metrics for a file.
+
+        Args:
+            file_path: Absolute, relative or Windows-style path to the .java file
+            package: The class's package, used to break ties between same-suffix paths
+        """
+        snapshot = self.snapshot()
+        return snapshot.metrics(snapshot.resolve_file(file_path, package))
+
+    def lookup_path(self, file_path: str) -> Optional[Dict[str, float]]:
+        """Metrics for an exact (normalized) file path."""
+        snapshot = self.snapshot()
+        if is_store_path(file_path):
+            snapshot = self._repos.get(store_source(file_path))
+            if snapshot is None:
+                return None
+        return snapshot.metrics(snapshot.resolve_path(file_path))
+
+    def lookup_class(self, class_name: str, package: Optional[str] = None) -> Optional[Dict[str, float]]:
+        """Metrics for a class name, optionally restricted to a package."""
+        snapshot = self.snapshot()
+        return snapshot.metrics(snapshot.resolve_class(class_name, package))
+
+    def rows(self) -> int:
+        """Rows available for lookups (all snapshots)."""
+        return len(self.snapshot()) + sum(len(snapshot) for snapshot in self._repos.values())
+
+    def stats(self) -> Dict:
+        """Row and source counts."""
+        conn = self._conn()
+        return {
+            "db_path": str(self.db_path),
+            "sources": conn.execute("SELECT COUNT(*) FROM sources").fetchone()[0],
+            "rows": conn.execute("SELECT COUNT(*) FROM metrics").fetchone()[0],
+        }
+
+    def source_names(self) -> List[str]:
+        return [name for (name,) in self._conn().execute("SELECT name FROM sources ORDER BY name")]
+
+
+_STORE: Optional[CKMetricsStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_ck_store(ck_dir: Path = CK_DIR) -> Optional[CKMetricsStore]:
+    """
+    Shared store for ck_dir, or None when there are no CK metrics to index.
+    The shared store refreshes itself in the background (see start_refresher).
+    """
+    global _STORE
+    if _STORE is not None:
+        return _STORE
+    if not Path(ck_dir).exists():
+        return None
+    with _STORE_LOCK:
+        if _STORE is None:
+            try:
+                store = CKMetricsStore(ck_dir)
+                store.refresh()
+            except sqlite3.Error as e:
+                print(f"⚠️ CK metrics store unavailable: {e}")
+                return None
+            store.start_refresher()
+            _STORE = store
+    return _STORE
+
+
+def _restart_in_child():
+    # Forked workers (prefork_server) inherit the store but not its thread
+    global _STORE_LOCK
+    _STORE_LOCK = threading.Lock()
+    if _STORE is not None:
+        _STORE._after_fork()
+        _STORE.start_refresher()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_in_child)
+
+
+def warmup_ck_store(ck_dir: Path = CK_DIR) -> int:
+    """
+    Build the shared store and its snapshot ahead of the first request.
+
+    Returns:
+        Number of CK rows available for lookups
+    """
+    store = get_ck_store(ck_dir)
+    return store.rows() if store is not None else 0
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Main
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def main():
+    if not CK_DIR.exists():
+        print(f"❌ No CK metrics directory: {CK_DIR}")
+        sys.exit(1)
+
+    store = CKMetricsStore(CK_DIR)
+    start = time.perf_counter()
+    reindexed = store.refresh(force="--rebuild" in sys.argv)
+    elapsed = time.perf_counter() - start
+
+    stats = store.stats()
+    print(f"✓ Reindexed {reindexed} CSV file(s) in {elapsed:.2f}s")
+    print(f"  Store:   {stats['db_path']}")
+    print(f"  Sources: {stats['sources']}")
+    print(f"  Rows:    {stats['rows']}")
+
+
+if __name__ == "__main__":
+    main()
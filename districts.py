@@ -0,0 +1,120 @@
+"""
+🏘️ DISTRICTS
+=============
+Level-of-detail view of a large city: instead of every building, clients
+first get one summary per package directory (building count, LOC, quality,
+smell histogram) and then fetch the buildings of the districts on screen.
+
+Districts form a tree following the directory structure. Directories
+that hold no files and have exactly one subdirectory (src/main/java/org/...
+chains) are folded into their child, so every level of the tree is a real
+branching point.
+"""
+
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+
+@dataclass
+class DistrictSummary:
+    """Aggregate of all buildings in a district and its subdistricts"""
+    name: str                       # Directory path relative to the repository root
+    parent: Optional[str]           # Enclosing district (None at the top level)
+    level: int                      # 0 for top-level districts
+    buildings: int = 0              # Total, including subdistricts
+    direct_buildings: int = 0       # Files directly in this directory
+    loc: int = 0
+    clean_count: int = 0
+    smell_count: int = 0
+    average_quality: float = 0.0
+    smells: Dict[str, int] = field(default_factory=dict)    # Smell name -> buildings having it
+    children: List[str] = field(default_factory=list)
+
+
+def district_of(file_path: str) -> str:
+    """District (directory) of a building's file path."""
+    return os.path.dirname(file_path).replace("\\", "/") or "."
+
+
+def _ancestors(directory: str) -> List[str]:
+    if directory == ".":
+        return ["."]
+    parts = directory.split("/")
+    return ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+def summarize_districts(buildings: Iterable[Dict[str, Any]], max_level: Optional[int] = None) -> List[DistrictSummary]:
+    """
+    District tree of a city's buildings.
+
+    Args:
+        buildings: Building dicts (file_path, loc, quality_score, primary_smell, all_smells)
+        max_level: Only return districts up to this level (None: all)
+
+    Returns:
+        Districts in depth-first order (parents before their children)
+    """
+    totals: Dict[str, Dict[str, Any]] = {}
+    for building in buildings:
+        directory = district_of(building["file_path"])
+        smells = {s["name"] for s in building["all_smells"] if s["name"] != "Clean"}
+        for i, name in enumerate(_ancestors(directory)):
+            node = totals.setdefault(name, {"buildings": 0, "direct": 0, "loc": 0, "clean": 0,
+                                            "quality": 0.0, "smells": Counter(), "subdirs": set()})
+            node["buildings"] += 1
+            node["loc"] += building["loc"]
+            node["clean"] += building["primary_smell"] == "Clean"
+            node["quality"] += building["quality_score"]
+            node["smells"].update(smells)
+            if name == directory:
+                node["direct"] += 1
+            else:
+                node["subdirs"].add(_ancestors(directory)[i + 1])
+
+    def kept(name: str) -> bool:
+        node = totals[name]
+        return node["direct"] > 0 or len(node["subdirs"]) != 1
+
+    districts: List[DistrictSummary] = []
+
+    def visit(name: str, parent: Optional[str], level: int):
+        # Fold single-child directories without files into their child
+        while not kept(name):
+            (name,) = totals[name]["subdirs"]
+        if max_level is not None and level > max_level:
+            return
+        node = totals[name]
+        district = DistrictSummary(
+            name=name, parent=parent, level=level,
+            buildings=node["buildings"], direct_buildings=node["direct"], loc=node["loc"],
+            clean_count=node["clean"], smell_count=node["buildings"] - node["clean"],
+            average_quality=round(node["quality"] / node["buildings"], 3),
+            smells=dict(node["smells"].most_common()))
+        districts.append(district)
+        for child in sorted(node["subdirs"]):
+            start = len(districts)
+            visit(child, name, level + 1)
+            if len(districts) > start:
+                district.children.append(districts[start].name)
+
+    top_level = sorted(name for name in totals if "/" not in name)
+    for name in top_level:
+        visit(name, None, 0)
+    return districts
+
+
+def district_buildings(buildings: Iterable[Dict[str, Any]], district: str,
+                       recursive: bool = False) -> List[int]:
+    """
+    Indices of the buildings in a district.
+
+    Args:
+        district: District name (as in DistrictSummary.name)
+        recursive: Include the buildings of its subdistricts
+    """
+    prefix = district.rstrip("/") + "/"
+    return [i for i, building in enumerate(buildings)
+            if district_of(building["file_path"]) == district
+            or (recursive and district_of(building["file_path"]).startswith(prefix))]
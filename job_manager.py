@@ -0,0 +1,227 @@
+"""
+⏳ JOB MANAGER
+===============
+Background jobs for long-running analyses (whole repositories, GitHub
+clones), so HTTP requests return immediately with a job id instead of
+holding a worker until the city is built.
+
+Jobs run on a fixed-size worker pool behind a bounded queue. Job functions
+receive their Job and call job.report(done, total) as they go, and
+job.check_cancelled() between units of work so DELETE /jobs/<id> can stop
+them. A job function that has to wait for capacity of its own (a slot in
+the server's bulk lane) shows that as the "waiting" state.
+
+Jobs also keep an event log (job.publish) that GET /jobs/<id>/events
+streams to clients as server-sent events while the job runs. Event ids
+count every event ever published; the log itself only keeps the last
+MAX_JOB_EVENTS, and once the job has finished only its state events (the
+result holds everything the progress events said).
+"""
+
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Finished jobs (and their results) are kept this long for polling clients
+JOB_TTL_S = 3600.0
+
+# Events kept per job for streaming clients (older ones are dropped)
+MAX_JOB_EVENTS = 1024
+
+QUEUED, WAITING, RUNNING, DONE, FAILED, CANCELLED = "queued", "waiting", "running", "done", "failed", "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function when its job has been cancelled."""
+
+
+class QueueFullError(RuntimeError):
+    """Raised by JobManager.submit when max_queued jobs are already waiting."""
+
+
+@dataclass
+class Job:
+    """One background analysis and its progress."""
+    id: str
+    kind: str
+    state: str = QUEUED
+    done: int = 0
+    total: int = 0
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+    events: List[Tuple[int, Dict[str, Any]]] = field(default_factory=list, repr=False)   # (event id, event)
+    published: int = 0
+    _changed: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    def report(self, done: int, total: int):
+        """Record progress (units of work done out of total)."""
+        self.done, self.total = done, total
+
+    def check_cancelled(self):
+        """Stop the job function if the job was cancelled."""
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.id)
+
+    def set_waiting(self, waiting: bool):
+        """
+        Mark the running job as waiting for capacity, or as running again
+        (its elapsed time then counts from now). Publishes the new state.
+        """
+        if waiting and self.state == RUNNING:
+            self.state = WAITING
+        elif not waiting and self.state == WAITING:
+            self.state, self.started = RUNNING, time.time()
+        else:
+            return
+        self.publish_state()
+
+    def publish(self, event: str, **data):
+        """Append an event ({"event": event, **data}) and wake up event listeners."""
+        with self._changed:
+            self.events.append((self.published, {"event": event, **data}))
+            self.published += 1
+            if len(self.events) > MAX_JOB_EVENTS:
+                del self.events[:len(self.events) - MAX_JOB_EVENTS]
+            self._changed.notify_all()
+
+    def wait_events(self, since: int, timeout: float) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        (event id, event) pairs from event id `since` on, waiting up to
+        timeout seconds for new ones (an empty list means nothing happened
+        meanwhile). Dropped events are skipped.
+        """
+        with self._changed:
+            if self.published <= since:
+                self._changed.wait(timeout)
+            return self.events[bisect_left(self.events, since, key=lambda pair: pair[0]):]
+
+    def publish_state(self):
+        """Publish the current state and progress (the last event of a job is a finished state)."""
+        self.publish("state", **self.to_dict(include_result=False))
+        if self.state in FINISHED_STATES:
+            with self._changed:
+                self.events = [pair for pair in self.events if pair[1]["event"] == "state"]
+
+    def eta_seconds(self) -> Optional[float]:
+        """Remaining time extrapolated from the rate so far."""
+        if self.state != RUNNING or not self.started or not self.done or not self.total:
+            return None
+        elapsed = time.time() - self.started
+        return round(elapsed / self.done * (self.total - self.done), 1)
+
+    def to_dict(self, include_result: bool = True) -> Dict:
+        end = self.finished or time.time()
+        info = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "progress": {"done": self.done, "total": self.total},
+            "eta_seconds": self.eta_seconds(),
+            "elapsed_seconds": round(end - self.started, 2) if self.started else 0.0,
+        }
+        if self.error:
+            info["error"] = self.error
+        if include_result and self.state == DONE:
+            info["result"] = self.result
+        return info
+
+
+class JobManager:
+    """
+    Worker pool plus job registry.
+
+    Args:
+        workers: Jobs that run concurrently
+        max_queued: Jobs allowed to wait for a worker before submit() refuses
+        ttl_s: How long finished jobs stay queryable
+    """
+
+    def __init__(self, workers: int = 2, max_queued: int = 16, ttl_s: float = JOB_TTL_S):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl_s = ttl_s
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn: Callable[..., Any], *args, **kwargs) -> Job:
+        """
+        Queue fn(job, *args, **kwargs); its return value becomes the job result.
+
+        Raises:
+            QueueFullError: max_queued jobs are already waiting
+        """
+        with self._lock:
+            self._purge_locked()
+            queued = sum(1 for job in self._jobs.values() if job.state == QUEUED)
+            if queued >= self.max_queued:
+                raise QueueFullError(f"Job queue is full ({queued} jobs waiting), retry later")
+            job = Job(id=uuid.uuid4().hex[:12], kind=kind)
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job: Job, fn: Callable[..., Any], args, kwargs):
+        with self._lock:
+            if job.cancel_event.is_set():
+                return                            # Cancelled while queued
+            job.state, job.started = RUNNING, time.time()
+        job.publish_state()
+        try:
+            result = fn(job, *args, **kwargs)
+        except JobCancelled:
+            state, result, error = CANCELLED, None, None
+        except Exception as e:
+            state, result, error = FAILED, None, str(e)
+        else:
+            state, error = DONE, None
+        with self._lock:
+            job.result, job.error = result, error
+            job.state, job.finished = state, time.time()
+        job.publish_state()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._purge_locked()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a job: queued jobs never start, running (or waiting) jobs
+        stop at their next check_cancelled(). Finished jobs are left as they
+        are.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINISHED_STATES:
+                return job
+            job.cancel_event.set()
+            if job.state == QUEUED:
+                job.state, job.finished = CANCELLED, time.time()
+                job.publish_state()
+            return job
+
+    def stats(self) -> Dict[str, int]:
+        """Number of jobs per state (finished jobs until they expire)."""
+        with self._lock:
+            self._purge_locked()
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.state] = counts.get(job.state, 0) + 1
+            return counts
+
+    def _purge_locked(self):
+        cutoff = time.time() - self.ttl_s
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.state in FINISHED_STATES and job.finished and job.finished < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
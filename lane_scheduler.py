@@ -0,0 +1,165 @@
+"""
+🚦 LANE SCHEDULER
+==================
+Separate capacity for interactive and bulk work, so a few long repository
+analyses cannot starve quick snippet requests.
+
+Each lane admits at most `capacity` concurrent tasks; further tasks wait
+(first come, first served) for up to max_wait_s - or less, if the task
+has its own deadline - and are then refused.
+Every lane records how long its tasks waited to be admitted. A waiting
+task can also be given an interrupt check (e.g. its job's cancellation),
+run every INTERRUPT_POLL_S while it waits.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+# Queue times kept per lane for the percentiles
+QUEUE_SAMPLES = 1024
+
+# Seconds between interrupt checks of a waiting task
+INTERRUPT_POLL_S = 0.5
+
+
+class LaneTimeout(RuntimeError):
+    """Raised when a task waited max_wait_s without getting a slot in its lane."""
+
+
+class Lane:
+    """
+    Concurrency limit plus queue-time statistics for one kind of work.
+
+    Args:
+        name: Lane name (for messages and stats)
+        capacity: Tasks allowed to run at once
+        max_wait_s: Longest wait for a slot (None: wait indefinitely)
+    """
+
+    def __init__(self, name: str, capacity: int, max_wait_s: Optional[float] = None):
+        self.name = name
+        self.capacity = capacity
+        self.max_wait_s = max_wait_s
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waits = deque(maxlen=QUEUE_SAMPLES)
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, max_wait_s: Optional[float] = None,
+                interrupt: Optional[Callable[[], None]] = None) -> float:
+        """
+        Wait for a slot.
+
+        Args:
+            max_wait_s: Longest wait for this task (the lane's max_wait_s still applies)
+            interrupt: Called every INTERRUPT_POLL_S while waiting; an
+                exception it raises ends the wait (and is not counted as
+                a rejection)
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            LaneTimeout: No slot became free in time
+        """
+        limits = [w for w in (self.max_wait_s, max_wait_s) if w is not None]
+        start = time.monotonic()
+        give_up = start + max(min(limits), 0.0) if limits else None
+        with self._cond:
+            self.waiting += 1
+            try:
+                while self.running >= self.capacity:
+                    if interrupt is not None:
+                        interrupt()
+                    timeout = INTERRUPT_POLL_S if interrupt is not None else None
+                    if give_up is not None:
+                        left = give_up - time.monotonic()
+                        if left <= 0:
+                            break
+                        timeout = left if timeout is None else min(timeout, left)
+                    self._cond.wait(timeout)
+                admitted = self.running < self.capacity
+            except BaseException:
+                if self.running < self.capacity:
+                    self._cond.notify()         # Pass on a wakeup this task may have taken
+                raise
+            finally:
+                self.waiting -= 1
+            if not admitted:
+                self.rejected += 1
+                raise LaneTimeout(f"The {self.name} lane is busy ({self.running} running), retry later")
+            self.running += 1
+            waited = time.monotonic() - start
+            self.admitted += 1
+            self._waits.append(waited)
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        return waited
+
+    def full(self) -> bool:
+        """Whether a task asking now would have to wait."""
+        with self._cond:
+            return self.running >= self.capacity
+
+    def release(self):
+        with self._cond:
+            self.running -= 1
+            self._cond.notify()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            waits = np.array(self._waits) * 1000
+            return {
+                "capacity": self.capacity,
+                "running": self.running,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "queue_ms": {
+                    "mean": round(self._total_wait * 1000 / self.admitted, 2) if self.admitted else 0.0,
+                    "p50": round(float(np.percentile(waits, 50)), 2) if len(waits) else 0.0,
+                    "p95": round(float(np.percentile(waits, 95)), 2) if len(waits) else 0.0,
+                    "max": round(self._max_wait * 1000, 2),
+                },
+            }
+
+
+class LaneScheduler:
+    """
+    Named lanes, e.g. {"interactive": (8, 30.0), "bulk": (2, None)}.
+
+    Args:
+        lanes: Lane name -> (capacity, max_wait_s)
+    """
+
+    def __init__(self, lanes: Dict[str, Tuple[int, Optional[float]]]):
+        self.lanes = {name: Lane(name, capacity, max_wait) for name, (capacity, max_wait) in lanes.items()}
+
+    @contextmanager
+    def slot(self, lane: str, max_wait_s: Optional[float] = None,
+             interrupt: Optional[Callable[[], None]] = None) -> Iterator[float]:
+        """
+        Hold a slot in lane for the duration of the with-block (yields the queue time).
+
+        Args:
+            max_wait_s: Longest wait for this task, e.g. what is left of its deadline
+            interrupt: See Lane.acquire
+        """
+        waited = self.lanes[lane].acquire(max_wait_s, interrupt)
+        try:
+            yield waited
+        finally:
+            self.lanes[lane].release()
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-lane load and queue-time statistics."""
+        return {name: lane.stats() for name, lane in self.lanes.items()}
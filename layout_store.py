@@ -0,0 +1,221 @@
+"""
+🗂️ LAYOUT STORE
+================
+Remembers the last analyses of each repository so that reanalysing after
+a few edits is cheap, both for the server and for the client:
+
+- Per file, the last building and the key it was computed for (content
+  hash plus whether precomputed CK metrics were used). Files whose key is
+  unchanged are not reanalyzed. Buildings are kept as their canonical JSON
+  bytes (the same bytes their digest is taken over), not as dicts.
+- Per repository, the last few city versions as building digests and
+  relationship edges. A version id is derived from the city's content,
+  and delta() lists the buildings and edges added, removed or changed
+  between two versions. latest() returns the last city itself, for
+  district drill-down without reanalysis.
+
+A city is recorded while it is analysed: begin() returns a CityRecorder
+that takes one building at a time, so the analysis never has to hold the
+whole building list for the commit.
+
+Repositories are evicted least recently used first.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+# (relationship kind, from, to, type)
+Edge = Tuple[str, str, str, str]
+
+
+@dataclass
+class CityVersion:
+    """Fingerprint of one analysed city"""
+    version: str
+    buildings: Dict[str, str]       # file_path -> building digest
+    edges: FrozenSet[Edge]
+
+
+@dataclass
+class RepoLayouts:
+    """Everything remembered about one repository"""
+    files: Dict[str, Tuple[str, bytes]] = field(default_factory=dict)   # path -> (file key, encoded building)
+    versions: "OrderedDict[str, CityVersion]" = field(default_factory=OrderedDict)
+
+
+def encode_building(building: Dict[str, Any]) -> bytes:
+    return json.dumps(building, sort_keys=True).encode("utf-8")
+
+
+def building_digest(building: Dict[str, Any]) -> str:
+    return hashlib.sha1(encode_building(building)).hexdigest()
+
+
+def edge_dict(edge: Edge) -> Dict[str, str]:
+    kind, source, target, rel_type = edge
+    rel = {"kind": kind, "from": source, "to": target}
+    if rel_type:
+        rel["type"] = rel_type
+    return rel
+
+
+class LayoutStore:
+    """
+    Args:
+        max_repos: Repositories remembered (least recently used are dropped)
+        versions_per_repo: City versions kept per repository for deltas
+    """
+
+    def __init__(self, max_repos: int = 32, versions_per_repo: int = 8):
+        self.max_repos = max_repos
+        self.versions_per_repo = versions_per_repo
+        self._repos: "OrderedDict[str, RepoLayouts]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _repo_locked(self, project_key: str) -> RepoLayouts:
+        repo = self._repos.get(project_key)
+        if repo is None:
+            repo = self._repos[project_key] = RepoLayouts()
+            while len(self._repos) > self.max_repos:
+                self._repos.popitem(last=False)
+        self._repos.move_to_end(project_key)
+        return repo
+
+    def cached_buildings(self, project_key: str, file_keys: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Buildings that can be reused.
+
+        Args:
+            project_key: Directory path or repository URL
+            file_keys: Building file path -> key of its current content
+
+        Returns:
+            file path -> building, for files whose key matches the last analysis
+        """
+        with self._lock:
+            repo = self._repos.get(project_key)
+            if repo is None:
+                return {}
+            reusable = [(path, encoded) for path, (key, encoded) in repo.files.items()
+                        if file_keys.get(path) == key]
+        return {path: json.loads(encoded) for path, encoded in reusable}
+
+    def begin(self, project_key: str) -> "CityRecorder":
+        """Start recording a city of project_key (see CityRecorder)."""
+        return CityRecorder(self, project_key)
+
+    def _commit(self, project_key: str, files: Dict[str, Tuple[str, bytes]],
+                digests: Dict[str, str], edges: List[Edge]) -> str:
+        edge_set = frozenset(edges)
+        content = hashlib.sha1()
+        for path, digest in sorted(digests.items()):
+            content.update(f"{path}\0{digest}\n".encode("utf-8"))
+        for edge in sorted(edge_set):
+            content.update(("\0".join(edge) + "\n").encode("utf-8"))
+        version = content.hexdigest()[:16]
+
+        with self._lock:
+            repo = self._repo_locked(project_key)
+            repo.files = files
+            repo.versions.pop(version, None)
+            repo.versions[version] = CityVersion(version, digests, edge_set)
+            while len(repo.versions) > self.versions_per_repo:
+                repo.versions.popitem(last=False)
+        return version
+
+    def latest(self, project_key: str) -> Optional[Tuple[str, List[Dict[str, Any]], FrozenSet[Edge]]]:
+        """
+        The repository's last analysed city.
+
+        Returns:
+            (version, buildings in city order, edges), or None if the
+            repository is not (or no longer) remembered
+        """
+        with self._lock:
+            repo = self._repos.get(project_key)
+            if repo is None or not repo.versions:
+                return None
+            version = next(reversed(repo.versions))
+            encoded = [building for _, building in repo.files.values()]
+            edges = repo.versions[version].edges
+        return version, [json.loads(building) for building in encoded], edges
+
+    def delta(self, project_key: str, since: Optional[str], city: Dict[str, Any],
+              edges: List[Edge]) -> Dict[str, Any]:
+        """
+        Changes from version `since` to the city just committed.
+
+        Returns:
+            {"since", "full", "buildings": {"added", "changed", "removed"},
+             "relationships": {"added", "removed"}}. If since is unknown (never
+            seen or evicted), "full" is true and everything counts as added.
+        """
+        with self._lock:
+            repo = self._repos.get(project_key)
+            old = repo.versions.get(since) if repo and since else None
+        if old is None:
+            return {
+                "since": since,
+                "full": True,
+                "buildings": {"added": city["buildings"], "changed": [], "removed": []},
+                "relationships": {"added": [edge_dict(e) for e in edges], "removed": []},
+            }
+
+        added, changed = [], []
+        current = set()
+        for building in city["buildings"]:
+            path = building["file_path"]
+            current.add(path)
+            previous = old.buildings.get(path)
+            if previous is None:
+                added.append(building)
+            elif previous != building_digest(building):
+                changed.append(building)
+        new_edges = set(edges)
+        return {
+            "since": since,
+            "full": False,
+            "buildings": {"added": added, "changed": changed,
+                          "removed": [path for path in old.buildings if path not in current]},
+            "relationships": {"added": [edge_dict(e) for e in edges if e not in old.edges],
+                              "removed": [edge_dict(e) for e in sorted(old.edges - new_edges)]},
+        }
+
+
+class CityRecorder:
+    """
+    A city being recorded as it is analysed, one building at a time.
+
+    Only each building's encoded JSON and digest are kept; commit() makes
+    the city the repository's latest version.
+    """
+
+    def __init__(self, store: LayoutStore, project_key: str):
+        self.store = store
+        self.project_key = project_key
+        self._files: Dict[str, Tuple[str, bytes]] = {}
+        self._digests: Dict[str, str] = {}
+
+    def add(self, building: Dict[str, Any], file_key: Optional[str]):
+        """
+        Args:
+            building: The next building of the city (JSON dict)
+            file_key: Key the building was computed for (None: not reusable)
+        """
+        encoded = encode_building(building)
+        self._digests[building["file_path"]] = hashlib.sha1(encoded).hexdigest()
+        if file_key is not None:
+            self._files[building["file_path"]] = (file_key, encoded)
+
+    def commit(self, edges: List[Edge]) -> str:
+        """
+        Record the city, with its relationships, as the latest version.
+
+        Returns:
+            The version id
+        """
+        return self.store._commit(self.project_key, self._files, self._digests, edges)
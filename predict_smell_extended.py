@@ -44,13 +44,14 @@ Requirements:
 
 import os
 import sys
+import copy
 import json
 import re
-import csv
+import time
 import numpy as np
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 # Add paths
 SCRIPT_DIR = Path(__file__).parent.absolute()
@@ -58,6 +59,8 @@ BASE = SCRIPT_DIR.parent if SCRIPT_DIR.name == "tools" else SCRIPT_DIR
 sys.path.insert(0, str(SCRIPT_DIR))
 sys.path.insert(0, str(BASE / "tools"))
 
+from ck_store import CK_COLS, get_ck_store, is_store_path
+
 # Try to import ML models
 try:
     import joblib
@@ -103,6 +106,11 @@ def color(text, *styles):
 # DeadCode removed from ML - now purely static/rule-based detection
 MODEL_SMELLS = ["Clean", "DataClass", "FeatureEnvy", "GodClass", "LongMethod"]
 
+# Classes the CK models are trained on (ultimate_model.SMELLS): DeadCode is
+# still a training class, serving just ignores its column. Models saved
+# without a feature_schema.json predict these, in this order
+TRAINING_SMELLS = ["Clean", "DataClass", "DeadCode", "FeatureEnvy", "GodClass", "LongMethod"]
+
 # Primary smells from ML model
 PRIMARY_SMELLS = ["Clean", "DataClass", "FeatureEnvy", "GodClass", "LongMethod"]
 
@@ -249,64 +257,42 @@ SMELL_INFO = {
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
-# CK Metrics Loading (from pre-computed CSV files)
+# CK Metrics Loading (from the indexed store over pre-computed CSV files)
 # ═══════════════════════════════════════════════════════════════════════════════
 
-CK_COLS = ['LOC', 'WMC', 'METHODS', 'FIELDS', 'PRIVATE_METHODS', 
-           'CBO', 'DIT', 'LCOM', 'TCC', 'ATFD', 'MAX_METHOD_LOC', 'NOC']
+PACKAGE_PATTERN = re.compile(r'^\s*package\s+([\w.]+)\s*;', re.MULTILINE)
 
-# Global cache for CK metrics
-_CK_METRICS_CACHE = {}
 
-def load_ck_metrics_cache():
-    """Load all CK metrics from CSV files into memory."""
-    global _CK_METRICS_CACHE
-    if _CK_METRICS_CACHE:
-        return _CK_METRICS_CACHE
-    
-    ck_dir = BASE / "ck_metrics"
-    if not ck_dir.exists():
-        return {}
-    
-    for csv_file in ck_dir.glob("*_ck.csv"):
-        try:
-            with open(csv_file, 'r', encoding='utf-8', errors='ignore') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    # Normalize file path for matching
-                    file_path = row.get('file_path', '')
-                    class_name = row.get('class_name', '')
-                    
-                    # Create keys for lookup
-                    if file_path:
-                        # Key by filename
-                        fname = Path(file_path).name
-                        key = fname.lower()
-                        _CK_METRICS_CACHE[key] = row
-                        
-                        # Also key by class name
-                        if class_name:
-                            _CK_METRICS_CACHE[class_name.lower() + '.java'] = row
-        except Exception as e:
-            print(f"⚠️ Error loading {csv_file}: {e}")
-    
-    return _CK_METRICS_CACHE
+def extract_package(code: str) -> Optional[str]:
+    """Package declared by a Java compilation unit, if any."""
+    match = PACKAGE_PATTERN.search(code)
+    return match.group(1) if match else None
 
-def get_ck_metrics_for_file(file_path: str) -> Optional[Dict]:
-    """Look up pre-computed CK metrics for a file."""
-    cache = load_ck_metrics_cache()
-    if not cache:
-        return None
-    
-    # Try different matching strategies
-    fname = Path(file_path).name.lower()
-    
-    # Direct filename match
-    if fname in cache:
-        row = cache[fname]
-        return {col: float(row.get(col, 0) or 0) for col in CK_COLS}
+
+def get_ck_metrics_for_file(file_path: str, package: Optional[str] = None) -> Optional[Dict]:
+    """
+    Look up pre-computed CK metrics for a file.
     
-    return None
+    Matches the longest indexed path suffix; when several projects share
+    that suffix (e.g. .../util/Builder.java), the package breaks the tie.
+    Paths of precomputed repositories ('repo-<name>-<digest>/...') only
+    match their own row.
+    """
+    store = get_ck_store(BASE / "ck_metrics")
+    if store is None:
+        return None
+    if is_store_path(file_path):
+        return store.lookup_path(file_path)
+    return store.lookup_file(file_path, package)
+
+
+def lookup_ck_metrics(codes: List[str], file_paths: List[Optional[str]]) -> List[Optional[Dict]]:
+    """
+    Pre-computed CK metrics of each file, as extract_metrics would find
+    them (None: no file path, or not in the CK store).
+    """
+    return [get_ck_metrics_for_file(fp, extract_package(code)) if fp else None
+            for code, fp in zip(codes, file_paths)]
 
 
 def extract_metrics(code: str, file_path: str = None) -> Dict:
@@ -318,7 +304,7 @@ def extract_metrics(code: str, file_path: str = None) -> Dict:
     """
     # Try to use real CK metrics first
     if file_path:
-        real_metrics = get_ck_metrics_for_file(file_path)
+        real_metrics = get_ck_metrics_for_file(file_path, extract_package(code))
         if real_metrics:
             return real_metrics
     
@@ -329,13 +315,7 @@ def extract_metrics(code: str, file_path: str = None) -> Dict:
     # ====================================================================
     # DETECT CLASS TYPE EARLY (for accurate metrics)
     # ====================================================================
-    class_type = "class"
-    if re.search(r'\benum\s+\w+', code):
-        class_type = "enum"
-    elif re.search(r'\binterface\s+\w+', code):
-        class_type = "interface"
-    elif re.search(r'\babstract\s+class\s+\w+', code):
-        class_type = "abstract_class"
+    class_type = detect_class_type(code)
     metrics['class_type'] = class_type
     
     lines = code.split('\n')
@@ -522,71 +502,162 @@ def extract_metrics(code: str, file_path: str = None) -> Dict:
     return metrics
 
 
-def add_derived_features(metrics: Dict) -> np.ndarray:
-    """Convert metrics to feature array with derived features.
+# ═══════════════════════════════════════════════════════════════════════════════
+# Feature Schema (contract with ultimate_model.py)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+FEATURE_SCHEMA_VERSION = 1
+
+# 20 derived features, in column order after the 12 CK_COLS
+DERIVED_FEATURES = [
+    'wmc_per_method', 'loc_per_method', 'max_method_loc_ratio',
+    'data_ratio', 'fields_per_method',
+    'size_complexity', 'coupling_complexity', 'methods_coupling',
+    'atfd_per_method', 'cbo_per_method',
+    'max_method_loc', 'max_method_loc_per_method',
+    'lcom_per_method', 'inverse_tcc',
+    'private_method_ratio',
+    'hierarchy',
+    'log_loc', 'log_wmc', 'sqrt_coupling_complexity', 'geo_mean_size_complexity',
+]
+
+FEATURE_NAMES = CK_COLS + DERIVED_FEATURES
+
+
+class FeatureSchemaError(ValueError):
+    """Saved models were trained on a different feature layout than this module computes."""
+
+
+class FeaturePlan:
+    """
+    Feature schema checked once at model load, compiled into fixed column indices.
     
-    MUST match the 32 features from ultimate_model.py exactly:
-    - 12 base CK columns
-    - 20 derived features
+    ultimate_model.py writes models/feature_schema.json next to the models it
+    trains. Loading compares it with FEATURE_NAMES and raises FeatureSchemaError
+    on any drift, so a mismatched model never silently scores the wrong columns.
+    Feature derivation is then plain array indexing over a (N, 12) CK matrix.
     """
-    base = [float(metrics.get(col, 0) or 0) for col in CK_COLS]
-    
-    # Base metrics with safety (matching ultimate_model.py)
-    loc = max(metrics.get('LOC', 1), 1)
-    wmc = max(metrics.get('WMC', 1), 1)
-    methods = max(metrics.get('METHODS', 1), 1)
-    fields = max(metrics.get('FIELDS', 0), 0)
-    cbo = max(metrics.get('CBO', 0), 0)
-    lcom = max(metrics.get('LCOM', 0), 0)
-    max_method_loc = max(metrics.get('MAX_METHOD_LOC', 1), 1)
-    atfd = max(metrics.get('ATFD', 0), 0)
-    tcc = max(metrics.get('TCC', 0.001), 0.001)
-    dit = max(metrics.get('DIT', 0), 0)
-    noc = max(metrics.get('NOC', 0), 0)
-    private_methods = max(metrics.get('PRIVATE_METHODS', 0), 0)
-    
-    # 20 derived features - MUST match ultimate_model.py exactly
-    derived = [
-        # Complexity ratios
-        wmc / methods,                      # Avg complexity per method
-        loc / methods,                      # Avg LOC per method
-        max_method_loc / loc,               # Longest method ratio
-        
-        # Data class indicators
-        fields / (fields + methods + 1),    # Data-heaviness ratio
-        fields / methods if methods > 0 else 0,  # Field to method ratio
-        
-        # God class indicators
-        wmc * loc / 1000,                   # Size-complexity product
-        cbo * wmc / 100,                    # Coupling * Complexity
-        methods * cbo / 100,                # Methods * Coupling
-        
-        # Feature envy indicators
-        atfd / (methods + 1),               # External access per method
-        cbo / (methods + 1),                # Coupling per method
-        
-        # Long method indicators
-        max_method_loc,                     # Absolute longest method
-        max_method_loc / methods,           # Longest vs avg
-        
-        # Cohesion indicators
-        lcom / (methods + 1),               # Lack of cohesion per method
-        1 / (tcc + 0.001),                  # Inverse TCC
-        
-        # Encapsulation
-        private_methods / (methods + 1),    # Encapsulation ratio
-        
-        # Hierarchy
-        dit + noc,                          # Inheritance depth + children
-        
-        # Interactions (non-linear features)
-        np.log1p(loc),                      # Log LOC
-        np.log1p(wmc),                      # Log WMC
-        np.sqrt(cbo * wmc),                 # Sqrt of coupling-complexity
-        loc ** 0.5 * wmc ** 0.5,            # Geometric mean size-complexity
-    ]
+    __slots__ = ('labels', 'n_features', 'smell_index',
+                 'LOC', 'WMC', 'METHODS', 'FIELDS', 'PRIVATE_METHODS',
+                 'CBO', 'DIT', 'LCOM', 'TCC', 'ATFD', 'MAX_METHOD_LOC', 'NOC')
+    
+    def __init__(self, schema: Optional[Dict] = None):
+        schema = schema or {
+            'version': FEATURE_SCHEMA_VERSION,
+            'base_columns': CK_COLS,
+            'derived_features': DERIVED_FEATURES,
+            'labels': TRAINING_SMELLS,
+        }
+        if schema.get('version') != FEATURE_SCHEMA_VERSION:
+            raise FeatureSchemaError(
+                f"Feature schema version {schema.get('version')} != {FEATURE_SCHEMA_VERSION}")
+        if list(schema.get('base_columns', [])) != CK_COLS:
+            raise FeatureSchemaError(
+                f"Base columns {schema.get('base_columns')} do not match CK_COLS {CK_COLS}")
+        if list(schema.get('derived_features', [])) != DERIVED_FEATURES:
+            raise FeatureSchemaError(
+                f"Derived features {schema.get('derived_features')} do not match {DERIVED_FEATURES}")
+        
+        self.n_features = len(FEATURE_NAMES)
+        self.labels = list(schema['labels'])
+        # Column of each MODEL_SMELLS entry in the model's probability output (-1 = absent)
+        self.smell_index = np.array(
+            [self.labels.index(s) if s in self.labels else -1 for s in MODEL_SMELLS])
+        for i, col in enumerate(CK_COLS):
+            setattr(self, col, i)
+    
+    def schema_dict(self) -> Dict:
+        """The schema this plan was compiled from, as written to feature_schema.json."""
+        return {
+            'version': FEATURE_SCHEMA_VERSION,
+            'base_columns': CK_COLS,
+            'derived_features': DERIVED_FEATURES,
+            'labels': self.labels,
+        }
     
-    return np.array(base + derived, dtype=np.float32)
+    def check_model(self, name: str, model) -> None:
+        """Fail fast if a loaded estimator disagrees with the schema's shape."""
+        n_in = getattr(model, 'n_features_in_', self.n_features)
+        if n_in != self.n_features:
+            raise FeatureSchemaError(f"{name} expects {n_in} features, schema has {self.n_features}")
+        classes = getattr(model, 'classes_', None)
+        if classes is not None and len(classes) != len(self.labels):
+            raise FeatureSchemaError(
+                f"{name} predicts {len(classes)} classes, schema labels are {self.labels}")
+    
+    def base_matrix(self, metrics_list: List[Dict]) -> np.ndarray:
+        """(N, 12) float64 matrix of CK_COLS values - the only per-column dict access."""
+        return np.array([[float(m.get(col, 0) or 0) for col in CK_COLS] for m in metrics_list],
+                        dtype=np.float64).reshape(len(metrics_list), len(CK_COLS))
+    
+    def transform(self, base: np.ndarray) -> np.ndarray:
+        """(N, 12) CK matrix -> (N, 32) float32 features, NaN/inf zeroed."""
+        loc = np.maximum(base[:, self.LOC], 1)
+        wmc = np.maximum(base[:, self.WMC], 1)
+        methods = np.maximum(base[:, self.METHODS], 1)
+        fields = np.maximum(base[:, self.FIELDS], 0)
+        cbo = np.maximum(base[:, self.CBO], 0)
+        lcom = np.maximum(base[:, self.LCOM], 0)
+        max_method_loc = np.maximum(base[:, self.MAX_METHOD_LOC], 1)
+        atfd = np.maximum(base[:, self.ATFD], 0)
+        tcc = np.maximum(base[:, self.TCC], 0.001)
+        dit = np.maximum(base[:, self.DIT], 0)
+        noc = np.maximum(base[:, self.NOC], 0)
+        private_methods = np.maximum(base[:, self.PRIVATE_METHODS], 0)
+        
+        # Order MUST follow DERIVED_FEATURES
+        derived = np.column_stack([
+            wmc / methods,
+            loc / methods,
+            max_method_loc / loc,
+            fields / (fields + methods + 1),
+            fields / methods,
+            wmc * loc / 1000,
+            cbo * wmc / 100,
+            methods * cbo / 100,
+            atfd / (methods + 1),
+            cbo / (methods + 1),
+            max_method_loc,
+            max_method_loc / methods,
+            lcom / (methods + 1),
+            1 / (tcc + 0.001),
+            private_methods / (methods + 1),
+            dit + noc,
+            np.log1p(loc),
+            np.log1p(wmc),
+            np.sqrt(cbo * wmc),
+            loc ** 0.5 * wmc ** 0.5,
+        ])
+        features = np.hstack([base, derived]).astype(np.float32)
+        return np.nan_to_num(features, nan=0.0, posinf=0.0, neginf=0.0)
+    
+    def to_model_smells(self, proba: np.ndarray) -> np.ndarray:
+        """Reorder (N, len(labels)) model probabilities into MODEL_SMELLS columns."""
+        return np.where(self.smell_index >= 0, proba[:, self.smell_index], 0.0)
+
+
+def load_feature_plan(model_dir: Path, model=None) -> FeaturePlan:
+    """
+    Compile models/feature_schema.json, or the built-in schema for models
+    saved before it existed. Their labels are the model's classes_ when
+    those are smell names, TRAINING_SMELLS otherwise.
+    """
+    schema_path = model_dir / "feature_schema.json"
+    if not schema_path.exists():
+        classes = getattr(model, 'classes_', None)
+        if classes is not None and all(isinstance(c, str) for c in classes):
+            return FeaturePlan({**FeaturePlan().schema_dict(), 'labels': list(classes)})
+        return FeaturePlan()
+    with open(schema_path, 'r', encoding='utf-8') as f:
+        return FeaturePlan(json.load(f))
+
+
+_DEFAULT_PLAN = FeaturePlan()
+
+
+def add_derived_features(metrics: Dict) -> np.ndarray:
+    """Convert a metrics dict to the 32-feature vector described by FEATURE_NAMES."""
+    return _DEFAULT_PLAN.transform(_DEFAULT_PLAN.base_matrix([metrics]))[0]
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -620,7 +691,7 @@ def detect_extended_smells(code: str, metrics: Dict, class_type: str = "class")
         except:
             pass
     if len(magic_numbers) >= 2:
-        examples = list(set(magic_numbers))[:5]
+        examples = list(dict.fromkeys(magic_numbers))[:5]
         detected.append(("MagicNumbers", min(0.5 + len(magic_numbers) * 0.1, 0.9),
                         f"Found magic numbers: {', '.join(examples)}"))
     
@@ -786,7 +857,7 @@ def detect_extended_smells(code: str, metrics: Dict, class_type: str = "class")
     boxing_matches = re.findall(deprecated_boxing, code)
     if boxing_matches:
         detected.append(("UnnecessaryBoxing", 0.85,
-                        f"Use {', '.join(set(boxing_matches))}.valueOf() instead of new"))
+                        f"Use {', '.join(dict.fromkeys(boxing_matches))}.valueOf() instead of new"))
     
     # String concatenation in loops
     string_concat_loop = r'for\s*\([^)]+\)\s*\{[^}]*\+\s*[^+]*String|String[^}]*\+='
@@ -950,7 +1021,7 @@ def detect_extended_smells(code: str, metrics: Dict, class_type: str = "class")
         
         if num_bad >= 2 or bad_ratio > 0.2:
             confidence = min(0.5 + num_bad * 0.08 + bad_ratio * 0.3, 0.95)
-            examples = list(set(bad_names))[:5]  # Show first 5 unique
+            examples = list(dict.fromkeys(bad_names))[:5]  # Show first 5 unique
             detected.append(("BadNaming", confidence,
                            f"Poor names: {', '.join(examples)}"))
     
@@ -961,8 +1032,52 @@ def detect_extended_smells(code: str, metrics: Dict, class_type: str = "class")
 # ML Model Loading
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def load_models() -> Optional[Dict]:
-    """Load trained ML models"""
+# Members predict_smell can average, in serving order
+ENSEMBLE_MEMBERS = ['rf', 'gb', 'xgb']
+
+
+def load_ensemble_config(model_dir: Path, latency_budget_ms: Optional[float] = None) -> Optional[Dict]:
+    """
+    Read the pruned ensemble written by `ultimate_model.py --prune`.
+    
+    Returns the configuration to serve ({'members', 'rf_n_estimators', ...}),
+    or None if no pruning analysis has been run. With a latency budget, the
+    most accurate frontier entry that fits it is chosen instead of the one
+    selected at analysis time.
+    """
+    config_path = model_dir / "ensemble_config.json"
+    if not config_path.exists():
+        return None
+    
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    
+    if latency_budget_ms is None or not config.get('frontier'):
+        return config
+    
+    frontier = sorted(config['frontier'], key=lambda c: c['latency_ms'])
+    fitting = [c for c in frontier if c['latency_ms'] <= latency_budget_ms]
+    chosen = max(fitting, key=lambda c: c['macro_f1']) if fitting else frontier[0]
+    return {**config, **chosen, 'latency_budget_ms': latency_budget_ms,
+            'expected_latency_ms': chosen['latency_ms'], 'expected_macro_f1': chosen['macro_f1']}
+
+
+def truncate_forest(forest, n_trees: int):
+    """Shallow copy of a fitted forest that only uses its first n_trees trees."""
+    pruned = copy.copy(forest)
+    pruned.estimators_ = forest.estimators_[:n_trees]
+    pruned.n_estimators = n_trees
+    pruned.n_jobs = 1  # Single-row inference: thread fan-out costs more than it saves
+    return pruned
+
+
+def load_models(latency_budget_ms: Optional[float] = None) -> Optional[Dict]:
+    """
+    Load trained ML models.
+    
+    If models/ensemble_config.json exists, only the members it selects are
+    loaded and the Random Forest is cut down to its pruned tree count.
+    """
     if not HAS_JOBLIB:
         return None
     
@@ -970,19 +1085,214 @@ def load_models() -> Optional[Dict]:
     models = {}
     
     try:
+        ensemble = load_ensemble_config(model_dir, latency_budget_ms)
+        if ensemble:
+            members = ensemble['members']
+            required = members
+        else:
+            members = ENSEMBLE_MEMBERS
+            required = ['rf', 'gb']
+        
         # Try to load ultimate models
-        if (model_dir / "ultimate_rf.joblib").exists():
-            models['rf'] = joblib.load(model_dir / "ultimate_rf.joblib")
-            models['gb'] = joblib.load(model_dir / "ultimate_gb.joblib")
+        if all((model_dir / f"ultimate_{name}.joblib").exists() for name in required):
+            for name in members:
+                model_path = model_dir / f"ultimate_{name}.joblib"
+                if model_path.exists():
+                    models[name] = joblib.load(model_path)
             models['scaler'] = joblib.load(model_dir / "ultimate_scaler.joblib")
-            if (model_dir / "ultimate_xgb.joblib").exists():
-                models['xgb'] = joblib.load(model_dir / "ultimate_xgb.joblib")
-            print("✓ Loaded trained ML models")
-            return models
+            
+            # Schema is checked here, once - drift raises instead of scoring wrong columns
+            plan = load_feature_plan(model_dir, next((models[m] for m in members if m in models), None))
+            for name in ['scaler'] + members:
+                if name in models:
+                    plan.check_model(name, models[name])
+            models['plan'] = plan
+            
+            if ensemble:
+                if 'rf' in models and ensemble.get('rf_n_estimators'):
+                    models['rf'] = truncate_forest(models['rf'], ensemble['rf_n_estimators'])
+                if 'xgb' in models:
+                    models['xgb'].set_params(n_jobs=1)
+                models['ensemble'] = ensemble
+                print(f"✓ Loaded pruned ML ensemble: {'+'.join(members)} "
+                      f"(~{ensemble['expected_latency_ms']:.2f} ms/file)")
+            else:
+                print("✓ Loaded trained ML models")
+    except FeatureSchemaError:
+        raise
     except Exception as e:
         print(f"⚠️ Could not load ML models: {e}")
+        models = {}
+    
+    # The optional models are loaded on their own: a broken one is skipped
+    # without discarding the CK ensemble
+    
+    # Model trained on regex-approximated metrics, for pasted code
+    if (model_dir / "ultimate_approx.joblib").exists():
+        try:
+            approx = joblib.load(model_dir / "ultimate_approx.joblib")
+            approx_plan = FeaturePlan({**load_feature_plan(model_dir).schema_dict(),
+                                       'labels': approx['labels']})
+            approx_plan.check_model('approx scaler', approx['scaler'])
+            approx_plan.check_model('approx', approx['model'])
+            models['approx'] = approx
+            print("✓ Loaded approximate-metrics model (pasted code)")
+        except FeatureSchemaError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Could not load approximate-metrics model: {e}")
+    
+    # Hashed n-gram text model needs no CK metrics, so it also serves pasted code
+    if (model_dir / "ultimate_text.joblib").exists():
+        try:
+            models['text'] = compile_text_model(joblib.load(model_dir / "ultimate_text.joblib"))
+            print("✓ Loaded hashed n-gram text model")
+        except Exception as e:
+            print(f"⚠️ Could not load text model: {e}")
+    
+    if not models:
+        return None
+    if model_state(models) == "partial":
+        print(f"⚠️ CK ensemble not found - CK-metric classes use rules "
+              f"(loaded: {', '.join(model_components(models))})")
+    return models
+
+
+def model_components(models: Optional[Dict]) -> List[str]:
+    """Loaded model parts: CK ensemble members, 'approx', 'text'."""
+    return [name for name in ENSEMBLE_MEMBERS + ['approx', 'text'] if models and name in models]
+
+
+def model_state(models: Optional[Dict]) -> str:
+    """
+    'full' when the CK ensemble is loaded, 'partial' when only auxiliary
+    models are (pasted-code or text model - classes with real CK metrics
+    then get rule-based detection), 'none' without any model.
+    """
+    if not models:
+        return "none"
+    return "full" if 'scaler' in models else "partial"
+
+
+def compile_text_model(bundle: Dict) -> Dict:
+    """
+    Unpack the text model saved by ultimate_model.py for per-request scoring.
+    
+    The classifier's predict_proba spends milliseconds validating a one-row
+    input; scoring is just a sparse dot product with the linear weights, so
+    keep those as a dense (n_features, n_classes) array and do it directly.
+    """
+    vectorizer, classifier = bundle['pipeline'].steps[0][1], bundle['pipeline'].steps[-1][1]
+    return {
+        'vectorizer': vectorizer,
+        'weights': np.ascontiguousarray(classifier.coef_.T, dtype=np.float32),
+        'intercept': classifier.intercept_.astype(np.float32),
+        'labels': [bundle['labels'][int(c)] for c in classifier.classes_],
+        'blend_weights': bundle['blend_weights'],
+    }
+
+
+def predict_text_proba_batch(codes: List[str], models: Optional[Dict]) -> Optional[np.ndarray]:
+    """(N, len(labels)) probabilities from the hashed n-gram text model (None if not loaded)."""
+    if not models or 'text' not in models:
+        return None
+    
+    text = models['text']
+    scores = np.asarray(text['vectorizer'].transform(codes) @ text['weights']) + text['intercept']
+    # Same one-vs-rest normalisation as the classifier's predict_proba
+    proba = 1.0 / (1.0 + np.exp(-scores))
+    if len(text['labels']) == 2:
+        proba = np.column_stack([1.0 - proba[:, 0], proba[:, 0]])
+    return proba / proba.sum(axis=1, keepdims=True)
+
+
+def predict_text_proba(code: str, models: Optional[Dict]) -> Optional[Dict[str, float]]:
+    """Per-smell probabilities from the hashed n-gram text model (None if not loaded)."""
+    proba = predict_text_proba_batch([code], models)
+    if proba is None:
+        return None
+    return {label: float(p) for label, p in zip(models['text']['labels'], proba[0])}
+
+
+# Ensemble probabilities at or below this are not reported as smells
+ML_SMELL_THRESHOLD = 0.1
+
+
+def score_ml_batch(models: Dict, metrics_list: List[Dict], approximate: bool = False,
+                   text_proba: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Ensemble probabilities for many classes in one model call per member.
+    
+    Args:
+        models: Loaded ML models
+        metrics_list: One metrics dict per class (all real CK, or all approximate)
+        approximate: Score with the approximate-metrics model instead of the CK ensemble
+        text_proba: Rows from predict_text_proba_batch to blend in (optional)
+        
+    Returns:
+        (N, len(MODEL_SMELLS)) probability matrix
+    """
+    plan = models.get('plan', _DEFAULT_PLAN)
+    X = plan.transform(plan.base_matrix(metrics_list))
     
-    return None
+    if not approximate:
+        X_scaled = models['scaler'].transform(X)
+        # Members may be pruned by ensemble_config.json
+        member_probas = [models[name].predict_proba(X_scaled)
+                         for name in ENSEMBLE_MEMBERS if name in models]
+        proba = plan.to_model_smells(np.mean(member_probas, axis=0))
+    else:
+        # Model trained on the regex-approximated metrics of build_dataset's raw_code
+        approx = models['approx']
+        raw = approx['model'].predict_proba(approx['scaler'].transform(X))
+        labels = [approx['labels'][int(c)] for c in approx['model'].classes_]
+        cols = np.array([labels.index(s) if s in labels else -1 for s in MODEL_SMELLS])
+        proba = np.where(cols >= 0, raw[:, cols], 0.0)
+        proba = proba / np.maximum(proba.sum(axis=1, keepdims=True), 1e-9)
+    
+    # Per-class blend with the text model, as in ultimate_model.py's served ensemble
+    if text_proba is not None:
+        text = models['text']
+        cols = np.array([text['labels'].index(s) if s in text['labels'] else -1 for s in MODEL_SMELLS])
+        text_part = np.where(cols >= 0, text_proba[:, cols], 0.0)
+        blend = np.array([text['blend_weights'].get(s, 0.0) for s in MODEL_SMELLS])
+        proba = blend * text_part + (1 - blend) * proba
+        proba = proba / proba.sum(axis=1, keepdims=True)
+    
+    return proba
+
+
+def blend_text_confidences(smells: List[Tuple[str, float]], text_proba: Dict[str, float],
+                           blend_weights: Dict[str, float]) -> List[Tuple[str, float]]:
+    """
+    Blend the text model into rule-based confidences.
+
+    Each smell the rules found gets blend * text + (1 - blend) * rule, with
+    the per-smell weights the ML path uses. Smells only the text model sees
+    are added when their blended share alone exceeds ML_SMELL_THRESHOLD, so
+    the rules keep deciding what is detected at all.
+    """
+    found = {smell for smell, _ in smells}
+    blended = []
+    for smell, conf in smells:
+        weight = blend_weights.get(smell, 0.0)
+        blended.append((smell, weight * text_proba.get(smell, 0.0) + (1 - weight) * conf))
+    for smell, p in text_proba.items():
+        share = blend_weights.get(smell, 0.0) * p
+        if smell not in found and smell in MODEL_SMELLS and share > ML_SMELL_THRESHOLD:
+            blended.append((smell, share))
+    return blended
+
+
+def detect_class_type(code: str) -> str:
+    """class, interface, enum or abstract_class - decides which smells apply."""
+    if re.search(r'\benum\s+\w+', code):
+        return "enum"
+    if re.search(r'\binterface\s+\w+', code):
+        return "interface"
+    if re.search(r'\babstract\s+class\s+\w+', code):
+        return "abstract_class"
+    return "class"
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -1001,7 +1311,9 @@ class PredictionResult:
 
 
 def predict_smell(code: str, models: Optional[Dict] = None, 
-                  use_extended: bool = True, file_path: str = None) -> PredictionResult:
+                  use_extended: bool = True, file_path: str = None, *,
+                  metrics: Optional[Dict] = None, ml_proba: Optional[np.ndarray] = None,
+                  text_proba: Optional[Dict[str, float]] = None) -> PredictionResult:
     """
     Predict code smells for given Java code.
     
@@ -1010,25 +1322,21 @@ def predict_smell(code: str, models: Optional[Dict] = None,
         models: Loaded ML models (optional)
         use_extended: Whether to detect extended smells
         file_path: Path to the Java file (for CK metrics lookup)
+        metrics, ml_proba, text_proba: Precomputed by predict_smell_batch
         
     Returns:
         PredictionResult with all detected smells
     """
     # Extract metrics (uses real CK data if available)
-    metrics = extract_metrics(code, file_path)
+    if metrics is None:
+        metrics = extract_metrics(code, file_path)
     is_approximate = metrics.get('_approximate', False)
     
     # ====================================================================
     # DETECT CLASS TYPE (class, interface, enum, abstract_class)
     # This affects which smells apply (e.g., LazyClass doesn't apply to enums)
     # ====================================================================
-    class_type = "class"  # Default
-    if re.search(r'\benum\s+\w+', code):
-        class_type = "enum"
-    elif re.search(r'\binterface\s+\w+', code):
-        class_type = "interface"
-    elif re.search(r'\babstract\s+class\s+\w+', code):
-        class_type = "abstract_class"
+    class_type = detect_class_type(code)
     
     # Store class_type in metrics for use by callers (e.g., Unity)
     metrics['class_type'] = class_type
@@ -1036,30 +1344,41 @@ def predict_smell(code: str, models: Optional[Dict] = None,
     all_smells = []
     details = {'metrics': metrics, 'approximate_metrics': is_approximate, 'class_type': class_type}
     
+    # Text signal from raw code (CodeBERT substitute) - available in both modes
+    if text_proba is None:
+        text_proba = predict_text_proba(code, models)
+    if text_proba:
+        details['text_predictions'] = text_proba
+    
     # If we have real CK metrics, use ML model
     # If approximate (pasted code), use rule-based detection for better accuracy
     use_ml = models and 'scaler' in models and not is_approximate
-    
-    if use_ml:
-        features = add_derived_features(metrics)
-        features = np.nan_to_num(features, nan=0.0, posinf=0.0, neginf=0.0)
-        
-        X = features.reshape(1, -1)
-        X_scaled = models['scaler'].transform(X)
-        
-        # Get probabilities from ensemble
-        rf_proba = models['rf'].predict_proba(X_scaled)[0]
-        gb_proba = models['gb'].predict_proba(X_scaled)[0]
-        
-        if 'xgb' in models:
-            xgb_proba = models['xgb'].predict_proba(X_scaled)[0]
-            ensemble_proba = (rf_proba + gb_proba + xgb_proba) / 3
-        else:
-            ensemble_proba = (rf_proba + gb_proba) / 2
+    # Pasted code can still go through ML if the approximate-metrics model was trained
+    # (enums and interfaces keep their cheap structural rules below)
+    use_approx_ml = (models and 'approx' in models and is_approximate
+                     and class_type not in ("enum", "interface"))
+    
+    if use_ml or use_approx_ml:
+        if ml_proba is None:
+            text_row = None
+            if text_proba:
+                text_row = np.array([[text_proba[label] for label in models['text']['labels']]])
+            ml_proba = score_ml_batch(models, [metrics], approximate=bool(use_approx_ml),
+                                      text_proba=text_row)[0]
+        ensemble_proba = ml_proba
+        if use_approx_ml:
+            details['detection_mode'] = 'ml-approximate'
+        
+        # Shape metrics the primary-smell priority logic below relies on
+        code_loc = len(code.split('\n'))
+        methods = metrics.get('METHODS', 1)
+        wmc = metrics.get('WMC', 0)
+        max_method_loc = metrics.get('MAX_METHOD_LOC', 0)
+        statements_per_method = code.count(';') / max(methods, 1)
         
         # Map to smell names (use MODEL_SMELLS which matches training)
         for i, smell in enumerate(MODEL_SMELLS):
-            if ensemble_proba[i] > 0.1:  # Threshold
+            if ensemble_proba[i] > ML_SMELL_THRESHOLD:
                 all_smells.append((smell, float(ensemble_proba[i])))
         
         details['ml_predictions'] = {
@@ -1455,7 +1774,12 @@ def predict_smell(code: str, models: Optional[Dict] = None,
             is_feature_envy = True
         
         # Clean smell is already added earlier when is_clean_pattern is set
-    
+
+        # Text signal, blended per smell with the same weights as in the ML path
+        if text_proba:
+            all_smells = blend_text_confidences(all_smells, text_proba, models['text']['blend_weights'])
+            details['detection_mode'] = 'rule-based+text'
+
     # Extended smell detection
     if use_extended:
         extended = detect_extended_smells(code, metrics, class_type)
@@ -1619,6 +1943,171 @@ def predict_smell(code: str, models: Optional[Dict] = None,
     )
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# Batch Prediction (dense probability matrix)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class BatchPrediction:
+    """
+    Predictions for N classes as arrays.
+    
+    proba holds the MODEL_SMELLS scores per row: full ensemble probabilities
+    for ML-scored rows (ml_scored), rule confidences (0 where not detected)
+    otherwise.
+    Extended-detector hits are sparse, so they are stored CSR-style: the hits
+    of row i are extended_indices/extended_confidence[extended_indptr[i]:extended_indptr[i+1]],
+    with indices into extended_smells.
+    """
+    smells: List[str]                  # Columns of proba (MODEL_SMELLS)
+    proba: np.ndarray                  # (N, len(smells)) float32
+    ml_scored: np.ndarray              # (N,) bool, rows scored by the ML models
+    extended_smells: List[str]         # Vocabulary of extended-detector smells
+    extended_indptr: np.ndarray        # (N + 1,) int32 row offsets
+    extended_indices: np.ndarray       # (nnz,) int32 into extended_smells
+    extended_confidence: np.ndarray    # (nnz,) float32
+    primary_smells: List[str]
+    primary_confidence: np.ndarray     # (N,) float32
+    results: List[PredictionResult]    # Full per-row results (details, recommendations)
+    timings: Dict[str, float] = field(default_factory=dict)    # Seconds per stage (metrics, ml, detectors)
+    
+    def __len__(self) -> int:
+        return len(self.primary_smells)
+    
+    def extended_rows(self) -> np.ndarray:
+        """Row number of every stored extended hit."""
+        return np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.extended_indptr))
+    
+    def model_hits(self) -> np.ndarray:
+        """proba with sub-threshold ML probabilities zeroed (the smells reported in all_smells)."""
+        return np.where(self.ml_scored[:, None] & (self.proba <= ML_SMELL_THRESHOLD), 0.0, self.proba)
+    
+    def extended_dense(self) -> np.ndarray:
+        """(N, len(extended_smells)) confidence matrix, 0 where not detected."""
+        dense = np.zeros((len(self), len(self.extended_smells)), dtype=np.float32)
+        dense[self.extended_rows(), self.extended_indices] = self.extended_confidence
+        return dense
+    
+    def scores_for(self, smell: str) -> np.ndarray:
+        """(N,) confidence column for any model or extended smell."""
+        if smell in self.smells:
+            return self.model_hits()[:, self.smells.index(smell)]
+        if smell in self.extended_smells:
+            return self.extended_dense()[:, self.extended_smells.index(smell)]
+        return np.zeros(len(self), dtype=np.float32)
+    
+    def top_k(self, smell: str, k: int = 10) -> np.ndarray:
+        """Row indices of the k most confident detections of a smell."""
+        scores = self.scores_for(smell)
+        k = min(k, int((scores > 0).sum()))
+        if k == 0:
+            return np.array([], dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top], kind='stable')]
+    
+    def primary_counts(self) -> Dict[str, int]:
+        """How many rows have each primary smell."""
+        names, counts = np.unique(np.array(self.primary_smells, dtype=object), return_counts=True)
+        return {str(n): int(c) for n, c in zip(names, counts)}
+
+
+def predict_smell_batch(codes: List[str], models: Optional[Dict] = None,
+                        use_extended: bool = True,
+                        file_paths: Optional[List[Optional[str]]] = None,
+                        ck_metrics: Optional[List[Optional[Dict]]] = None) -> BatchPrediction:
+    """
+    Predict code smells for many classes at once.
+    
+    Metric extraction and the per-row rule/extended passes are unchanged, but
+    ML-eligible rows are scored together: one feature matrix, one
+    predict_proba call per ensemble member, one text-model pass. Each row's
+    PredictionResult is identical to what predict_smell would return.
+    
+    ck_metrics are the rows lookup_ck_metrics returned for file_paths when
+    the lookup already happened elsewhere (e.g. in the process that owns
+    an up-to-date CK store); by default they are looked up here.
+    """
+    n = len(codes)
+    file_paths = file_paths or [None] * n
+    started = time.perf_counter()
+    if ck_metrics is None:
+        ck_metrics = lookup_ck_metrics(codes, file_paths)
+    metrics_list = [row or extract_metrics(code) for code, row in zip(codes, ck_metrics)]
+    class_types = [detect_class_type(code) for code in codes]
+    metrics_done = time.perf_counter()
+    
+    text_matrix = predict_text_proba_batch(codes, models)
+    text_labels = models['text']['labels'] if text_matrix is not None else []
+    
+    # Route rows the way predict_smell would, then score each group in one call
+    ml_proba: List[Optional[np.ndarray]] = [None] * n
+    if models:
+        accurate_rows = [i for i in range(n)
+                         if 'scaler' in models and not metrics_list[i].get('_approximate', False)]
+        approx_rows = [i for i in range(n)
+                       if 'approx' in models and metrics_list[i].get('_approximate', False)
+                       and class_types[i] not in ("enum", "interface")]
+        for rows, approximate in ((accurate_rows, False), (approx_rows, True)):
+            if not rows:
+                continue
+            scored = score_ml_batch(models, [metrics_list[i] for i in rows], approximate=approximate,
+                                    text_proba=text_matrix[rows] if text_matrix is not None else None)
+            for i, row in zip(rows, scored):
+                ml_proba[i] = row
+    
+    ml_done = time.perf_counter()
+    
+    # Rules and extended detectors run per row
+    results = []
+    for i, code in enumerate(codes):
+        text_proba = None
+        if text_matrix is not None:
+            text_proba = {label: float(p) for label, p in zip(text_labels, text_matrix[i])}
+        results.append(predict_smell(code, models, use_extended=use_extended, file_path=file_paths[i],
+                                     metrics=metrics_list[i], ml_proba=ml_proba[i],
+                                     text_proba=text_proba))
+    timings = {"metrics": metrics_done - started, "ml": ml_done - metrics_done,
+               "detectors": time.perf_counter() - ml_done}
+    
+    # Dense model-smell matrix
+    proba = np.zeros((n, len(MODEL_SMELLS)), dtype=np.float32)
+    smell_col = {smell: j for j, smell in enumerate(MODEL_SMELLS)}
+    for i, result in enumerate(results):
+        if ml_proba[i] is not None:
+            proba[i] = ml_proba[i]
+        else:
+            for smell, conf in result.all_smells:
+                if smell in smell_col:
+                    proba[i, smell_col[smell]] = max(proba[i, smell_col[smell]], conf)
+    
+    # Sparse extended hits (max confidence per smell, as in all_smells)
+    extended_vocab: Dict[str, int] = {}
+    indptr, indices, confidence = [0], [], []
+    for result in results:
+        row_hits: Dict[int, float] = {}
+        for smell, conf, _ in result.details.get('extended_smells', []):
+            j = extended_vocab.setdefault(smell, len(extended_vocab))
+            row_hits[j] = max(row_hits.get(j, 0.0), conf)
+        for j in sorted(row_hits):
+            indices.append(j)
+            confidence.append(row_hits[j])
+        indptr.append(len(indices))
+    
+    return BatchPrediction(
+        smells=list(MODEL_SMELLS),
+        proba=proba,
+        ml_scored=np.array([p is not None for p in ml_proba], dtype=bool),
+        extended_smells=list(extended_vocab),
+        extended_indptr=np.array(indptr, dtype=np.int32),
+        extended_indices=np.array(indices, dtype=np.int32),
+        extended_confidence=np.array(confidence, dtype=np.float32),
+        primary_smells=[r.primary_smell for r in results],
+        primary_confidence=np.array([r.primary_confidence for r in results], dtype=np.float32),
+        results=results,
+        timings=timings,
+    )
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # Backwards Compatible Wrapper (for test scripts)
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -1652,7 +2141,9 @@ def display_result(result: PredictionResult, class_name: str = ""):
         print(f"📄 Analysis for: {color(class_name, Colors.CYAN, Colors.BOLD)}")
     
     # Show detection mode
-    if result.details.get('approximate_metrics'):
+    if result.details.get('detection_mode') == 'ml-approximate':
+        print(f"   {color('(Using approximate-metrics ML model for pasted code)', Colors.DIM)}")
+    elif result.details.get('approximate_metrics'):
         print(f"   {color('(Using rule-based detection for pasted code)', Colors.DIM)}")
     print("=" * 70)
     
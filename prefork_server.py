@@ -0,0 +1,352 @@
+"""
+🍴 PREFORK SERVER
+==================
+Production serving mode for the API (python api_server.py --prod).
+
+The parent process imports the app - models, CK snapshot and every other
+module-level cache are loaded once - freezes the garbage collector's view
+of those objects and then forks the workers, so all workers share the
+loaded pages copy-on-write instead of each holding its own copy.
+
+Workers accept connections from one shared listening socket (threaded
+werkzeug servers, no debugger or reloader) and are recycled after
+max_requests requests to bound memory creep; the parent replaces every
+worker that exits.
+
+Workers share nothing after the fork: whatever an app keeps in memory
+while serving stays in the worker that built it. Requests that read or
+write such state (for the API: async jobs, city versions and district
+layouts, single-flight repository analyses, CK precompute) are "pinned":
+whichever worker accepts them forwards them over a Unix socket to worker
+0, the primary, so they all see one copy of that state. Everything else
+is served by the worker that accepted it. Recycling the primary starts
+its state over from the parent's, as a restart would.
+"""
+
+import gc
+import os
+import random
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import http.client
+from urllib.parse import quote
+from typing import Callable, Dict, Iterator, Optional
+
+from werkzeug.serving import make_server
+
+# Seconds between a worker's checks whether it should be recycled
+POLL_INTERVAL_S = 1.0
+
+# Bytes read at a time from request and response bodies forwarded to the primary
+PROXY_CHUNK = 64 * 1024
+
+# Hop-by-hop headers apply to one connection and are never forwarded
+HOP_BY_HOP = frozenset({"connection", "keep-alive", "proxy-connection", "proxy-authenticate",
+                        "proxy-authorization", "te", "trailer", "transfer-encoding", "upgrade"})
+
+
+class _RequestCounter:
+    """WSGI middleware counting started and in-progress requests."""
+
+    def __init__(self, app):
+        self.app = app
+        self.served = 0
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.served += 1
+            self.active += 1
+        try:
+            body = self.app(environ, start_response)
+        except BaseException:
+            self._finished()
+            raise
+        return _ClosingBody(body, self._finished)
+
+    def _finished(self):
+        with self._lock:
+            self.active -= 1
+
+
+class _ClosingBody:
+    """Response iterable that reports when the server has closed it (streams included)."""
+
+    def __init__(self, body, on_close: Callable[[], None]):
+        self.body = body
+        self.on_close = on_close
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        try:
+            if hasattr(self.body, "close"):
+                self.body.close()
+        finally:
+            self.on_close()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Forwarding pinned requests to the primary worker
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection to a server listening on a Unix socket."""
+
+    def __init__(self, socket_path: str):
+        super().__init__("localhost")
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+class _PrimaryProxy:
+    """
+    WSGI middleware forwarding pinned requests to the primary worker.
+
+    Request and response bodies are streamed in both directions, so
+    uploads without a Content-Length, NDJSON and server-sent events pass
+    through unchanged.
+
+    Args:
+        app: The WSGI application, for requests that are not pinned
+        pinned: pinned(environ) is true for requests the primary serves
+        socket_path: Unix socket the primary listens on
+    """
+
+    def __init__(self, app, pinned: Callable[[dict], bool], socket_path: str):
+        self.app = app
+        self.pinned = pinned
+        self.socket_path = socket_path
+
+    def __call__(self, environ, start_response):
+        if not self.pinned(environ):
+            return self.app(environ, start_response)
+        conn = _UnixHTTPConnection(self.socket_path)
+        try:
+            conn.request(environ["REQUEST_METHOD"], _request_target(environ),
+                         body=_request_body(environ), headers=_request_headers(environ))
+            response = conn.getresponse()
+        except BaseException:
+            conn.close()
+            raise
+        headers = [(name, value) for name, value in response.getheaders() if name.lower() not in HOP_BY_HOP]
+        start_response(f"{response.status} {response.reason}", headers)
+        return _ProxiedBody(response, conn)
+
+
+class _ProxiedBody:
+    """The primary's response body, relayed as it arrives."""
+
+    def __init__(self, response: http.client.HTTPResponse, conn: http.client.HTTPConnection):
+        self.response = response
+        self.conn = conn
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            chunk = self.response.read1(PROXY_CHUNK)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self.response.close()
+        self.conn.close()
+
+
+def _request_target(environ) -> str:
+    target = environ.get("REQUEST_URI")               # Set by werkzeug: path and query as received
+    if target:
+        return target
+    path = quote((environ.get("SCRIPT_NAME", "") + environ.get("PATH_INFO", "")).encode("latin-1"))
+    query = environ.get("QUERY_STRING")
+    return f"{path}?{query}" if query else path
+
+
+def _request_headers(environ) -> Dict[str, str]:
+    headers = {key[5:].replace("_", "-").title(): value
+               for key, value in environ.items() if key.startswith("HTTP_")}
+    headers = {name: value for name, value in headers.items() if name.lower() not in HOP_BY_HOP}
+    for key, name in (("CONTENT_TYPE", "Content-Type"), ("CONTENT_LENGTH", "Content-Length")):
+        if environ.get(key):
+            headers[name] = environ[key]
+    if environ.get("REMOTE_ADDR"):
+        headers["X-Forwarded-For"] = environ["REMOTE_ADDR"]
+    return headers
+
+
+def _request_body(environ) -> Optional[Iterator[bytes]]:
+    """Request body as chunks (without a Content-Length it is sent chunked), None if there is none."""
+    stream = environ["wsgi.input"]
+    if environ.get("CONTENT_LENGTH"):
+        remaining = int(environ["CONTENT_LENGTH"])
+
+        def sized() -> Iterator[bytes]:
+            nonlocal remaining
+            while remaining > 0:
+                chunk = stream.read(min(PROXY_CHUNK, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+        return sized()
+    if environ.get("wsgi.input_terminated"):
+        return iter(lambda: stream.read(PROXY_CHUNK), b"")
+    return None
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Workers
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _make_server(sock: socket.socket, app):
+    """Threaded werkzeug server accepting from an already listening socket."""
+    if sock.family == socket.AF_UNIX:
+        host, port = f"unix://{sock.getsockname()}", 0
+    else:
+        host, port = sock.getsockname()[:2]
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    server.daemon_threads = False        # server_close() waits for accepted connections
+    return server
+
+
+def _worker(app, sock: socket.socket, max_requests: int, can_recycle: Callable[[], bool],
+            primary_sock: Optional[socket.socket] = None):
+    """
+    Serve from the shared socket until max_requests were served and recycling is safe.
+
+    The primary also serves the requests other workers forward on primary_sock.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)            # Parent handles Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    counter = _RequestCounter(app)
+    server = _make_server(sock, counter)
+    server.timeout = POLL_INTERVAL_S
+    forwarded = None
+    if primary_sock is not None:
+        forwarded = _make_server(primary_sock, counter)
+        threading.Thread(target=forwarded.serve_forever, args=(POLL_INTERVAL_S,), daemon=True).start()
+    try:
+        while not (max_requests and counter.served >= max_requests and counter.active == 0 and can_recycle()):
+            server.handle_request()
+    finally:
+        if forwarded is not None:
+            forwarded.shutdown()
+            forwarded.server_close()
+        server.server_close()
+
+
+def serve(app, host: str = "0.0.0.0", port: int = 5000, workers: Optional[int] = None,
+          max_requests: int = 1000, max_requests_jitter: int = 100,
+          can_recycle: Callable[[], bool] = lambda: True,
+          pinned: Optional[Callable[[dict], bool]] = None,
+          post_fork: Callable[[int], None] = lambda slot: None, worker_exit: Callable[[], None] = lambda: None):
+    """
+    Run app on preforked worker processes until SIGINT/SIGTERM.
+
+    Args:
+        app: WSGI application, fully initialized (imported before forking)
+        host, port: Address to listen on
+        workers: Worker processes (default: CPU count)
+        max_requests: Requests after which a worker is replaced (0: never)
+        max_requests_jitter: Random extra requests per worker, so workers
+            are not all recycled at the same moment
+        can_recycle: Checked in the worker before it exits for recycling
+            (e.g. no background jobs running)
+        pinned: pinned(environ) is true for requests that depend on the
+            app's in-memory state; they are all served by the primary
+            worker. None: every worker serves every request.
+        post_fork: Called in every worker with its slot before it starts
+            serving (slot 0 is the primary when requests are pinned)
+        worker_exit: Called in every worker right before it exits
+    """
+    workers = workers or os.cpu_count() or 1
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    # The parent owns the primary's socket, so forwarded requests wait in
+    # its backlog while the primary is being replaced
+    socket_dir = primary_sock = None
+    if pinned is not None and workers > 1:
+        socket_dir = tempfile.mkdtemp(prefix="prefork-")
+        primary_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        primary_sock.bind(os.path.join(socket_dir, "primary.sock"))
+        primary_sock.listen(128)
+        forwarding_app = _PrimaryProxy(app, pinned, primary_sock.getsockname())
+
+    # Objects loaded so far are never collected; keeping the collector away
+    # from them stops it from dirtying (and so copying) the shared pages
+    gc.collect()
+    gc.freeze()
+
+    children: Dict[int, int] = {}             # pid -> worker slot
+    stopping = False
+
+    def spawn(slot: int):
+        limit = max_requests + random.randint(0, max_requests_jitter) if max_requests else 0
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                post_fork(slot)
+                if primary_sock is None:
+                    _worker(app, sock, limit, can_recycle)
+                elif slot == 0:
+                    _worker(app, sock, limit, can_recycle, primary_sock)
+                else:
+                    _worker(forwarding_app, sock, limit, can_recycle)
+            except SystemExit:
+                pass
+            except BaseException as e:
+                print(f"⚠️ Worker {os.getpid()} crashed: {e}")
+                code = 1
+            finally:
+                try:
+                    worker_exit()
+                except BaseException as e:
+                    print(f"⚠️ Worker {os.getpid()} exit hook failed: {e}")
+                sys.stdout.flush()
+                os._exit(code)
+        children[pid] = slot
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for slot in range(workers):
+        spawn(slot)
+    print(f"✓ {workers} workers serving on http://{host}:{port} (recycled every ~{max_requests} requests)")
+
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            spawn(slot)
+    sock.close()
+    if primary_sock is not None:
+        primary_sock.close()
+        shutil.rmtree(socket_dir, ignore_errors=True)
@@ -0,0 +1,334 @@
+"""
+📈 SERVER METRICS
+==================
+Minimal Prometheus text-format exporter for the API server, without the
+prometheus_client dependency.
+
+Counters and histograms are updated in place (one lock and a bisect per
+observation); callback metrics read their values from the server's own
+stats (lane load, job queue, caches) only when /metrics is scraped.
+
+Every process keeps its own numbers. Preforked workers (--prod) also
+share them through a directory, like prometheus_client's multiprocess
+mode: each worker writes a snapshot of its values there every
+SHARE_INTERVAL_S and a scrape adds up all workers' snapshots. Counts of
+workers that have exited stay in the totals, their gauges do not.
+"""
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers snippet requests (ms) up to large repository analyses (minutes)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Seconds between the snapshots a worker writes for scrapes answered by another worker
+SHARE_INTERVAL_S = 1.0
+
+LabelValues = Tuple[str, ...]
+# Counter/gauge value, or a histogram's per bucket counts + [+Inf, sum]
+Value = Union[float, List[float]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class Counter:
+    """Monotonic count per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def values(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self, values: Dict[LabelValues, float]) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in sorted(values.items())]
+
+
+class Histogram:
+    """Bucketed distribution (plus sum and count) per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[LabelValues, List[float]] = {}      # per bucket counts + [+Inf, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[idx] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of the with-block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def values(self) -> Dict[LabelValues, List[float]]:
+        with self._lock:
+            return {key: list(values) for key, values in self._series.items()}
+
+    def samples(self, series: Dict[LabelValues, List[float]]) -> List[str]:
+        lines = []
+        for key, values in sorted(series.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_number(cumulative)}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(values[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {_number(cumulative)}")
+        return lines
+
+
+class Callback:
+    """
+    Gauge or counter whose values come from fn() at scrape time.
+
+    fn returns a number (no labels) or {label values tuple: number}.
+    """
+
+    def __init__(self, name: str, help_text: str, kind: str, labelnames: Sequence[str],
+                 fn: Callable[[], Union[float, Dict[LabelValues, float]]]):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+
+    def values(self) -> Dict[LabelValues, float]:
+        values = self.fn()
+        return values if isinstance(values, dict) else {(): values}
+
+    def samples(self, values: Dict[LabelValues, float]) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in sorted(values.items())]
+
+
+class Registry:
+    """All metrics of the process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: List = []
+        self._shared: Optional[SharedValues] = None
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str], fn) -> Callback:
+        return self._add(Callback(name, help_text, "gauge", labelnames, fn))
+
+    def counter_callback(self, name: str, help_text: str, labelnames: Sequence[str], fn) -> Callback:
+        return self._add(Callback(name, help_text, "counter", labelnames, fn))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def values(self) -> Dict[str, Dict[LabelValues, Value]]:
+        """Current values of every metric, by metric name."""
+        return {metric.name: metric.values() for metric in self._metrics}
+
+    def share(self, directory: Path):
+        """
+        Add up this process's values with the other processes sharing directory.
+
+        Called in every preforked worker after the fork; unshare() before it exits.
+        """
+        self._shared = SharedValues(self, directory)
+        self._shared.start()
+
+    def unshare(self):
+        """Hand this process's counts over to the shared totals and stop sharing."""
+        if self._shared is not None:
+            self._shared.stop()
+            self._shared = None
+
+    def render(self) -> str:
+        values = self.values()
+        if self._shared is not None:
+            for name, others in self._shared.collect().items():
+                for key, value in others.items():
+                    _add(values.setdefault(name, {}), key, value)
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples(values.get(metric.name, {})))
+        return "\n".join(lines) + "\n"
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Sharing across preforked workers
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _add(totals: Dict[LabelValues, Value], key: LabelValues, value: Value):
+    current = totals.get(key)
+    if current is None:
+        totals[key] = list(value) if isinstance(value, list) else value
+    elif isinstance(current, list):
+        totals[key] = [a + b for a, b in zip(current, value)]
+    else:
+        totals[key] = current + value
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedValues:
+    """
+    Snapshot files of the processes sharing one registry layout.
+
+    <pid>.json holds a live worker's values (rewritten every
+    SHARE_INTERVAL_S); retired.json the counters and histograms of the
+    workers that have exited. Folding a worker into retired.json and
+    reading the files both hold retired.lock, so no count is read twice.
+    """
+
+    RETIRED = "retired.json"
+
+    def __init__(self, registry: Registry, directory: Path):
+        self.registry = registry
+        self.directory = Path(directory)
+        self.pid = os.getpid()
+        self._kinds = {metric.name: metric.kind for metric in registry._metrics}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.flush()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        with self._locked():
+            self._retire(self.pid)
+
+    def _run(self):
+        while not self._stop.wait(SHARE_INTERVAL_S):
+            self.flush()
+
+    def flush(self):
+        """Write this process's current values to <pid>.json."""
+        self._write(self.directory / f"{self.pid}.json", self.registry.values())
+
+    def collect(self) -> Dict[str, Dict[LabelValues, Value]]:
+        """Values of all other processes, live or exited, added up."""
+        totals: Dict[str, Dict[LabelValues, Value]] = {}
+        with self._locked():
+            for path in self.directory.glob("*.json"):
+                if not path.stem.isdigit() or int(path.stem) == self.pid:
+                    continue
+                if _alive(int(path.stem)):
+                    self._merge(totals, self._read(path))
+                else:
+                    self._retire(int(path.stem))           # Exited without unshare() (killed)
+            self._merge(totals, self._read(self.directory / self.RETIRED))
+        return totals
+
+    def _retire(self, pid: int):
+        path = self.directory / f"{pid}.json"
+        if not path.exists():
+            return
+        retired = self._read(self.directory / self.RETIRED)
+        counts = {name: values for name, values in self._read(path).items()
+                  if self._kinds.get(name) in ("counter", "histogram")}
+        self._merge(retired, counts)
+        self._write(self.directory / self.RETIRED, retired)
+        path.unlink()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(self.directory / "retired.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _merge(totals: Dict[str, Dict[LabelValues, Value]], values: Dict[str, Dict[LabelValues, Value]]):
+        for name, series in values.items():
+            merged = totals.setdefault(name, {})
+            for key, value in series.items():
+                _add(merged, key, value)
+
+    @staticmethod
+    def _read(path: Path) -> Dict[str, Dict[LabelValues, Value]]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {name: {tuple(key): value for key, value in series} for name, series in data.items()}
+
+    @staticmethod
+    def _write(path: Path, values: Dict[str, Dict[LabelValues, Value]]):
+        data = {name: [[list(key), value] for key, value in series.items()] for name, series in values.items()}
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f"{path.stem}.", suffix=".tmp")
+        with open(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
@@ -0,0 +1,66 @@
+"""
+🛫 SINGLE FLIGHT
+=================
+Coalesces identical concurrent computations: while a call for a key is in
+flight, further calls with the same key wait for it and share its result
+(or its exception) instead of running the work again.
+
+Nothing is cached once the call returns; repeated requests for unchanged
+content are answered with ETags / 304 by the API server instead.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    """One in-flight computation and its outcome."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Registry of in-flight calls, keyed by what they compute."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        Run fn(*args, **kwargs) unless a call for key is already running.
+
+        Returns:
+            (result, shared) - shared is True when the result came from
+            another caller's computation
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        """Number of distinct computations currently running."""
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+City Payload Benchmark
+Compares the JSON city layout with the binary columnar encoding
+(city_codec) on a synthetic city: payload size (raw and gzipped), encode
+time, and client parse time - json.loads, the zero-copy column view a
+columnar client uses, and a full rebuild of the dicts. Also checks that
+the binary payload round-trips to the same city.
+
+Usage:
+    python tests/bench_city_codec.py                  [5,000 buildings]
+    python tests/bench_city_codec.py --buildings 20000
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gzip
+import json
+import math
+import random
+import time
+
+import city_codec
+
+SMELLS = ["Clean", "GodClass", "LongMethod", "DataClass", "FeatureEnvy", "DeadCode", "MagicNumbers",
+          "SwallowedException", "GlobalMutableState", "BadNaming", "GodMethod", "RawCollections"]
+RECOMMENDATIONS = {
+    'GodClass': 'Split into smaller, focused classes (Single Responsibility)',
+    'LongMethod': 'Break down into smaller methods with clear names',
+    'DataClass': 'Move behavior to this class or use a record/struct',
+    'FeatureEnvy': 'Move this method to the class it uses most',
+    'DeadCode': 'Remove unused code to improve maintainability',
+    'MagicNumbers': 'Replace magic numbers with named constants',
+    'SwallowedException': 'Log or handle exceptions properly',
+    'GlobalMutableState': 'Use encapsulation and dependency injection',
+    'BadNaming': 'Use descriptive, meaningful names',
+    'GodMethod': 'Split method into smaller focused methods',
+    'RawCollections': 'Add generic type parameters to collections',
+}
+WORDS = ["User", "Order", "Builder", "Factory", "Service", "Manager", "Handler", "Parser", "Config", "Cache"]
+
+
+def synthetic_city(n: int) -> dict:
+    """City dict shaped like the /analyze/repo response."""
+    rng = random.Random(42)
+    buildings = []
+    for i in range(n):
+        name = rng.choice(WORDS) + rng.choice(WORDS) + str(i)
+        smells = rng.sample(SMELLS[1:], rng.choice([0, 0, 1, 1, 2, 3]))
+        primary = smells[0] if smells else "Clean"
+        all_smells = [{"name": s, "confidence": round(rng.uniform(0.5, 0.99), 3), "is_primary": s == primary}
+                      for s in smells]
+        if "MagicNumbers" in smells:
+            all_smells[smells.index("MagicNumbers")]["description"] = \
+                f"Found magic numbers: {rng.randint(2, 999)}, {rng.randint(2, 999)}"
+        buildings.append({
+            "class_name": name,
+            "file_path": f"src/main/java/org/example/module{i % 40}/{name}.java",
+            "color": rng.randint(0, 0xFFFFFF),
+            "quality_score": round(rng.random(), 3),
+            "primary_smell": primary,
+            "smell_confidence": round(rng.uniform(0.5, 0.99), 3),
+            "all_smells": all_smells,
+            "loc": rng.randint(10, 2000), "wmc": rng.randint(1, 120), "cbo": rng.randint(0, 30),
+            "dit": rng.randint(0, 5), "rfc": rng.randint(1, 200), "lcom": round(rng.random() * 40, 3),
+            "recommendations": [RECOMMENDATIONS[s] for s in smells],
+        })
+    names = [b["class_name"] for b in buildings]
+    city = {"buildings": buildings}
+    for kind, rel_type in [("inheritance", "extends"), ("associations", "uses"), ("compositions", "has"),
+                           ("dependencies", "depends"), ("aggregations", "aggregates")]:
+        city[kind] = [{"from": rng.choice(names), "to": rng.choice(names), "type": rel_type}
+                      for _ in range(n // 2)]
+    clean = sum(b["primary_smell"] == "Clean" for b in buildings)
+    city.update({"total_classes": n, "clean_count": clean, "smell_count": n - clean,
+                 "average_quality": round(sum(b["quality_score"] for b in buildings) / n, 3),
+                 "ck_metrics": {"state": "ready", "files": n, "classes": n, "seconds": 1.5}})
+    return city
+
+
+def same(a, b) -> bool:
+    """Deep equality with float32 tolerance."""
+    if isinstance(a, float) or isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-6, abs_tol=1e-6)
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(same(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    """Fastest of repeat runs, in ms."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times)
+
+
+def run_benchmark(n: int) -> bool:
+    print("=" * 70)
+    print(f"CITY PAYLOAD BENCHMARK ({n:,} buildings)")
+    print("=" * 70)
+
+    city = synthetic_city(n)
+    as_json = json.dumps(city, separators=(",", ":")).encode("utf-8")
+    as_binary = city_codec.encode(city)
+
+    print(f"\n📦 Payload size          JSON {len(as_json) / 1e6:8.2f} MB   binary {len(as_binary) / 1e6:8.2f} MB"
+          f"   ({len(as_json) / len(as_binary):.1f}x smaller)")
+    gz_json, gz_binary = len(gzip.compress(as_json)), len(gzip.compress(as_binary))
+    print(f"   gzipped              JSON {gz_json / 1e6:8.2f} MB   binary {gz_binary / 1e6:8.2f} MB"
+          f"   ({gz_json / gz_binary:.1f}x smaller)")
+
+    print(f"\n⏱️  Encode                JSON {best_of(lambda: json.dumps(city, separators=(',', ':'))):8.1f} ms"
+          f"   binary {best_of(lambda: city_codec.encode(city)):8.1f} ms")
+    json_ms = best_of(lambda: json.loads(as_json))
+    columns_ms = best_of(lambda: city_codec.decode_columns(as_binary))
+    decode_ms = best_of(lambda: city_codec.decode(as_binary))
+    print(f"   Parse                JSON {json_ms:8.1f} ms   binary columns {columns_ms:8.2f} ms"
+          f"   ({json_ms / columns_ms:.0f}x faster)")
+    print(f"   Rebuild dicts                       binary {decode_ms:8.1f} ms")
+
+    ok = same(city_codec.decode(as_binary), city)
+    print(f"\n{'✅' if ok else '❌'} Round trip {'matches' if ok else 'DIFFERS from'} the JSON city")
+    return ok and len(as_binary) < len(as_json)
+
+
+if __name__ == "__main__":
+    buildings = 5000
+    if "--buildings" in sys.argv:
+        idx = sys.argv.index("--buildings")
+        if idx + 1 < len(sys.argv):
+            buildings = int(sys.argv[idx + 1])
+    sys.exit(0 if run_benchmark(buildings) else 1)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+City Layout Benchmark
+Times the server-side squarified treemap (city_layout) on a synthetic
+city: a fresh layout, a repeat request for the same city version, and a
+new version where a few buildings changed. Also checks the layout itself:
+every building inside its district, districts inside the city, no
+overlapping buildings, and footprints proportional to LOC/WMC within a
+district.
+
+Usage:
+    python tests/bench_city_layout.py                  [5,000 buildings, 40 packages]
+    python tests/bench_city_layout.py --buildings 20000 --packages 200
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import random
+import time
+
+import numpy as np
+
+from city_layout import CityLayoutCache, footprint_areas
+
+EPS = 1e-3
+
+
+def synthetic_buildings(n: int, packages: int):
+    rng = random.Random(42)
+    paths = [f"src/main/java/org/example/module{rng.randrange(packages)}/Class{i}.java" for i in range(n)]
+    loc = [rng.randint(10, 2000) for _ in range(n)]
+    wmc = [rng.randint(1, 120) for _ in range(n)]
+    return paths, loc, wmc
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def check_layout(layout: dict, loc, wmc) -> list:
+    """Problems found in a layout (empty list: valid)."""
+    problems = []
+    cols = layout["buildings"]
+    rects = np.column_stack([cols["x"], cols["z"], cols["width"], cols["depth"]])
+    district_of = np.array(cols["district"])
+    side = layout["width"]
+
+    def inside(inner, outer) -> bool:
+        return (inner[:, 0] >= outer[0] - EPS).all() and (inner[:, 1] >= outer[1] - EPS).all() and \
+               (inner[:, 0] + inner[:, 2] <= outer[0] + outer[2] + EPS).all() and \
+               (inner[:, 1] + inner[:, 3] <= outer[1] + outer[3] + EPS).all()
+
+    plots = np.array([[d["x"], d["z"], d["width"], d["depth"]] for d in layout["districts"]])
+    if not inside(plots, (0.0, 0.0, side, side)):
+        problems.append("district outside the city")
+    areas = footprint_areas(loc, wmc)
+    for d, plot in enumerate(plots):
+        members = rects[district_of == d]
+        if not inside(members, plot):
+            problems.append(f"building outside district {layout['districts'][d]['name']}")
+        # Pairwise overlap within the district
+        x0, z0 = members[:, 0], members[:, 1]
+        x1, z1 = x0 + members[:, 2], z0 + members[:, 3]
+        overlap_x = np.minimum(x1[:, None], x1[None, :]) - np.maximum(x0[:, None], x0[None, :])
+        overlap_z = np.minimum(z1[:, None], z1[None, :]) - np.maximum(z0[:, None], z0[None, :])
+        overlapping = (overlap_x > EPS) & (overlap_z > EPS)
+        np.fill_diagonal(overlapping, False)
+        if overlapping.any():
+            problems.append(f"overlapping buildings in {layout['districts'][d]['name']}")
+        # Footprint per unit of LOC/WMC area is the same for every building of a district
+        ratio = members[:, 2] * members[:, 3] / areas[district_of == d]
+        if len(ratio) and ratio.max() - ratio.min() > 0.01 * ratio.max() + EPS:
+            problems.append(f"footprints not proportional in {layout['districts'][d]['name']}")
+    return problems
+
+
+def aspect_ratios(layout: dict) -> np.ndarray:
+    cols = layout["buildings"]
+    short = np.maximum(np.minimum(cols["width"], cols["depth"]), EPS)
+    return np.maximum(cols["width"], cols["depth"]) / short
+
+
+def run_benchmark(n: int, packages: int) -> bool:
+    print("=" * 70)
+    print(f"CITY LAYOUT BENCHMARK ({n:,} buildings, {packages} packages)")
+    print("=" * 70)
+
+    paths, loc, wmc = synthetic_buildings(n, packages)
+    cache = CityLayoutCache()
+
+    first, fresh_ms = timed(lambda: cache.layout("repo", "v1", paths, loc, wmc))
+    _, cached_ms = timed(lambda: cache.layout("repo", "v1", paths, loc, wmc))
+
+    # A few edited files: only their districts are laid out again
+    edited_loc = list(loc)
+    for i in random.Random(7).sample(range(n), 5):
+        edited_loc[i] += 40
+    second, incremental_ms = timed(lambda: cache.layout("repo", "v2", paths, edited_loc, wmc))
+
+    print(f"\n⏱️  Fresh layout          {fresh_ms:8.2f} ms   ({first['recomputed_districts']} districts)")
+    print(f"   Same version          {cached_ms:8.3f} ms   (cached)")
+    print(f"   5 buildings changed   {incremental_ms:8.2f} ms   ({second['recomputed_districts']} districts recomputed)")
+
+    print("\n🔍 Layout checks")
+    problems = check_layout(first, loc, wmc) + check_layout(second, edited_loc, wmc)
+    aspect = aspect_ratios(first)
+    print(f"   aspect ratio          median {np.median(aspect):.2f}   p95 {np.percentile(aspect, 95):.2f}")
+    kept = first["districts"] == second["districts"]
+    print(f"   district plots kept after the edit: {'yes' if kept else 'no'}")
+    for problem in problems:
+        print(f"   ❌ {problem}")
+    ok = not problems and kept and second["recomputed_districts"] <= 5
+    print(f"\n{'✅' if ok else '❌'} Layout {'valid' if ok else 'INVALID'}")
+    return ok
+
+
+if __name__ == "__main__":
+    buildings, packages = 5000, 40
+    if "--buildings" in sys.argv:
+        idx = sys.argv.index("--buildings")
+        if idx + 1 < len(sys.argv):
+            buildings = int(sys.argv[idx + 1])
+    if "--packages" in sys.argv:
+        idx = sys.argv.index("--packages")
+        if idx + 1 < len(sys.argv):
+            packages = int(sys.argv[idx + 1])
+    sys.exit(0 if run_benchmark(buildings, packages) else 1)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+CK Metrics Memory Benchmark
+Compares the memory held by the old whole-CSV dict cache (every
+csv.DictReader row kept as strings, stored under two keys) with the
+CKSnapshot served by ck_store (float32 values, interned keys).
+
+Usage:
+    python tests/bench_ck_memory.py              [100,000 synthetic classes]
+    python tests/bench_ck_memory.py --rows 20000
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import csv
+import gc
+import random
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import ck_store
+
+PROJECTS = ["spring-framework", "guava", "hibernate-orm", "commons-lang", "apache-tomcat",
+            "log4j2", "mybatis", "gson", "picocli", "apache-maven"]
+CLASS_WORDS = ["User", "Order", "Builder", "Factory", "Service", "Manager", "Handler", "Parser",
+               "Config", "Utils", "Cache", "Request", "Response", "Event", "Listener", "Adapter"]
+
+
+def write_corpus(path: Path, n_rows: int):
+    """Synthetic CK CSV with realistic path/package structure (Windows and POSIX roots)."""
+    rng = random.Random(42)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file_path', 'class_name', 'package'] + ck_store.CK_COLS)
+        for i in range(n_rows):
+            project = rng.choice(PROJECTS)
+            package = f"org.{project.split('-')[0]}.module{rng.randint(0, 40)}.sub{rng.randint(0, 8)}"
+            class_name = rng.choice(CLASS_WORDS) + rng.choice(CLASS_WORDS) + str(i % 997)
+            if i % 3 == 0:
+                root = f"D:\\University Material\\projects\\{project}\\src\\main\\java\\"
+                file_path = root + package.replace('.', '\\') + f"\\{class_name}.java"
+            else:
+                root = f"/home/dev/code_smell_project/projects/{project}/src/main/java/"
+                file_path = root + package.replace('.', '/') + f"/{class_name}.java"
+            metrics = [rng.randint(10, 2000), rng.randint(1, 200), rng.randint(1, 60), rng.randint(0, 30),
+                       rng.randint(0, 20), rng.randint(0, 40), rng.randint(1, 6), rng.random() * 50,
+                       rng.random(), rng.randint(0, 30), rng.randint(1, 300), rng.randint(0, 5)]
+            writer.writerow([file_path, class_name, package] + metrics)
+
+
+def legacy_cache(csv_file: Path) -> dict:
+    """The previous load_ck_metrics_cache(): DictReader rows keyed by file name and class name."""
+    cache = {}
+    with open(csv_file, 'r', encoding='utf-8', errors='ignore') as f:
+        for row in csv.DictReader(f):
+            file_path = row.get('file_path', '')
+            class_name = row.get('class_name', '')
+            if file_path:
+                cache[Path(file_path).name.lower()] = row
+                if class_name:
+                    cache[class_name.lower() + '.java'] = row
+    return cache
+
+
+def measure(build):
+    """(object, retained bytes, seconds) for build()."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    obj = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, retained, elapsed
+
+
+def run_benchmark(n_rows: int):
+    print("=" * 70)
+    print(f"CK METRICS MEMORY BENCHMARK ({n_rows:,} classes)")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ck_dir = Path(tmp)
+        csv_file = ck_dir / "bench_ck.csv"
+        write_corpus(csv_file, n_rows)
+        print(f"CSV size: {csv_file.stat().st_size / 1e6:.1f} MB")
+
+        legacy, legacy_bytes, legacy_s = measure(lambda: legacy_cache(csv_file))
+        print(f"\n📦 Legacy dict cache:  {legacy_bytes / 1e6:8.1f} MB  (built in {legacy_s:.2f}s)")
+
+        store = ck_store.CKMetricsStore(ck_dir)
+        start = time.perf_counter()
+        store.refresh()                      # First build also parses the CSV into SQLite
+        index_s = time.perf_counter() - start
+        store._snapshot = None               # Measure the snapshot on its own
+        conn = store._conn()
+        query = f"SELECT file_path, package, class_key, {', '.join(ck_store.CK_COLS)} FROM metrics ORDER BY id"
+        snapshot, snapshot_bytes, snapshot_s = measure(lambda: ck_store.CKSnapshot(conn.execute(query)))
+        print(f"🗄️  CKSnapshot:         {snapshot_bytes / 1e6:8.1f} MB  (built in {snapshot_s:.2f}s, "
+              f"SQLite index {index_s:.2f}s)")
+        print(f"   of which arrays:   {snapshot.nbytes() / 1e6:8.1f} MB")
+        print(f"\n📉 Reduction: {legacy_bytes / max(snapshot_bytes, 1):.1f}x")
+
+        # Lookup cost (legacy also had to convert 12 strings per hit)
+        rng = random.Random(7)
+        names = rng.sample(list(legacy.keys()), min(20000, len(legacy)))
+        start = time.perf_counter()
+        for name in names:
+            row = legacy[name]
+            {col: float(row.get(col, 0) or 0) for col in ck_store.CK_COLS}
+        legacy_us = (time.perf_counter() - start) / len(names) * 1e6
+        store._snapshot = snapshot
+        start = time.perf_counter()
+        for name in names:
+            store.lookup_file(name)
+        snapshot_us = (time.perf_counter() - start) / len(names) * 1e6
+        print(f"\n⏱️  Lookup: legacy {legacy_us:.1f} us, snapshot {snapshot_us:.1f} us (suffix match + package)")
+        store._conn().close()
+
+    return legacy_bytes / max(snapshot_bytes, 1)
+
+
+if __name__ == "__main__":
+    rows = 100000
+    if "--rows" in sys.argv:
+        idx = sys.argv.index("--rows")
+        if idx + 1 < len(sys.argv):
+            rows = int(sys.argv[idx + 1])
+    ratio = run_benchmark(rows)
+    sys.exit(0 if ratio >= 10 else 1)
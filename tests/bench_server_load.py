@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Server Load Benchmark
+Starts api_server.py twice - the development server and the --prod
+prefork server - and fires concurrent /analyze/code requests at each,
+reporting throughput, latency percentiles and the memory of the serving
+processes (PSS, which splits copy-on-write shared pages between workers).
+
+Only /analyze/code is measured. It needs no server state, so every
+--prod worker serves it; repository analyses and jobs are pinned to the
+primary worker (see prefork_server.py) and gain nothing from more workers,
+so these numbers say nothing about them.
+
+Usage:
+    python tests/bench_server_load.py                       [400 requests, 8 clients]
+    python tests/bench_server_load.py --requests 2000 --concurrency 16 --workers 4
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import signal
+import socket
+import subprocess
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from extended_test_samples import EXTENDED_TEST_SAMPLES
+
+ROOT = Path(__file__).resolve().parent.parent
+STARTUP_TIMEOUT_S = 180
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, port: int) -> subprocess.Popen:
+    """Launch api_server.py in its own session and wait until /health answers."""
+    proc = subprocess.Popen([sys.executable, "api_server.py", "--port", str(port)] + args, cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.time() + STARTUP_TIMEOUT_S
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=2).read()
+            return proc
+        except OSError:
+            time.sleep(0.5)
+    stop_server(proc)
+    raise RuntimeError("Server did not start in time")
+
+
+def stop_server(proc: subprocess.Popen):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=15)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(proc.pid, signal.SIGKILL)
+
+
+def session_pss_mb(session_id: int) -> float:
+    """Proportional set size of every process in the server's session (Linux only)."""
+    total_kb = 0
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+            fields = stat[stat.rindex(")") + 2:].split()
+            if int(fields[3]) != session_id:            # Field 6 of /proc/<pid>/stat: session id
+                continue
+            for line in (entry / "smaps_rollup").read_text().splitlines():
+                if line.startswith("Pss:"):
+                    total_kb += int(line.split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+    return total_kb / 1024
+
+
+def run_load(port: int, n_requests: int, concurrency: int):
+    """(requests/s, latencies in ms, errors)"""
+    codes = [s["code"] for s in EXTENDED_TEST_SAMPLES]
+    url = f"http://127.0.0.1:{port}/analyze/code"
+
+    def one(i: int) -> float:
+        # Unique source per request, so nothing is coalesced or answered with 304
+        body = json.dumps({"code": codes[i % len(codes)] + f"\n// request {i}\n"}).encode()
+        req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        urllib.request.urlopen(req, timeout=60).read()
+        return (time.perf_counter() - start) * 1000
+
+    for i in range(min(20, n_requests)):                  # Warm up every worker a little
+        one(i)
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(one, i) for i in range(n_requests)]:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, np.array(latencies), errors
+
+
+def run_benchmark(n_requests: int, concurrency: int, workers: int):
+    print("=" * 70)
+    print(f"SERVER LOAD BENCHMARK: POST /analyze/code only ({n_requests} requests, {concurrency} concurrent clients)")
+    print("=" * 70)
+
+    modes = [("development (app.run)", []),
+             (f"prefork --prod ({workers} workers)", ["--prod", "--workers", str(workers)])]
+    results = {}
+    for name, args in modes:
+        port = free_port()
+        print(f"\n🚀 Starting {name} on port {port}...")
+        proc = start_server(args, port)
+        try:
+            rps, lat, errors = run_load(port, n_requests, concurrency)
+            pss = session_pss_mb(proc.pid)
+        finally:
+            stop_server(proc)
+        results[name] = rps
+        print(f"   Throughput: {rps:8.1f} req/s   errors: {errors}")
+        print(f"   Latency:    p50 {np.percentile(lat, 50):.1f} ms   p95 {np.percentile(lat, 95):.1f} ms   "
+              f"p99 {np.percentile(lat, 99):.1f} ms")
+        print(f"   Memory:     {pss:.1f} MB PSS (all server processes)")
+
+    dev, prod = results.values()
+    print(f"\n📈 Prefork / development /analyze/code throughput: {prod / dev:.2f}x  (CPUs: {os.cpu_count()})")
+    print("   Pinned endpoints (repositories, jobs) run on the primary worker alone and are not measured")
+    return results
+
+
+if __name__ == "__main__":
+    def option(name: str, default: int) -> int:
+        if name in sys.argv:
+            idx = sys.argv.index(name)
+            if idx + 1 < len(sys.argv):
+                return int(sys.argv[idx + 1])
+        return default
+
+    run_benchmark(option("--requests", 400), option("--concurrency", 8),
+                  option("--workers", os.cpu_count() or 1))
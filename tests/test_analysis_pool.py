@@ -0,0 +1,55 @@
+"""
+AnalysisPool scheduling: bulk batches occupy at most one slot per worker
+process, so interactive batches are submitted at once; a bulk batch that
+cannot get a slot before its timeout gives up, and cancelled batches give
+their slot back.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import pytest
+
+import analysis_pool
+from analysis_pool import AnalysisPool
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """A two-process AnalysisPool on two threads; batches return their codes once released."""
+    release = threading.Event()
+    monkeypatch.setattr(analysis_pool, "_predict_chunk", lambda chunk: release.wait(5) and chunk[0])
+    pool = AnalysisPool(2)
+    monkeypatch.setattr(pool, "_executor", ThreadPoolExecutor(max_workers=2))
+    pool._bulk_slots = threading.BoundedSemaphore(pool.processes)
+    yield pool, release
+    release.set()
+    pool._executor.shutdown(wait=True)
+
+
+def test_bulk_batches_leave_room_for_interactive_ones(pool):
+    pool, release = pool
+    bulk = [pool._submit((["Bulk"], [None], [None], True), bulk=True) for _ in range(2)]
+    with pytest.raises(FutureTimeout):
+        pool._submit((["Bulk"], [None], [None], True), bulk=True, timeout=0.1)
+    interactive = pool._submit((["Snippet"], [None], [None], True), bulk=False)
+    release.set()
+    assert interactive.result(5) == ["Snippet"] and [f.result(5) for f in bulk] == [["Bulk"]] * 2
+    assert pool._submit((["Bulk"], [None], [None], True), bulk=True, timeout=1).result(5) == ["Bulk"]
+
+
+def test_cancelled_bulk_batches_free_their_slot(pool):
+    pool, release = pool
+    running = pool._submit((["Bulk"], [None], [None], True), bulk=True)
+    pool._submit((["Snippet"], [None], [None], True), bulk=False)
+    queued = pool._submit((["Bulk"], [None], [None], True), bulk=True)      # Both workers are busy
+    with pytest.raises(FutureTimeout):
+        pool._submit((["Bulk"], [None], [None], True), bulk=True, timeout=0.1)
+    assert queued.cancel()
+    later = pool._submit((["Bulk"], [None], [None], True), bulk=True, timeout=0.1)
+    release.set()
+    assert running.result(5) == later.result(5) == ["Bulk"]
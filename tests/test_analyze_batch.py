@@ -0,0 +1,52 @@
+"""
+POST /analyze/batch: buildings come back in request order across scoring
+batches and match /analyze/code one snippet at a time; malformed bodies
+get 400 and oversized ones 413.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import api_server
+
+SNIPPETS = [
+    {"code": "public class Empty {}", "filename": "Empty.java"},
+    {"code": "public class Counter { private int n; public void inc() { n++; } public int get() { return n; } }"},
+    {"code": "public enum Color { RED, GREEN }", "filename": "Color.java"},
+    {"code": "public class Big { " + " ".join(f"public int m{i}(int x) {{ if (x > {i}) {{ return x; }} return {i}; }}"
+                                             for i in range(30)) + " }", "filename": "Big.java"},
+    {"code": "public interface Shape { double area(); }", "filename": "Shape.java"},
+]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(api_server, "ANALYSIS_BATCH_FILES", 2)     # Several scoring batches
+    return api_server.app.test_client()
+
+
+def test_buildings_in_request_order(client):
+    response = client.post("/analyze/batch", json={"files": SNIPPETS})
+    assert response.status_code == 200
+    buildings = response.get_json()["buildings"]
+    assert [b["class_name"] for b in buildings] == ["Empty", "Counter", "Color", "Big", "Shape"]
+    for snippet, building in zip(SNIPPETS, buildings):
+        single = client.post("/analyze/code", json=snippet).get_json()
+        assert building == single
+
+
+def test_bare_array(client):
+    response = client.post("/analyze/batch", json=SNIPPETS[:2])
+    assert [b["class_name"] for b in response.get_json()["buildings"]] == ["Empty", "Counter"]
+
+
+def test_limits(client, monkeypatch):
+    monkeypatch.setattr(api_server, "MAX_BATCH_SNIPPETS", 2)
+    assert client.post("/analyze/batch", json={"files": SNIPPETS[:3]}).status_code == 413
+    assert client.post("/analyze/batch", json={"files": SNIPPETS[:2]}).status_code == 200
+    assert client.post("/analyze/batch", json={"files": "class A {}"}).status_code == 400
+    missing = client.post("/analyze/batch", json={"files": [SNIPPETS[0], {"filename": "B.java"}]})
+    assert missing.status_code == 400 and "files[1]" in missing.get_json()["error"]
@@ -0,0 +1,130 @@
+"""
+Uploaded archives: only safe, non-test .java member paths of zip and tar
+uploads are read, and every cap (upload bytes with or without a known
+length, member count, uncompressed bytes of decompression bombs) raises
+ArchiveTooLarge.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from archive_reader import ArchiveError, ArchiveTooLarge, member_path, read_java_sources
+
+MB = 1024 * 1024
+SOURCE = "public class A { int x; }\n"
+
+
+class ChunkedUpload(io.RawIOBase):
+    """Request body of unknown length, counting the bytes taken from it."""
+
+    def __init__(self, data: bytes):
+        self.data = io.BytesIO(data)
+        self.consumed = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.data.read(size)
+        self.consumed += len(chunk)
+        return chunk
+
+
+def zip_bytes(members) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def tar_bytes(members, mode: str = "w:gz") -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def read(data: bytes, max_upload_bytes: int = 10 * MB, max_members: int = 1000,
+         max_unpacked_bytes: int = 10 * MB):
+    return read_java_sources(io.BytesIO(data), max_upload_bytes, max_members, max_unpacked_bytes)
+
+
+def test_member_path_normalizes():
+    assert member_path("src/A.java") == "src/A.java"
+    assert member_path("./src/../src/A.java") == "src/A.java"
+    assert member_path("src\\main\\A.java") == "src/main/A.java"
+
+
+@pytest.mark.parametrize("name", ["/etc/A.java", "\\abs\\A.java", "../A.java", "src/../../A.java",
+                                  "..\\..\\A.java", ".git/A.java", "src/.hidden/A.java",
+                                  "src/test/A.java", "tests/A.java", "src/A.kt", "src/A.java.orig"])
+def test_member_path_skips(name):
+    assert member_path(name) is None
+
+
+MEMBERS = [("src/A.java", SOURCE.encode()), ("../evil/B.java", b"class B {}"),
+           ("src/test/C.java", b"class C {}"), ("README.md", b"hi")]
+
+
+def test_reads_zip():
+    assert read(zip_bytes(MEMBERS)) == {"src/A.java": SOURCE}
+
+
+@pytest.mark.parametrize("mode", ["w", "w:gz", "w:bz2", "w:xz"])
+def test_reads_tar(mode):
+    assert read(tar_bytes(MEMBERS, mode)) == {"src/A.java": SOURCE}
+
+
+def test_not_an_archive():
+    with pytest.raises(ArchiveError) as error:
+        read(b"just some text, not an archive")
+    assert not isinstance(error.value, ArchiveTooLarge)
+
+
+def test_upload_cap():
+    data = tar_bytes([(f"src/A{i}.java", os.urandom(4096)) for i in range(8)], "w")
+    with pytest.raises(ArchiveTooLarge):
+        read(data, max_upload_bytes=len(data) // 2)
+    with pytest.raises(ArchiveTooLarge):
+        read(zip_bytes([("src/A.java", os.urandom(8192))]), max_upload_bytes=4096)
+
+
+def test_upload_cap_without_content_length():
+    """A chunked upload is read only up to one byte past the cap."""
+    upload = ChunkedUpload(zip_bytes([("src/A.java", os.urandom(MB))]))
+    with pytest.raises(ArchiveTooLarge):
+        read_java_sources(upload, 64 * 1024, 1000, 10 * MB)
+    assert upload.consumed <= 64 * 1024 + 1
+
+
+@pytest.mark.parametrize("pack", [zip_bytes, tar_bytes])
+def test_member_cap(pack):
+    with pytest.raises(ArchiveTooLarge):
+        read(pack([(f"src/A{i}.java", b"class A {}") for i in range(20)]), max_members=10)
+
+
+def test_zip_bomb():
+    """Highly compressed members stop at the uncompressed cap, whatever the headers claim."""
+    bomb = zip_bytes([("src/Bomb.java", b"\0" * (64 * MB))])
+    assert len(bomb) < MB
+    with pytest.raises(ArchiveTooLarge, match="unpacks"):
+        read(bomb, max_unpacked_bytes=MB)
+
+
+def test_tar_bomb():
+    bomb = tar_bytes([(f"src/Bomb{i}.java", b"\0" * (4 * MB)) for i in range(4)])
+    assert len(bomb) < MB
+    with pytest.raises(ArchiveTooLarge, match="unpacks"):
+        read(bomb, max_unpacked_bytes=8 * MB)
+
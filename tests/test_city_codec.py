@@ -0,0 +1,88 @@
+"""
+The binary city encoding: a city built by the server decodes back to the
+same dicts (floats at float32 precision), columns are 8-byte aligned views
+into the payload, and foreign or newer payloads are refused.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import struct
+
+import numpy as np
+import pytest
+
+import api_server
+import city_codec
+
+SOURCES = {
+    "/shop/Shape.java": "public interface Shape { double area(); }",
+    "/shop/Base.java": "public class Base { protected int id; }",
+    "/shop/Order.java": """
+        public class Order extends Base implements Shape, Comparable {
+            private final Customer customer;
+            private Discount discount;
+            public Invoice invoice;
+            public double area() { return new Invoice().total(); }
+        }""",
+    "/shop/Customer.java": "public class Customer { private String name; public String getName() { return name; } }",
+    "/shop/Discount.java": "public class Discount { public double rate = 0.1; }",
+    "/shop/Invoice.java": "public class Invoice { public double total() { return 42.0; } }",
+}
+
+
+def as_float32(value):
+    """value with every float rounded the way the payload stores it."""
+    if isinstance(value, float):
+        return float(np.format_float_positional(np.float32(value)))
+    if isinstance(value, dict):
+        return {k: as_float32(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [as_float32(v) for v in value]
+    return value
+
+
+@pytest.fixture(scope="module")
+def city():
+    city = api_server.build_city(SOURCES, "/shop", "/shop-codec-test", precompute_ck=False)
+    return json.loads(json.dumps(city))                  # As the JSON endpoints send it
+
+
+def test_round_trip(city):
+    assert city["inheritance"] and city["compositions"]
+    assert city_codec.decode(city_codec.encode(city)) == as_float32(city)
+
+
+def test_edges_to_classes_without_buildings(city):
+    partial = {**city, "buildings": city["buildings"][:2],
+               "inheritance": [{"from": "Order", "to": "Base", "type": "extends"}, {"from": "Nowhere", "to": "Base"}]}
+    partial.pop("layout")
+    assert city_codec.decode(city_codec.encode(partial)) == as_float32(partial)
+
+
+def test_empty_city():
+    empty = {"buildings": [], "inheritance": [], "total_classes": 0}
+    assert city_codec.decode(city_codec.encode(empty)) == empty
+
+
+def test_columns_are_aligned_views(city):
+    payload = city_codec.encode(city)
+    header, columns = city_codec.decode_columns(payload)
+    assert header["buildings"] == len(city["buildings"])
+    assert all(col["offset"] % 8 == 0 for col in header["columns"].values())
+    loc = columns["loc"]
+    assert loc.tolist() == [b["loc"] for b in city["buildings"]]
+    assert not loc.flags.owndata and not loc.flags.writeable
+
+
+def test_foreign_payloads_are_refused(city):
+    payload = city_codec.encode(city)
+    with pytest.raises(ValueError):
+        city_codec.decode(b"{" + payload[1:])
+    header_len = struct.unpack_from("<I", payload, len(city_codec.MAGIC))[0]
+    start = len(city_codec.MAGIC) + 4
+    header = payload[start:start + header_len].replace(b'"version":1', b'"version":9')
+    with pytest.raises(ValueError):
+        city_codec.decode(payload[:start] + header + payload[start + header_len:])
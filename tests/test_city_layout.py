@@ -0,0 +1,95 @@
+"""
+Treemap building placement: squarify fills its rectangle with cells whose
+areas follow the weights, without overlaps, and CityLayoutCache lays out
+only the districts a new city version changed.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from city_layout import CityLayoutCache, squarify
+
+EPS = 1e-9
+
+
+def overlaps(cells: np.ndarray) -> bool:
+    x0, z0 = cells[:, 0], cells[:, 1]
+    x1, z1 = x0 + cells[:, 2], z0 + cells[:, 3]
+    overlap_x = np.minimum(x1[:, None], x1[None, :]) - np.maximum(x0[:, None], x0[None, :])
+    overlap_z = np.minimum(z1[:, None], z1[None, :]) - np.maximum(z0[:, None], z0[None, :])
+    overlapping = (overlap_x > 1e-6) & (overlap_z > 1e-6)
+    np.fill_diagonal(overlapping, False)
+    return bool(overlapping.any())
+
+
+@pytest.fixture
+def city():
+    """(paths, loc, wmc) of 60 buildings in four packages."""
+    rng = np.random.default_rng(3)
+    paths = [f"src/pkg{i % 4}/Class{i}.java" for i in range(60)]
+    return paths, rng.integers(10, 800, 60).tolist(), rng.integers(1, 40, 60).tolist()
+
+
+def test_squarify_conserves_area():
+    areas = np.random.default_rng(0).uniform(1, 100, 50)
+    rect = (2.0, 3.0, 40.0, 25.0)
+    cells = squarify(areas, rect)
+    cell_areas = cells[:, 2] * cells[:, 3]
+    assert cell_areas.sum() == pytest.approx(40.0 * 25.0)
+    assert np.allclose(cell_areas / areas, cell_areas[0] / areas[0])
+    assert (cells[:, 0] >= 2.0 - EPS).all() and (cells[:, 1] >= 3.0 - EPS).all()
+    assert (cells[:, 0] + cells[:, 2] <= 42.0 + 1e-6).all()
+    assert (cells[:, 1] + cells[:, 3] <= 28.0 + 1e-6).all()
+
+
+def test_squarify_no_overlap():
+    areas = np.random.default_rng(1).uniform(1, 1000, 200)
+    assert not overlaps(squarify(areas, (0.0, 0.0, 100.0, 100.0)))
+
+
+def test_squarify_edge_cases():
+    assert squarify(np.array([]), (0.0, 0.0, 1.0, 1.0)).shape == (0, 4)
+    assert squarify(np.array([5.0]), (1.0, 1.0, 4.0, 2.0))[0].tolist() == pytest.approx([1.0, 1.0, 4.0, 2.0])
+
+
+def test_cache_same_version_is_a_hit(city):
+    paths, loc, wmc = city
+    cache = CityLayoutCache()
+    first = cache.layout("repo", "v1", paths, loc, wmc)
+    assert cache.layout("repo", "v1", paths, loc, wmc) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.cached("repo", "v1") is first and cache.cached("repo", "v2") is None
+
+
+def test_cache_reuses_districts_across_versions(city):
+    paths, loc, wmc = city
+    cache = CityLayoutCache()
+    first = cache.layout("repo", "v1", paths, loc, wmc)
+    assert first["recomputed_districts"] == 4
+
+    edited = list(loc)
+    edited[1] += 30                               # One building of src/pkg1
+    second = cache.layout("repo", "v2", paths, edited, wmc)
+    assert second["districts"] == first["districts"]
+    assert second["recomputed_districts"] == 1
+    columns = ("x", "z", "width", "depth")
+    changed = [i for i in range(len(paths))
+               if any(first["buildings"][c][i] != second["buildings"][c][i] for c in columns)]
+    assert changed and all(paths[i].startswith("src/pkg1/") for i in changed)
+
+
+def test_cache_relays_out_when_districts_change(city):
+    paths, loc, wmc = city
+    cache = CityLayoutCache()
+    first = cache.layout("repo", "v1", paths, loc, wmc)
+    grown = [value * 3 if path.startswith("src/pkg0/") else value for path, value in zip(paths, loc)]
+    second = cache.layout("repo", "v2", paths, grown, wmc)
+    assert second["recomputed_districts"] == 4
+    assert second["districts"] != first["districts"]
+    cols = second["buildings"]
+    assert not overlaps(np.column_stack([cols["x"], cols["z"], cols["width"], cols["depth"]]))
+
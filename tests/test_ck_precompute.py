@@ -0,0 +1,80 @@
+"""
+CK Precompute Tests
+Precomputed repositories on disk: the command line and the server's
+background precompute write the same CSV and manifest, least recently used
+projects are evicted, and the CK store picks up one repository's CSV
+without rebuilding the snapshot of every other row.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools"))
+
+import ck_precompute
+from ck_precompute import CKPrecomputer, evict_projects, project_slug, write_project
+from ck_store import CK_COLS, CKMetricsStore
+
+ORDER = """
+package shop;
+
+public class Order {
+    private int total;
+    public int getTotal() { return total; }
+    public void add(int amount) { if (amount > 0) { total += amount; } }
+}
+"""
+
+
+def test_cli_writes_the_server_layout(tmp_path, monkeypatch):
+    project = tmp_path / "shop"
+    (project / "src").mkdir(parents=True)
+    (project / "src" / "Order.java").write_text(ORDER)
+    ck_dir = tmp_path / "ck_metrics"
+    monkeypatch.setattr(ck_precompute, "CK_DIR", ck_dir)
+    monkeypatch.setattr(sys, "argv", ["ck_precompute.py", str(project)])
+    ck_precompute.main()
+
+    files = {"src/Order.java": ORDER}
+    precomputer = CKPrecomputer(ck_dir)
+    slug = project_slug(str(project))
+    assert precomputer.is_current(str(project), files)
+    assert precomputer.current_paths(str(project), files) == {"src/Order.java": f"{slug}/src/Order.java"}
+    assert (ck_dir / f"{slug}_ck.csv").read_text().splitlines()[1].startswith(f"{slug}/src/Order.java,Order,shop,")
+
+
+def test_least_recently_used_projects_are_evicted(tmp_path):
+    files = {"Order.java": ORDER}
+    precomputer = CKPrecomputer(tmp_path, max_projects=2)
+    precomputer._run("/p/a", files)
+    precomputer._run("/p/b", files)
+    for key, mtime in (("/p/a", 100), ("/p/b", 200)):
+        os.utime(tmp_path / f"{project_slug(key)}_ck.json", ns=(mtime, mtime))
+    precomputer.submit("/p/a", files)                       # Current: counts as a use
+    precomputer._run("/p/c", files)
+
+    assert sorted(p.name for p in tmp_path.glob("repo-*")) == sorted(
+        f"{project_slug(key)}_ck.{ext}" for key in ("/p/a", "/p/c") for ext in ("csv", "json"))
+    assert precomputer.status("/p/b") == {"state": "none"}
+    assert not precomputer.is_current("/p/b", files)
+
+
+def test_store_refreshes_one_repository(tmp_path):
+    (tmp_path / "dataset_ck.csv").write_text(
+        ",".join(["file_path", "class_name", "package"] + CK_COLS) + "\n"
+        + ",".join(["/data/shop/src/Order.java", "Order", "shop"] + ["1"] * len(CK_COLS)) + "\n")
+    store = CKMetricsStore(tmp_path)
+    shared = store.snapshot()
+    slug = project_slug("/p/shop")
+
+    write_project(tmp_path, "/p/shop", {"src/Order.java": ORDER})
+    store.refresh()
+    assert store.snapshot() is shared
+    assert store.lookup_path(f"{slug}/src/Order.java")["METHODS"] == 2
+    assert store.lookup_file("other/src/Order.java")["LOC"] == 1         # Repositories only by store path
+    assert store.rows() == 2
+
+    evict_projects(tmp_path, 0)
+    store.refresh()
+    assert store.snapshot() is shared
+    assert store.lookup_path(f"{slug}/src/Order.java") is None
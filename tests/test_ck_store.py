@@ -0,0 +1,85 @@
+"""
+Lookups in the CK metrics store. A three-row corpus covers suffix matches
+across POSIX and Windows paths, exact store paths and class names; the
+Vocabulary is also exercised with every str hash forced to collide.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import ck_store
+from ck_store import CK_COLS, CKMetricsStore, CKSnapshot, Vocabulary
+
+ROWS = [
+    ("/home/u/shop/src/OrderService.java", "shop", "orderservice.java"),
+    ("D:\\work\\billing\\src\\Invoice.java", "billing", "invoice.java"),
+    ("repo-shop-0123456789/src/OrderService.java", "shop", "orderservice.java"),
+]
+
+
+def snapshot() -> CKSnapshot:
+    return CKSnapshot((path, package, key, *[float(i)] * len(CK_COLS)) for i, (path, package, key) in enumerate(ROWS))
+
+
+@pytest.fixture
+def colliding_hashes(monkeypatch):
+    """Every key hashes to the same value inside ck_store."""
+    monkeypatch.setattr(ck_store, "hash", lambda key: 0, raising=False)
+
+
+def test_suffix_and_exact_lookups():
+    snap = snapshot()
+    assert snap.resolve_file("/elsewhere/shop/src/OrderService.java", "shop") == 0      # Longest suffix
+    assert snap.resolve_file("C:/x/billing/src/invoice.java") == 1
+    assert snap.resolve_path("repo-shop-0123456789/src/OrderService.java") == 2
+    assert snap.resolve_path("repo-other-0123456789/src/OrderService.java") is None
+    assert snap.resolve_class("Invoice", "billing") == 1
+    assert snap.resolve_file("src/Unknown.java") is None
+
+
+def test_shared_file_names():
+    """Many rows named Builder.java: the directories decide, single rows follow their own path."""
+    paths = [f"/p/module{i}/util/Builder.java" for i in range(50)] + ["/p/module7/util/deep/x/Builder.java"]
+    snap = CKSnapshot((path, "", "builder.java", *[0.0] * len(CK_COLS)) for path in paths)
+    assert snap.trie.match("module7/util/Builder.java") == (3, [7])
+    depth, rows = snap.trie.match("other/util/Builder.java")
+    assert depth == 2 and sorted(rows) == list(range(50))
+    assert snap.trie.match("module7/deep/x/Builder.java") == (3, [50])
+    assert snap.resolve_path("/p/module7/util/deep/x/Builder.java") == 50
+    assert snap.resolve_path("/p/util/deep/x/Builder.java") is None
+    assert snap.resolve_path("module7/util/Builder.java") is None            # A suffix, not the path
+
+
+def test_lookups_never_refresh(tmp_path):
+    """New CSVs show up after refresh() (the refresher thread), not in the middle of a lookup."""
+    header = ",".join(["file_path", "class_name", "package"] + CK_COLS) + "\n"
+    (tmp_path / "a_ck.csv").write_text(header + ",".join(["/a/Foo.java", "Foo", "a"] + ["1"] * len(CK_COLS)) + "\n")
+    store = CKMetricsStore(tmp_path)
+    first = store.snapshot()
+    (tmp_path / "b_ck.csv").write_text(header + ",".join(["/b/Bar.java", "Bar", "b"] + ["2"] * len(CK_COLS)) + "\n")
+    assert store.snapshot() is first and store.lookup_file("Bar.java") is None
+    store.refresh()
+    assert store.lookup_file("Bar.java")["LOC"] == 2
+
+
+def test_vocabulary_ids():
+    vocab, ids = Vocabulary.build(["src", "main", "src", "Foo.java"])
+    assert len(vocab) == 3 and sorted(ids.values()) == [0, 1, 2]
+    for key, key_id in ids.items():
+        assert vocab.id(key) == key_id and vocab.key(key_id) == key
+    assert vocab.id("missing") == -1
+
+
+def test_hash_collisions_do_not_match(colliding_hashes):
+    vocab, ids = Vocabulary.build(["src", "main", "Foo.java"])
+    assert len(set(ids.values())) == 3
+    assert vocab.id("Bar.java") == -1
+    snap = snapshot()
+    assert snap.resolve_path("repo-shop-0123456789/src/Invoice.java") is None
+    assert snap.resolve_file("/any/src/invoice.java") == 1
+    assert snap.resolve_class("Customer") is None
+    assert snap.resolve_class("OrderService", "shop") == 2
+
@@ -0,0 +1,100 @@
+"""
+Analyses under a deadline, on a simulated clock: as the projected cost of
+the remaining files outgrows the time left, extended detectors are
+dropped first, then relationships, then files are sampled; a batch that
+overruns the time left, or a deadline spent in the queue, ends the
+analysis.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+import types
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import pytest
+
+import api_server
+import predict_smell_extended as detector
+from api_server import Deadline, Truncation
+
+FILES = {f"/repo/src/C{i}.java": f"public class C{i} {{ public int get() {{ return {i}; }} }}" for i in range(64)}
+
+# Simulated seconds per file, with and without the extended detectors
+EXTENDED_COST, BASIC_COST = 1 / 64, 1 / 256
+
+
+class Clock:
+    """time.perf_counter stand-in that only moves when a batch is scored."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock, calls = Clock(), []
+
+    def predict_batch(codes, file_paths, models=None, use_extended=True, timeout=None, bulk=False):
+        cost = len(codes) * (EXTENDED_COST if use_extended else BASIC_COST)
+        calls.append((len(codes), use_extended))
+        if timeout is not None and cost > timeout:
+            clock.now += timeout
+            raise FutureTimeout()
+        clock.now += cost
+        return detector.predict_smell_batch(codes, models, use_extended=use_extended, file_paths=file_paths)
+
+    monkeypatch.setattr(api_server, "time", types.SimpleNamespace(**{**vars(time), "perf_counter": clock}))
+    monkeypatch.setattr(api_server.ANALYSIS_POOL, "predict_batch", predict_batch)
+    clock.calls = calls
+    return clock
+
+
+def analyze(clock: Clock, budget_s: float):
+    """(file names of the buildings, truncation) of FILES under a budget_s deadline."""
+    truncation = Truncation(total_files=len(FILES))
+    deadline = Deadline(budget_s, start=clock())
+    buildings = list(api_server.iter_buildings_by_deadline(FILES, "/repo", {}, None, deadline, truncation))
+    return [b.file_path for b in buildings], truncation
+
+
+def test_ample_budget(clock):
+    paths, truncation = analyze(clock, 10.0)
+    assert paths == [f"src/C{i}.java" for i in range(64)]
+    assert truncation == Truncation(analyzed_files=64, total_files=64)
+    assert {use_extended for _, use_extended in clock.calls} == {True}
+
+
+def test_extended_detectors_go_first(clock):
+    paths, truncation = analyze(clock, 0.5)
+    assert len(paths) == 64
+    assert truncation.extended_smells and not truncation.relationships and not truncation.files
+    assert clock.calls == [(16, True), (16, False), (16, False), (16, False)]
+
+
+def test_then_relationships_then_files(clock):
+    paths, truncation = analyze(clock, 0.35)
+    assert truncation.extended_smells and truncation.relationships and truncation.files
+    assert clock.calls[:2] == [(16, True), (16, False)]
+    sampled = paths[32:]
+    assert 0 < len(sampled) < 32 and truncation.analyzed_files == len(paths)
+    assert sampled == sorted(sampled, key=lambda p: int(p[5:-5])) and sampled[0] == "src/C32.java"
+
+
+def test_overrunning_batch_ends_the_analysis(clock, monkeypatch):
+    monkeypatch.setattr(api_server, "DEADLINE_BATCH_FILES", 64)
+    paths, truncation = analyze(clock, 0.5)
+    assert paths == [] and truncation.files and truncation.analyzed_files == 0
+
+
+def test_deadline_spent_in_the_queue(clock):
+    deadline = Deadline(0.5, start=clock() - 1.0)
+    city = api_server.build_city(FILES, "/repo", "/repo", max_files=64, deadline=deadline, precompute_ck=False)
+    assert city["buildings"] == [] and city["inheritance"] == []
+    assert city["truncated"]["files"] and city["truncated"]["relationships"]
+    assert clock.calls == []
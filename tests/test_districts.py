@@ -0,0 +1,81 @@
+"""
+Level-of-detail districts: summarize_districts folds file-less single-child
+directories into their child and totals each district over its subtree,
+district_buildings picks a district's buildings, and the districts city is
+kept apart from the /analyze/repo city of the same repository.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import api_server
+from ck_precompute import CKPrecomputer
+from districts import district_buildings, summarize_districts
+
+
+def building(file_path: str, loc: int = 10, smell: str = "Clean", quality: float = 1.0):
+    return {"file_path": file_path, "loc": loc, "quality_score": quality, "primary_smell": smell,
+            "all_smells": [{"name": smell}]}
+
+
+BUILDINGS = [
+    building("src/main/java/org/app/App.java", 100),
+    building("src/main/java/org/app/service/Orders.java", 50, "GodClass", 0.5),
+    building("src/main/java/org/app/service/Billing.java", 30, "GodClass", 0.25),
+    building("src/main/java/org/app/model/Order.java", 20),
+    building("Main.java", 5),
+]
+
+
+def test_single_child_directories_are_folded():
+    districts = summarize_districts(BUILDINGS)
+    assert [(d.name, d.parent, d.level) for d in districts] == [
+        (".", None, 0),
+        ("src/main/java/org/app", None, 0),
+        ("src/main/java/org/app/model", "src/main/java/org/app", 1),
+        ("src/main/java/org/app/service", "src/main/java/org/app", 1),
+    ]
+    app = districts[1]
+    assert app.children == ["src/main/java/org/app/model", "src/main/java/org/app/service"]
+    assert (app.buildings, app.direct_buildings, app.loc) == (4, 1, 200)
+    assert (app.clean_count, app.smell_count, app.smells) == (2, 2, {"GodClass": 2})
+    assert app.average_quality == pytest.approx(0.6875, abs=1e-3)
+
+
+def test_max_level():
+    names = [d.name for d in summarize_districts(BUILDINGS, max_level=0)]
+    assert names == [".", "src/main/java/org/app"]
+
+
+def test_district_buildings():
+    assert district_buildings(BUILDINGS, "src/main/java/org/app") == [0]
+    assert district_buildings(BUILDINGS, "src/main/java/org/app", recursive=True) == [0, 1, 2, 3]
+    assert district_buildings(BUILDINGS, "src/main/java/org/app/service/") == []
+    assert district_buildings(BUILDINGS, ".") == [4]
+    assert district_buildings(BUILDINGS, "src/main") == []
+
+
+def test_districts_city_is_kept_apart(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_server, "MAX_DISTRICT_FILES", 4)
+    monkeypatch.setattr(api_server, "CK_PRECOMPUTE", CKPrecomputer(tmp_path / "ck_metrics"))
+    root = tmp_path / "repo"
+    for i in range(4):
+        package = root / "src" / f"p{i % 2}"
+        package.mkdir(parents=True, exist_ok=True)
+        (package / f"C{i}.java").write_text(f"public class C{i} {{ int x = {i}; }}")
+    client = api_server.app.test_client()
+    overview = client.post("/analyze/repo/districts", json={"directory": str(root)}).get_json()
+    assert [d["name"] for d in overview["districts"]] == ["src", "src/p0", "src/p1"]
+
+    repo = client.post("/analyze/repo", json={"directory": str(root), "max_files": 1}).get_json()
+    assert len(repo["buildings"]) == 1 and repo["version"] != overview["version"]
+
+    response = client.post("/analyze/repo/district", json={
+        "directory": str(root), "district": "src/p1", "version": overview["version"]})
+    assert response.status_code == 200
+    district = response.get_json()
+    assert sorted(b["class_name"] for b in district["buildings"]) == ["C1", "C3"]
+    assert len(district["layout"]["x"]) == 2
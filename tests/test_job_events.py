@@ -0,0 +1,70 @@
+"""
+The /jobs/<id>/events stream: a running job's state and file events
+arrive as they are published and the stream ends with the finished state;
+Last-Event-ID resumes after the given event.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import threading
+
+import pytest
+
+import api_server
+from job_manager import DONE, RUNNING, JobManager
+
+
+def parse(chunks) -> list:
+    """(id, event, data) of each server-sent event in the response chunks."""
+    events = []
+    for block in b"".join(chunks).decode().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if fields:
+            events.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+    return events
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(api_server, "JOBS", JobManager(workers=1))
+    return api_server.app.test_client()
+
+
+def test_stream_follows_a_running_job(client):
+    published, release = threading.Event(), threading.Event()
+
+    def analysis(job):
+        job.publish("file_done", file="Order.java", done=1, total=1)
+        published.set()
+        release.wait(5)
+        return {"buildings": []}
+
+    job = api_server.JOBS.submit("repo", analysis)
+    assert published.wait(5)
+    response = client.get(f"/jobs/{job.id}/events", buffered=False)
+    assert response.mimetype == "text/event-stream"
+    chunks = iter(response.response)
+    head = parse([next(chunks), next(chunks)])
+    assert [(event_id, event) for event_id, event, _ in head] == [(0, "state"), (1, "file_done")]
+    assert head[0][2]["state"] == RUNNING and head[1][2]["file"] == "Order.java"
+
+    release.set()
+    tail = parse(chunks)                         # Ends by itself after the finished state
+    assert [(event_id, event, data["state"]) for event_id, event, data in tail] == [(2, "state", DONE)]
+
+
+def test_resume_after_last_event_id(client):
+    job = api_server.JOBS.submit("repo", lambda job: job.publish("file_done", file="A.java", done=1, total=1))
+    api_server.JOBS._executor.shutdown(wait=True)
+
+    events = parse(client.get(f"/jobs/{job.id}/events").response)
+    assert [(event_id, event) for event_id, event, _ in events] == [(0, "state"), (2, "state")]   # Finished: states only
+    resumed = parse(client.get(f"/jobs/{job.id}/events", headers={"Last-Event-ID": "0"}).response)
+    assert [event_id for event_id, _, _ in resumed] == [2]
+
+
+def test_unknown_job(client):
+    assert client.get("/jobs/missing/events").status_code == 404
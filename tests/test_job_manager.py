@@ -0,0 +1,124 @@
+"""
+Background jobs: the bounded queue answers 429 when full, cancelled jobs
+stop whether they were still queued, running or waiting for a bulk lane
+slot, and the event log stays bounded while keeping event ids stable for
+resuming streams.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+
+import pytest
+
+import job_manager
+from job_manager import CANCELLED, DONE, QUEUED, RUNNING, WAITING, Job, JobManager, QueueFullError
+
+
+def wait_for(job: Job, *states: str, timeout: float = 5.0):
+    """Wait until the job reaches one of the states."""
+    since = 0
+    while job.state not in states:
+        events = job.wait_events(since, timeout)
+        assert events, f"job stuck in {job.state}"
+        since = events[-1][0] + 1
+
+
+@pytest.fixture
+def blocked():
+    """A JobManager with one worker held by a job until the event is set."""
+    release = threading.Event()
+    manager = JobManager(workers=1, max_queued=1)
+    first = manager.submit("block", lambda job: release.wait(5))
+    wait_for(first, RUNNING)
+    yield manager, release
+    release.set()
+
+
+def test_queue_full_answers_429(blocked, monkeypatch):
+    import api_server
+    manager, _ = blocked
+    manager.submit("waiting", lambda job: None)
+    with pytest.raises(QueueFullError):
+        manager.submit("refused", lambda job: None)
+
+    monkeypatch.setattr(api_server, "JOBS", manager)
+    with api_server.app.test_request_context():
+        _, status = api_server.submit_job("repo", lambda job: None)
+    assert status == 429
+
+
+def test_cancel_queued_job(blocked):
+    manager, release = blocked
+    ran = threading.Event()
+    job = manager.submit("waiting", lambda job: ran.set())
+    assert job.state == QUEUED
+    assert manager.cancel(job.id).state == CANCELLED
+    release.set()
+    manager._executor.shutdown(wait=True)
+    assert job.state == CANCELLED and not ran.is_set()
+
+
+def test_cancel_running_job():
+    manager = JobManager(workers=1)
+    started = threading.Event()
+
+    def loop(job):
+        started.set()
+        while True:
+            job.check_cancelled()
+            job.cancel_event.wait(0.01)
+
+    job = manager.submit("loop", loop)
+    assert started.wait(5)
+    manager.cancel(job.id)
+    wait_for(job, CANCELLED)
+    assert job.result is None and job.error is None
+
+
+def test_event_log_is_bounded(monkeypatch):
+    monkeypatch.setattr(job_manager, "MAX_JOB_EVENTS", 4)
+    job = Job(id="j", kind="repo")
+    for i in range(10):
+        job.publish("file_done", file=f"F{i}.java")
+    assert [event_id for event_id, _ in job.wait_events(0, 0)] == [6, 7, 8, 9]
+    assert job.wait_events(8, 0)[0] == (8, {"event": "file_done", "file": "F8.java"})
+
+    job.state = DONE
+    job.publish_state()
+    assert [(event_id, event["event"]) for event_id, event in job.events] == [(10, "state")]
+    assert job.wait_events(3, 0) == job.events                  # Dropped events are skipped
+
+
+@pytest.fixture
+def busy_bulk_lane(monkeypatch):
+    """api_server with a one-slot bulk lane, and a context manager holding that slot."""
+    import api_server
+    from lane_scheduler import LaneScheduler
+    scheduler = LaneScheduler({api_server.INTERACTIVE: (1, None), api_server.BULK: (1, None)})
+    monkeypatch.setattr(api_server, "SCHEDULER", scheduler)
+    monkeypatch.setattr(api_server, "JOBS", JobManager(workers=2))
+    return api_server, scheduler.slot(api_server.BULK)
+
+
+def test_job_waits_for_a_bulk_slot(busy_bulk_lane):
+    api_server, held = busy_bulk_lane
+    with held:
+        job = api_server.JOBS.submit("repo", api_server.bulk_job, lambda job: "city")
+        wait_for(job, WAITING)
+    wait_for(job, DONE)
+    assert [event["state"] for _, event in job.events] == [RUNNING, WAITING, RUNNING, DONE]
+
+
+def test_cancel_job_waiting_for_a_bulk_slot(busy_bulk_lane):
+    api_server, held = busy_bulk_lane
+    ran = threading.Event()
+    with held:
+        job = api_server.JOBS.submit("repo", api_server.bulk_job, lambda job: ran.set())
+        wait_for(job, WAITING)
+        api_server.JOBS.cancel(job.id)
+        wait_for(job, CANCELLED)                 # Without the slot ever freeing up
+    assert not ran.is_set()
+    assert api_server.SCHEDULER.lanes[api_server.BULK].rejected == 0
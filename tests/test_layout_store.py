@@ -0,0 +1,74 @@
+"""
+Incremental reanalysis: LayoutStore.delta sorts buildings and edges into
+added, changed and removed between two recorded versions, and a second
+analysis of a repository scores only the files that changed, while job
+progress still counts every file.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import api_server
+from job_manager import Job
+from layout_store import LayoutStore
+
+
+def record(store: LayoutStore, buildings, edges) -> str:
+    recorder = store.begin("/repo")
+    for building in buildings:
+        recorder.add(building, f"key-{building['file_path']}")
+    return recorder.commit(edges)
+
+
+def test_delta():
+    store = LayoutStore()
+    first = record(store, [{"file_path": "A.java", "loc": 1}, {"file_path": "B.java", "loc": 2}],
+                   [("inheritance", "A", "B", "extends")])
+    city = {"buildings": [{"file_path": "A.java", "loc": 1}, {"file_path": "B.java", "loc": 3},
+                          {"file_path": "C.java", "loc": 4}]}
+    edges = [("dependencies", "C", "A", "")]
+    record(store, city["buildings"], edges)
+
+    delta = store.delta("/repo", first, city, edges)
+    assert not delta["full"]
+    assert delta["buildings"] == {"added": [{"file_path": "C.java", "loc": 4}],
+                                  "changed": [{"file_path": "B.java", "loc": 3}], "removed": []}
+    assert delta["relationships"] == {"added": [{"kind": "dependencies", "from": "C", "to": "A"}],
+                                      "removed": [{"kind": "inheritance", "from": "A", "to": "B", "type": "extends"}]}
+
+    shrunk = {"buildings": [{"file_path": "A.java", "loc": 1}]}
+    assert store.delta("/repo", first, shrunk, [])["buildings"] == {"added": [], "changed": [], "removed": ["B.java"]}
+    assert store.delta("/repo", "unknown", shrunk, [])["full"]
+
+
+@pytest.fixture
+def scored(monkeypatch):
+    """Sources the analysis pool scores, one list per predict_batches call."""
+    calls = []
+    predict_batches = api_server.ANALYSIS_POOL.predict_batches
+
+    def spy(codes, *args, **kwargs):
+        calls.append(list(codes))
+        return predict_batches(codes, *args, **kwargs)
+
+    monkeypatch.setattr(api_server.ANALYSIS_POOL, "predict_batches", spy)
+    return calls
+
+
+def test_unchanged_files_are_not_reanalyzed(scored, tmp_path):
+    files = {str(tmp_path / f"C{i}.java"): f"public class C{i} {{ int x = {i}; }}" for i in range(5)}
+    key = str(tmp_path)
+    first = api_server.build_city(files, str(tmp_path), key, precompute_ck=False)
+    edited = {**files, str(tmp_path / "C3.java"): "public class C3 { int y; int z; }"}
+
+    job = Job(id="j", kind="repo")
+    second = api_server.build_city(edited, str(tmp_path), key, job=job, precompute_ck=False)
+    assert scored == [list(files.values()), ["public class C3 { int y; int z; }"]]
+    assert [b["file_path"] for b in second["buildings"]] == [f"C{i}.java" for i in range(5)]
+    assert second["buildings"][:3] == first["buildings"][:3]
+    assert (job.done, job.total) == (5, 5)
+    done = [(event["done"], event["total"]) for _, event in job.events if event["event"] == "file_done"]
+    assert done == [(i, 5) for i in range(1, 6)]
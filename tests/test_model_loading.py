@@ -0,0 +1,106 @@
+"""
+load_models() against stand-in bundles in a temporary models/ directory:
+bundles saved before feature_schema.json existed, string class labels,
+schema drift, broken optional bundles, and the model state /health
+reports.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+import predict_smell_extended as detector
+
+SAMPLE_CODE = """
+public class OrderService {
+    private int total;
+    public int getTotal() { return total; }
+    public void add(int amount) { if (amount > 0) { total += amount; } }
+}
+"""
+
+
+def write_bundle(model_dir: Path, labels, schema=None):
+    """rf + gb + scaler trained on random 32-feature rows with the given labels."""
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(120, len(detector.FEATURE_NAMES)))
+    y = np.array([labels[i % len(labels)] for i in range(len(X))])
+    scaler = StandardScaler().fit(X)
+    joblib.dump(RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y), model_dir / "ultimate_rf.joblib")
+    joblib.dump(GradientBoostingClassifier(n_estimators=5, random_state=0).fit(X, y), model_dir / "ultimate_gb.joblib")
+    joblib.dump(scaler, model_dir / "ultimate_scaler.joblib")
+    if schema is not None:
+        with open(model_dir / "feature_schema.json", "w", encoding="utf-8") as f:
+            json.dump(schema, f)
+
+
+@pytest.fixture
+def model_dir(tmp_path: Path, monkeypatch) -> Path:
+    """Empty models/ directory that load_models() reads from."""
+    models = tmp_path / "models"
+    models.mkdir()
+    monkeypatch.setattr(detector, "BASE", tmp_path)
+    return models
+
+
+def test_legacy_bundle_without_schema(model_dir: Path):
+    """Models trained before feature_schema.json have 6 integer classes."""
+    write_bundle(model_dir, list(range(len(detector.TRAINING_SMELLS))))
+    models = detector.load_models()
+    assert models is not None and 'rf' in models and 'gb' in models
+    assert models['plan'].labels == detector.TRAINING_SMELLS
+    result = detector.predict_smell(SAMPLE_CODE, models)
+    assert result.primary_smell
+    assert detector.model_state(models) == "full"
+
+
+def test_bundle_with_string_classes(model_dir: Path):
+    labels = ["Clean", "DataClass", "FeatureEnvy", "GodClass", "LongMethod"]
+    write_bundle(model_dir, labels)
+    models = detector.load_models()
+    assert models['plan'].labels == labels
+
+
+def test_schema_drift_raises(model_dir: Path):
+    schema = detector.FeaturePlan().schema_dict()
+    schema['labels'] = detector.MODEL_SMELLS            # 5 labels for 6-class models
+    write_bundle(model_dir, list(range(len(detector.TRAINING_SMELLS))), schema)
+    with pytest.raises(detector.FeatureSchemaError):
+        detector.load_models()
+
+
+def test_model_state_without_ck_ensemble():
+    """Only auxiliary models loaded: CK-metric classes fall back to rules."""
+    assert detector.model_state(None) == "none"
+    assert detector.model_state({'text': {}}) == "partial"
+    assert detector.model_components({'text': {}, 'approx': {}}) == ['approx', 'text']
+
+
+def test_unreadable_text_model_keeps_ensemble(model_dir: Path):
+    """A broken optional model is skipped, the CK ensemble still loads."""
+    write_bundle(model_dir, list(range(len(detector.TRAINING_SMELLS))))
+    (model_dir / "ultimate_text.joblib").write_bytes(b"not a joblib file")
+    models = detector.load_models()
+    assert models is not None and 'rf' in models and 'text' not in models
+    assert detector.model_state(models) == "full"
+
+
+def test_text_signal_blended_into_rules():
+    """Without a model for the metrics, the text model still moves the rule confidences."""
+    rules = [("DataClass", 0.8)]
+    text = {"DataClass": 0.0, "GodClass": 0.9, "Clean": 0.1}
+    weights = {"DataClass": 0.5, "GodClass": 0.5, "Clean": 0.5}
+    blended = dict(detector.blend_text_confidences(rules, text, weights))
+    assert blended["DataClass"] == 0.4
+    assert blended["GodClass"] == 0.45                  # Seen by the text model only
+    assert "Clean" not in blended                       # 0.05 is under ML_SMELL_THRESHOLD
+
@@ -0,0 +1,74 @@
+"""
+Prometheus metrics: the text rendering of counters, histograms and gauges,
+and scrapes of preforked workers sharing a directory, which add up the
+counters and histograms of every worker (exited ones included) but only
+the gauges of live ones.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from server_metrics import Registry
+
+
+def registry(gauge_value: float):
+    metrics = Registry()
+    requests = metrics.counter("requests_total", "Requests", ("status",))
+    seconds = metrics.histogram("seconds", "Latency", buckets=(0.1, 1.0))
+    metrics.gauge("busy", "Busy workers", (), lambda: gauge_value)
+    return metrics, requests, seconds
+
+
+def run_exited_worker(directory):
+    """Fork a worker that shares directory, serves 5 requests taking 0.5 s, then exits."""
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            metrics, requests, seconds = registry(1.0)
+            metrics.share(directory)
+            requests.inc(5, status="200")
+            seconds.observe(0.5)
+            metrics.unshare()
+            code = 0
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+
+@pytest.fixture
+def shared(tmp_path):
+    """(metrics, requests, seconds) of a live worker sharing tmp_path."""
+    metrics, requests, seconds = registry(1.0)
+    metrics.share(tmp_path)
+    yield metrics, requests, seconds
+    metrics.unshare()
+
+
+def test_render():
+    metrics, requests, seconds = registry(2.0)
+    requests.inc(status="200")
+    requests.inc(3, status="500")
+    seconds.observe(0.05)
+    seconds.observe(5.0)
+    lines = metrics.render().splitlines()
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{status="200"} 1.0' in lines and 'requests_total{status="500"} 3.0' in lines
+    assert 'seconds_bucket{le="0.1"} 1.0' in lines and 'seconds_bucket{le="+Inf"} 2.0' in lines
+    assert "seconds_count 2.0" in lines and "seconds_sum 5.05" in lines
+    assert "busy 2.0" in lines
+
+
+def test_shared_across_workers(tmp_path, shared):
+    run_exited_worker(tmp_path)
+    metrics, requests, _ = shared
+    requests.inc(status="200")
+    lines = metrics.render().splitlines()
+    assert 'requests_total{status="200"} 6.0' in lines
+    assert 'seconds_bucket{le="1.0"} 1.0' in lines
+    assert "busy 1.0" in lines                      # The exited worker's gauge is gone
+    assert sorted(p.name for p in tmp_path.glob("*.json")) == [f"{os.getpid()}.json", "retired.json"]
@@ -0,0 +1,105 @@
+"""
+Request coalescing and conditional requests: concurrent calls for one key
+share a single computation (and its exception), and the server's weak
+ETags answer unchanged content with 304, separately for the JSON and the
+binary (.bin) city.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+import time
+
+import pytest
+
+import api_server
+import city_codec
+from ck_precompute import CKPrecomputer
+from single_flight import SingleFlight
+
+ORDER = "package shop;\npublic class Order { private int total; public int getTotal() { return total; } }\n"
+
+
+def run_concurrently(flights: SingleFlight, fn, callers: int) -> list:
+    """Call flights.do("key", fn) from several threads while fn blocks; (result or error, shared) per caller."""
+    release, outcomes = threading.Event(), []
+    waiting = threading.Barrier(callers)
+
+    def blocked():
+        release.wait(5)
+        return fn()
+
+    def caller():
+        waiting.wait()
+        try:
+            outcomes.append(flights.do("key", blocked))
+        except Exception as e:
+            outcomes.append((e, True))
+
+    threads = [threading.Thread(target=caller) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    while flights.in_flight() == 0:
+        time.sleep(0.01)
+    time.sleep(0.2)                                     # Let every caller reach do()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def test_concurrent_calls_share_one_computation():
+    calls = []
+    outcomes = run_concurrently(SingleFlight(), lambda: calls.append(1) or len(calls), callers=4)
+    assert calls == [1]
+    assert sorted(outcomes) == [(1, False), (1, True), (1, True), (1, True)]
+
+
+def test_errors_are_shared():
+    outcomes = run_concurrently(SingleFlight(), lambda: 1 / 0, callers=3)
+    assert len(outcomes) == 3 and all(isinstance(error, ZeroDivisionError) for error, _ in outcomes)
+
+
+def test_finished_calls_are_not_cached():
+    flights, calls = SingleFlight(), []
+    assert flights.do("key", lambda: calls.append(1)) == (None, False)
+    assert flights.do("key", lambda: calls.append(1)) == (None, False)
+    assert len(calls) == 2 and flights.in_flight() == 0
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_server, "CK_PRECOMPUTE", CKPrecomputer(tmp_path / "ck_metrics"))
+    return api_server.app.test_client()
+
+
+def test_code_etag(client):
+    first = client.post("/analyze/code", json={"code": ORDER})
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and etag.startswith('W/"')
+    again = client.post("/analyze/code", json={"code": ORDER}, headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["ETag"] == etag
+    changed = client.post("/analyze/code", json={"code": ORDER + "// edited\n"}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+
+
+def test_city_etags_per_representation(client, tmp_path):
+    project = tmp_path / "shop"
+    project.mkdir()
+    (project / "Order.java").write_text(ORDER)
+    body = {"directory": str(project)}
+    binary = {"Accept": city_codec.MIME_TYPE}
+
+    as_json = client.post("/analyze/repo", json=body)
+    as_binary = client.post("/analyze/repo", json=body, headers=binary)
+    json_etag, binary_etag = as_json.headers["ETag"], as_binary.headers["ETag"]
+    assert binary_etag == json_etag[:-1] + '.bin"'
+    assert "Accept" in as_json.headers["Vary"]
+    assert city_codec.decode(as_binary.data)["buildings"][0]["class_name"] == "Order"
+
+    assert client.post("/analyze/repo", json=body, headers={"If-None-Match": json_etag}).status_code == 304
+    assert client.post("/analyze/repo", json=body, headers={**binary, "If-None-Match": binary_etag}).status_code == 304
+    stale = client.post("/analyze/repo", json=body, headers={**binary, "If-None-Match": json_etag})
+    assert stale.status_code == 200 and stale.mimetype == city_codec.MIME_TYPE
@@ -0,0 +1,699 @@
+"""
+CK Metrics Precompute
+======================
+Computes CK-equivalent class metrics for a whole repository in pure Python,
+so submitted repositories get the same features the ML models were trained
+on (instead of the approximate regex metrics used for pasted code).
+
+Per-file metrics (LOC, WMC, METHODS, FIELDS, PRIVATE_METHODS, CBO, LCOM,
+TCC, ATFD, MAX_METHOD_LOC) are computed in parallel worker processes; the
+repository-wide metrics (DIT, NOC) are resolved afterwards over all classes.
+Results are written as ck_metrics/<project>_ck.csv, the format the CK
+metrics store indexes, together with a manifest of per-file content hashes
+so unchanged files can be reused by later requests.
+
+Usage:
+  python ck_precompute.py <directory>
+  python ck_precompute.py <directory> --workers 8
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Configuration
+# ═══════════════════════════════════════════════════════════════════════════════
+
+SCRIPT_DIR = Path(__file__).parent.absolute()
+BASE = SCRIPT_DIR.parent
+CK_DIR = BASE / "ck_metrics"
+sys.path.insert(0, str(BASE))
+
+from ck_store import CK_COLS
+
+# Process pools (here and in the server's analysis pool) spawn their
+# workers: the server process is multi-threaded, so forking it is not safe
+SPAWN_CONTEXT = multiprocessing.get_context("spawn")
+
+# Below this many files the process pool costs more than it saves
+PARALLEL_MIN_FILES = 64
+CHUNK_SIZE = 16
+
+# Bump when the manifest layout changes; older manifests are recomputed
+MANIFEST_VERSION = 2
+
+# Precomputed projects kept in ck_metrics/ (least recently used are deleted)
+MAX_PROJECTS = 64
+
+# java.lang and primitive wrapper types do not count as coupling (as in CK)
+JAVA_LANG_TYPES = {
+    'Object', 'String', 'StringBuilder', 'StringBuffer', 'Integer', 'Long', 'Short', 'Byte',
+    'Double', 'Float', 'Boolean', 'Character', 'Number', 'Math', 'System', 'Void', 'Class',
+    'Enum', 'Record', 'Iterable', 'Comparable', 'CharSequence', 'Runnable', 'Thread',
+    'Exception', 'RuntimeException', 'Error', 'Throwable', 'Override', 'Deprecated',
+    'SuppressWarnings', 'FunctionalInterface', 'SafeVarargs',
+}
+
+KEYWORDS = {
+    'if', 'for', 'while', 'switch', 'catch', 'return', 'new', 'throw', 'else', 'do', 'try',
+    'synchronized', 'super', 'this', 'case', 'assert',
+}
+
+COMMENT_OR_LITERAL = re.compile(
+    r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'', re.DOTALL)
+PACKAGE_RE = re.compile(r'^\s*package\s+([\w.]+)\s*;', re.MULTILINE)
+IMPORT_RE = re.compile(r'^\s*import\s+(?:static\s+)?([\w.]+)(?:\.\*)?\s*;', re.MULTILINE)
+TYPE_DECL_RE = re.compile(r'\b(class|interface|enum|record)\s+(\w+)([^{;]*)\{')
+METHOD_SIG_RE = re.compile(r'(\w+)\s*\([^()]*(?:\([^()]*\)[^()]*)*\)\s*(?:throws\s+[\w.,\s]+)?$')
+BRANCH_RE = re.compile(r'\b(?:if|for|while|case|catch)\b|&&|\|\|')
+TERNARY_RE = re.compile(r'(?<!<)\?(?!\s*(?:extends\b|super\b|[>,]))')
+IDENT_RE = re.compile(r'\b[A-Za-z_]\w*\b')
+TYPE_REF_RE = re.compile(r'\b([A-Z]\w*)\b')
+FOREIGN_ACCESS_RE = re.compile(r'\b([a-z]\w*)\s*\.\s*((?:get|is|has)[A-Z]\w*\s*\(|[a-z]\w*\b(?!\s*\())')
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Data Structures
+# ═══════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class ClassMetrics:
+    """CK metrics for the primary type of one .java file"""
+    file_path: str
+    class_name: str
+    package: str
+    parent: Optional[str]          # Raw `extends` name, resolved repo-wide
+    imports: List[str] = field(default_factory=list)
+    metrics: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def qualified_name(self) -> str:
+        return f"{self.package}.{self.class_name}" if self.package else self.class_name
+
+    def csv_row(self) -> List:
+        return [self.file_path, self.class_name, self.package] + [self.metrics.get(c, 0) for c in CK_COLS]
+
+
+@dataclass
+class _Method:
+    name: str
+    private: bool
+    visible: bool
+    complexity: int
+    loc: int
+    fields_used: set
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Per-File Metrics
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def strip_comments_and_literals(code: str) -> str:
+    """Blank out comments and string/char literals, keeping line structure."""
+    def blank(match):
+        text = match.group(0)
+        if text.startswith(('"', "'")):
+            return '""'
+        return '\n' * text.count('\n')
+    return COMMENT_OR_LITERAL.sub(blank, code)
+
+
+def _match_brace(text: str, open_pos: int) -> int:
+    """Index just past the brace closing the one at open_pos."""
+    depth = 0
+    for pos in range(open_pos, len(text)):
+        ch = text[pos]
+        if ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return pos + 1
+    return len(text)
+
+
+def _count_lines(text: str) -> int:
+    return sum(1 for line in text.split('\n') if line.strip())
+
+
+def _primary_type(clean: str, stem: str) -> Optional[Tuple[str, str, str, int, int]]:
+    """(kind, name, header, body_start, body_end) of the file's top-level type named stem (or the first)."""
+    found = []
+    pos = 0
+    while True:
+        match = TYPE_DECL_RE.search(clean, pos)
+        if not match:
+            break
+        end = _match_brace(clean, match.end() - 1)
+        found.append((match.group(1), match.group(2), match.group(3), match.end(), end - 1))
+        pos = end                     # Skip nested types: only top-level declarations
+    for decl in found:
+        if decl[1] == stem:
+            return decl
+    return found[0] if found else None
+
+
+def _split_members(body: str, kind: str):
+    """
+    Yield (kind, header, block) for the members of a type body.
+
+    kind is 'method', 'field', 'type' or 'init'; block is the method body
+    (None for abstract methods and fields).
+    """
+    segment_start = 0
+    pos = 0
+    if kind == 'enum':
+        # Enum constants run up to the first top-level ';'
+        depth = 0
+        for pos, ch in enumerate(body):
+            if ch in '({':
+                depth += 1
+            elif ch in ')}':
+                depth -= 1
+            elif ch == ';' and depth == 0:
+                break
+        else:
+            return
+        segment_start = pos = pos + 1
+
+    while pos < len(body):
+        ch = body[pos]
+        if ch == '{':
+            header = body[segment_start:pos].strip()
+            end = _match_brace(body, pos)
+            if '=' in header.split('(')[0] or header.endswith(('=', ',')) or '->' in header:
+                pos = end             # Initializer block/anonymous class inside a field declaration
+                continue
+            if re.search(r'\b(class|interface|enum|record)\s+\w+', header):
+                yield 'type', header, None
+            elif METHOD_SIG_RE.search(header):
+                yield 'method', header, body[pos:end]
+            else:
+                yield 'init', header, body[pos:end]
+            segment_start = pos = end
+            continue
+        if ch == ';':
+            header = body[segment_start:pos].strip()
+            if header:
+                if METHOD_SIG_RE.search(header) and '=' not in header:
+                    yield 'method', header, None
+                else:
+                    yield 'field', header, None
+            segment_start = pos + 1
+        pos += 1
+
+
+def _field_names(declaration: str) -> List[str]:
+    """Names declared by one field statement (handles `int a = 1, b;`)."""
+    names = []
+    depth = 0
+    part_start = 0
+    parts = []
+    for i, ch in enumerate(declaration):
+        if ch in '<([{':
+            depth += 1
+        elif ch in '>)]}':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            parts.append(declaration[part_start:i])
+            part_start = i + 1
+    parts.append(declaration[part_start:])
+    for part in parts:
+        lhs = part.split('=')[0].strip()
+        match = re.search(r'(\w+)\s*(?:\[\s*\])*$', lhs)
+        if match:
+            names.append(match.group(1))
+    return names
+
+
+def compute_file_metrics(item: Tuple[str, str]) -> Optional[ClassMetrics]:
+    """
+    CK metrics for the primary type of one file.
+
+    Args:
+        item: (file_path, source code)
+
+    Returns:
+        ClassMetrics with DIT/NOC still unset, or None if no type is declared
+    """
+    file_path, code = item
+    clean = strip_comments_and_literals(code)
+    stem = Path(file_path.replace('\\', '/')).stem
+    decl = _primary_type(clean, stem)
+    if decl is None:
+        return None
+    kind, class_name, header, body_start, body_end = decl
+    body = clean[body_start:body_end]
+
+    package_match = PACKAGE_RE.search(clean)
+    extends = re.search(r'\bextends\s+([\w.]+)', header) if kind == 'class' else None
+
+    methods: List[_Method] = []
+    field_names: List[str] = []
+    type_params = set(re.findall(r'<\s*(\w+)', header))
+    for member_kind, member_header, block in _split_members(body, kind):
+        if member_kind == 'field':
+            field_names.extend(_field_names(member_header))
+        elif member_kind == 'method':
+            name = METHOD_SIG_RE.search(member_header).group(1)
+            modifiers = member_header.split(name)[0]
+            text = block or ''
+            complexity = 1 + len(BRANCH_RE.findall(text)) + len(TERNARY_RE.findall(text))
+            methods.append(_Method(
+                name=name,
+                private='private' in modifiers,
+                visible='private' not in modifiers,
+                complexity=complexity,
+                loc=_count_lines(member_header + text),
+                fields_used=set(IDENT_RE.findall(text)),
+            ))
+    fields = set(field_names)
+    for method in methods:
+        method.fields_used &= fields
+
+    # LCOM (CK): method pairs sharing no field minus pairs sharing one, floored at 0
+    shared = disjoint = 0
+    for i in range(len(methods)):
+        for j in range(i + 1, len(methods)):
+            if methods[i].fields_used & methods[j].fields_used:
+                shared += 1
+            else:
+                disjoint += 1
+    lcom = max(disjoint - shared, 0)
+
+    # TCC: fraction of visible method pairs directly connected through a field
+    visible = [m for m in methods if m.visible]
+    pairs = len(visible) * (len(visible) - 1) // 2
+    connected = sum(1 for i in range(len(visible)) for j in range(i + 1, len(visible))
+                    if visible[i].fields_used & visible[j].fields_used)
+    tcc = connected / pairs if pairs else 0.0
+
+    # CBO: distinct non-java.lang types referenced by the class
+    referenced = set(TYPE_REF_RE.findall(clean[body_start:body_end] + header))
+    referenced = {t for t in referenced if not t.isupper()} - JAVA_LANG_TYPES - type_params - {class_name}
+
+    # ATFD: distinct foreign attributes read directly or through accessors
+    foreign = {
+        (receiver, member.split('(')[0].strip())
+        for receiver, member in FOREIGN_ACCESS_RE.findall(body)
+        if receiver not in KEYWORDS and receiver not in ('this', 'super')
+        and not member.strip().startswith(('length', 'class'))
+    }
+
+    return ClassMetrics(
+        file_path=file_path,
+        class_name=class_name,
+        package=package_match.group(1) if package_match else '',
+        parent=extends.group(1) if extends else None,
+        imports=IMPORT_RE.findall(clean),
+        metrics={
+            'LOC': _count_lines(clean[clean.rfind('\n', 0, body_start) + 1:body_end + 1]),
+            'WMC': sum(m.complexity for m in methods),
+            'METHODS': len(methods),
+            'FIELDS': len(field_names),
+            'PRIVATE_METHODS': sum(1 for m in methods if m.private),
+            'CBO': len(referenced),
+            'LCOM': lcom,
+            'TCC': round(tcc, 6),
+            'ATFD': len(foreign),
+            'MAX_METHOD_LOC': max((m.loc for m in methods), default=0),
+        },
+    )
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Repository-Wide Metrics
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def resolve_hierarchy(classes: List[ClassMetrics]):
+    """
+    Fill DIT and NOC from the repository's inheritance graph.
+
+    Parents are resolved like javac would for simple names: explicit
+    qualified name, then single-type imports, then the same package, then a
+    unique simple name anywhere in the repository. Parents outside the
+    repository count as one level below java.lang.Object.
+    """
+    by_qualified = {c.qualified_name: c for c in classes}
+    by_simple: Dict[str, List[ClassMetrics]] = {}
+    for c in classes:
+        by_simple.setdefault(c.class_name, []).append(c)
+
+    def resolve(c: ClassMetrics) -> Optional[ClassMetrics]:
+        name = c.parent
+        if not name:
+            return None
+        if '.' in name:
+            return by_qualified.get(name)
+        for imported in c.imports:
+            if imported.endswith('.' + name):
+                return by_qualified.get(imported)
+        same_package = by_qualified.get(f"{c.package}.{name}" if c.package else name)
+        if same_package:
+            return same_package
+        candidates = by_simple.get(name, [])
+        return candidates[0] if len(candidates) == 1 else None
+
+    parents = {id(c): resolve(c) for c in classes}
+    children: Dict[int, int] = {}
+    for c in classes:
+        parent = parents[id(c)]
+        if parent is not None:
+            children[id(parent)] = children.get(id(parent), 0) + 1
+
+    depth_cache: Dict[int, int] = {}
+
+    def depth(c: ClassMetrics) -> int:
+        chain, node = [], c
+        while node is not None and id(node) not in depth_cache and node not in chain:
+            chain.append(node)
+            node = parents[id(node)]
+        base = depth_cache.get(id(node), 0) if node is not None else 0
+        for member in reversed(chain):
+            parent = parents[id(member)]
+            if parent is None:
+                base = 2 if member.parent else 1   # Unknown external parent, or Object
+            else:
+                base += 1
+            depth_cache[id(member)] = base
+        return depth_cache[id(c)]
+
+    for c in classes:
+        c.metrics['DIT'] = depth(c)
+        c.metrics['NOC'] = children.get(id(c), 0)
+
+
+def compute_repo_metrics(files: Dict[str, str], workers: Optional[int] = None) -> List[ClassMetrics]:
+    """
+    CK metrics for every file of a repository.
+
+    Args:
+        files: Mapping of file path to source code
+        workers: Worker processes (default: CPU count); small inputs run inline
+
+    Returns:
+        One ClassMetrics per file that declares a type
+    """
+    items = list(files.items())
+    workers = workers or os.cpu_count() or 1
+    if len(items) < PARALLEL_MIN_FILES or workers == 1:
+        results = [compute_file_metrics(item) for item in items]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=SPAWN_CONTEXT) as pool:
+            results = list(pool.map(compute_file_metrics, items, chunksize=CHUNK_SIZE))
+    classes = [c for c in results if c is not None]
+    resolve_hierarchy(classes)
+    return classes
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Background Precompute for Submitted Repositories
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def project_slug(project_key: str) -> str:
+    """Stable file-system name for a project (local directory or repo URL)."""
+    name = re.sub(r'[^\w.-]+', '-', project_key.rstrip('/\\').split('/')[-1].split('\\')[-1]) or "repo"
+    digest = hashlib.sha1(project_key.encode('utf-8')).hexdigest()[:10]
+    return f"repo-{name}-{digest}"
+
+
+def content_hash(code: str) -> str:
+    return hashlib.sha1(code.encode('utf-8', errors='ignore')).hexdigest()
+
+
+def write_project(ck_dir: Path, project_key: str, files: Dict[str, str],
+                  workers: Optional[int] = None) -> Tuple[List[ClassMetrics], Dict[str, Dict[str, str]]]:
+    """
+    Compute a project's CK metrics and write <slug>_ck.csv plus its manifest.
+
+    Args:
+        ck_dir: Directory holding the *_ck.csv files
+        project_key: Absolute directory path or repository URL
+        files: Mapping of path relative to the project root to source code
+        workers: Worker processes
+
+    Returns:
+        (classes with a CSV row, manifest {"files", "skipped"})
+    """
+    slug = project_slug(project_key)
+    store_files = {f"{slug}/{rel.replace(os.sep, '/')}": code for rel, code in files.items()}
+    classes = compute_repo_metrics(store_files, workers)
+    write_ck_csv(classes, ck_dir / f"{slug}_ck.csv")
+    # Only files with a row may be looked up; the rest are recorded so
+    # they do not trigger another precompute
+    with_row = {c.file_path for c in classes}
+    manifest: Dict[str, Dict[str, str]] = {"files": {}, "skipped": {}}
+    for rel, code in files.items():
+        rel = rel.replace(os.sep, '/')
+        manifest["files" if f"{slug}/{rel}" in with_row else "skipped"][rel] = content_hash(code)
+    (ck_dir / f"{slug}_ck.json").write_text(json.dumps(
+        {"version": MANIFEST_VERSION, "project_key": project_key, **manifest}))
+    return classes, manifest
+
+
+def evict_projects(ck_dir: Path, keep: int) -> List[str]:
+    """
+    Delete the CSVs and manifests of all but the `keep` most recently used
+    precomputed projects (by manifest mtime, see CKPrecomputer.submit).
+
+    Returns:
+        Slugs of the deleted projects
+    """
+    manifests = []
+    for path in ck_dir.glob("repo-*_ck.json"):
+        try:
+            manifests.append((path.stat().st_mtime_ns, path))
+        except OSError:
+            continue
+    manifests.sort()
+    evicted = []
+    for _, path in manifests[:max(len(manifests) - keep, 0)]:
+        slug = path.name[:-len("_ck.json")]
+        for stale in (ck_dir / f"{slug}_ck.csv", path):
+            try:
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+        evicted.append(slug)
+    return evicted
+
+
+class CKPrecomputer:
+    """
+    Runs repository precomputes in the background, one at a time.
+
+    Each project's metrics are written to ck_metrics/<slug>_ck.csv with
+    file paths '<slug>/<relative path>', and a manifest <slug>_ck.json of
+    per-file content hashes: "files" for files that got a CSV row, "skipped"
+    for files that declare no type (no row, nothing to look up). Files in
+    "files" whose hash still matches can be looked up in the CK metrics
+    store under exactly that path. The command line (main) writes the same
+    layout.
+
+    Only the max_projects most recently used projects are kept on disk;
+    status entries of finished precomputes are bounded the same way.
+    """
+
+    def __init__(self, ck_dir: Path = CK_DIR, workers: Optional[int] = None, on_update=None,
+                 max_projects: int = MAX_PROJECTS):
+        """
+        Args:
+            ck_dir: Directory holding the *_ck.csv files
+            workers: Worker processes per precompute
+            on_update: Called after a project's CSV is written or evicted (e.g. to refresh the store)
+            max_projects: Precomputed projects kept on disk (least recently used are deleted)
+        """
+        self.ck_dir = Path(ck_dir)
+        self.workers = workers
+        self.on_update = on_update
+        self.max_projects = max_projects
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ck-precompute")
+        self._lock = threading.Lock()
+        self._status: Dict[str, Dict] = {}
+        self._manifests: Dict[str, Dict[str, Dict[str, str]]] = {}
+
+    def _manifest(self, slug: str) -> Dict[str, Dict[str, str]]:
+        """{"files": rel -> hash (files with a CSV row), "skipped": rel -> hash (no row)}."""
+        if slug not in self._manifests:
+            path = self.ck_dir / f"{slug}_ck.json"
+            try:
+                data = json.loads(path.read_text())
+                if data.get("version") != MANIFEST_VERSION:
+                    raise ValueError("outdated manifest")
+                self._manifests[slug] = {"files": data["files"], "skipped": data["skipped"]}
+            except (OSError, ValueError, KeyError):
+                return {"files": {}, "skipped": {}}
+        return self._manifests[slug]
+
+    def _set_status_locked(self, project_key: str, status: Dict):
+        """Record a status; beyond max_projects the oldest finished ones are forgotten."""
+        self._status.pop(project_key, None)
+        self._status[project_key] = status
+        finished = [key for key, st in self._status.items() if st.get("state") not in ("queued", "running")]
+        for key in finished[:max(len(finished) - self.max_projects, 0)]:
+            del self._status[key]
+
+    def current_paths(self, project_key: str, files: Dict[str, str]) -> Dict[str, str]:
+        """
+        Store paths for the files whose precomputed metrics are up to date.
+
+        Args:
+            project_key: Directory path or repository URL
+            files: Mapping of relative path to source code
+
+        Returns:
+            Mapping of relative path to the path to look up in the CK store
+        """
+        slug = project_slug(project_key)
+        with self._lock:
+            manifest = self._manifest(slug)["files"]
+        return {
+            rel: f"{slug}/{rel.replace(os.sep, '/')}"
+            for rel, code in files.items()
+            if manifest.get(rel.replace(os.sep, '/')) == content_hash(code)
+        }
+
+    def is_current(self, project_key: str, files: Dict[str, str]) -> bool:
+        """True when every file is precomputed, with or without a CSV row."""
+        with self._lock:
+            manifest = self._manifest(project_slug(project_key))
+        for rel, code in files.items():
+            rel = rel.replace(os.sep, '/')
+            recorded = manifest["files"].get(rel) or manifest["skipped"].get(rel)
+            if recorded != content_hash(code):
+                return False
+        return True
+
+    def status(self, project_key: str) -> Dict:
+        with self._lock:
+            return dict(self._status.get(project_key, {"state": "none"}))
+
+    def busy(self) -> bool:
+        """True while any precompute is queued or running."""
+        with self._lock:
+            return any(st.get("state") in ("queued", "running") for st in self._status.values())
+
+    def submit(self, project_key: str, files: Dict[str, str]) -> Dict:
+        """
+        Schedule a precompute unless one is running or every file is current.
+        A current project counts as used, so it is evicted last.
+
+        Returns:
+            The project's status after scheduling
+        """
+        if self.is_current(project_key, files):
+            try:
+                os.utime(self.ck_dir / f"{project_slug(project_key)}_ck.json")
+            except OSError:
+                pass
+            with self._lock:
+                if project_key not in self._status:
+                    self._set_status_locked(project_key, {"state": "ready"})
+            return self.status(project_key)
+        with self._lock:
+            if self._status.get(project_key, {}).get("state") in ("queued", "running"):
+                return dict(self._status[project_key])
+            self._set_status_locked(project_key, {"state": "queued", "files": len(files)})
+        self._executor.submit(self._run, project_key, dict(files))
+        return self.status(project_key)
+
+    def _run(self, project_key: str, files: Dict[str, str]):
+        slug = project_slug(project_key)
+        with self._lock:
+            self._set_status_locked(project_key, {"state": "running", "files": len(files)})
+        start = time.perf_counter()
+        try:
+            classes, manifest = write_project(self.ck_dir, project_key, files, self.workers)
+            evicted = evict_projects(self.ck_dir, self.max_projects)
+            with self._lock:
+                self._manifests[slug] = manifest
+                for old in evicted:
+                    self._manifests.pop(old, None)
+                for key in [key for key in self._status if project_slug(key) in evicted]:
+                    del self._status[key]
+            if self.on_update:
+                self.on_update()
+            with self._lock:
+                self._set_status_locked(project_key, {
+                    "state": "ready", "files": len(files), "classes": len(classes),
+                    "seconds": round(time.perf_counter() - start, 2),
+                })
+        except Exception as e:
+            print(f"⚠️ CK precompute failed for {project_key}: {e}")
+            with self._lock:
+                self._set_status_locked(project_key, {"state": "failed", "error": str(e)})
+
+
+def write_ck_csv(classes: List[ClassMetrics], path: Path):
+    """Write metrics in the ck_metrics CSV layout (atomically)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Unique temporary name: concurrent writers of the same CSV never share one
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f"{path.stem}.", suffix='.tmp')
+    try:
+        with open(fd, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['file_path', 'class_name', 'package'] + CK_COLS)
+            for c in classes:
+                writer.writerow(c.csv_row())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# Main
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def main():
+    """Main entry point"""
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    directory = sys.argv[1]
+    workers = None
+    if "--workers" in sys.argv:
+        idx = sys.argv.index("--workers")
+        if idx + 1 < len(sys.argv):
+            workers = int(sys.argv[idx + 1])
+
+    if not os.path.isdir(directory):
+        print(f"❌ Directory not found: {directory}")
+        sys.exit(1)
+
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.endswith('.java'):
+                path = os.path.join(root, name)
+                with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                    files[os.path.relpath(path, directory)] = f.read()
+
+    # Same project key, paths and manifest as the server's precompute
+    project_key = os.path.abspath(directory)
+    start = time.perf_counter()
+    classes, _ = write_project(CK_DIR, project_key, files, workers)
+    elapsed = time.perf_counter() - start
+    evicted = evict_projects(CK_DIR, MAX_PROJECTS)
+
+    print(f"✓ Computed CK metrics for {len(classes)} classes ({len(files)} files) in {elapsed:.2f}s")
+    print(f"  Written to {CK_DIR / (project_slug(project_key) + '_ck.csv')}")
+    if evicted:
+        print(f"  Evicted {len(evicted)} least recently used project(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,10 +12,19 @@ Target: Macro F1 > 0.80
 
 Run:
     python ultimate_model.py
+    python ultimate_model.py --prune [--latency-budget-ms 2.5]
+
+--prune measures every servable ensemble member (per-file latency and marginal
+macro F1, plus a Random Forest tree-count curve) and writes
+models/ensemble_config.json, which predict_smell_extended.load_models() uses to
+serve the best ensemble that fits the latency budget.
 """
 
+import itertools
 import json
 import os
+import sys
+import time
 import numpy as np
 import pandas as pd
 from sklearn.ensemble import (
@@ -24,7 +33,9 @@ from sklearn.ensemble import (
     StackingClassifier,
     VotingClassifier
 )
-from sklearn.linear_model import LogisticRegression
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.pipeline import make_pipeline
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import f1_score, classification_report, confusion_matrix
 from sklearn.model_selection import cross_val_score, StratifiedKFold
@@ -34,6 +45,9 @@ import joblib
 import warnings
 warnings.filterwarnings('ignore')
 
+# Serving-side regex metric extraction, for the approximate-metrics model
+import predict_smell_extended as serving
+
 # Try to import XGBoost
 try:
     from xgboost import XGBClassifier
@@ -43,79 +57,41 @@ except ImportError:
     print("⚠️  XGBoost not installed. Run: pip install xgboost")
 
 BASE = os.path.dirname(os.path.abspath(__file__))
-SMELLS = ["Clean", "DataClass", "DeadCode", "FeatureEnvy", "GodClass", "LongMethod"]
+
+# Ensemble pruning analysis (see module docstring)
+PRUNE_MODE = "--prune" in sys.argv
+LATENCY_BUDGET_MS = None
+if "--latency-budget-ms" in sys.argv:
+    idx = sys.argv.index("--latency-budget-ms")
+    if idx + 1 < len(sys.argv):
+        LATENCY_BUDGET_MS = float(sys.argv[idx + 1])
+RF_TREE_GRID = [10, 25, 50, 100, 200, 300, 500]
+
+# Hashed token n-grams over raw_code: identifiers, numbers and single operators
+JAVA_TOKEN_PATTERN = r"[A-Za-z_$][A-Za-z0-9_$]*|\d+|[{}()\[\];.,=<>!&|+\-*/%?:@]"
+TEXT_HASH_FEATURES = 2 ** 18
+
+SMELLS = serving.TRAINING_SMELLS
 smell_to_idx = {s: i for i, s in enumerate(SMELLS)}
 idx_to_smell = {i: s for i, s in enumerate(SMELLS)}
 
-# CK metric columns
-CK_COLS = ['LOC', 'WMC', 'METHODS', 'FIELDS', 'PRIVATE_METHODS', 
-           'CBO', 'DIT', 'LCOM', 'TCC', 'ATFD', 'MAX_METHOD_LOC', 'NOC']
-
-def extract_ck_features(row):
-    return [float(row.get(col, 0) or 0) for col in CK_COLS]
-
-def add_derived_features(X):
-    """Add engineered features for better smell detection."""
-    X_new = []
-    for row in X:
-        features = list(row)
-        
-        # Base metrics with safety
-        loc = max(row[CK_COLS.index('LOC')], 1)
-        wmc = max(row[CK_COLS.index('WMC')], 1)
-        methods = max(row[CK_COLS.index('METHODS')], 1)
-        fields = max(row[CK_COLS.index('FIELDS')], 0)
-        cbo = max(row[CK_COLS.index('CBO')], 0)
-        lcom = max(row[CK_COLS.index('LCOM')], 0)
-        max_method_loc = max(row[CK_COLS.index('MAX_METHOD_LOC')], 1)
-        atfd = max(row[CK_COLS.index('ATFD')], 0)
-        tcc = max(row[CK_COLS.index('TCC')], 0.001)
-        dit = max(row[CK_COLS.index('DIT')], 0)
-        noc = max(row[CK_COLS.index('NOC')], 0)
-        private_methods = max(row[CK_COLS.index('PRIVATE_METHODS')], 0)
-        
-        # Derived features
-        features.extend([
-            # Complexity ratios
-            wmc / methods,                      # Avg complexity per method
-            loc / methods,                      # Avg LOC per method
-            max_method_loc / loc,               # Longest method ratio
-            
-            # Data class indicators
-            fields / (fields + methods + 1),   # Data-heaviness ratio
-            fields / methods if methods > 0 else 0,  # Field to method ratio
-            
-            # God class indicators
-            wmc * loc / 1000,                   # Size-complexity product
-            cbo * wmc / 100,                    # Coupling * Complexity
-            methods * cbo / 100,                # Methods * Coupling
-            
-            # Feature envy indicators
-            atfd / (methods + 1),               # External access per method
-            cbo / (methods + 1),                # Coupling per method
-            
-            # Long method indicators
-            max_method_loc,                     # Absolute longest method
-            max_method_loc / methods,           # Longest vs avg
-            
-            # Cohesion indicators
-            lcom / (methods + 1),               # Lack of cohesion per method
-            1 / (tcc + 0.001),                  # Inverse TCC
-            
-            # Encapsulation
-            private_methods / (methods + 1),    # Encapsulation ratio
-            
-            # Hierarchy
-            dit + noc,                          # Inheritance depth + children
-            
-            # Interactions (non-linear features help!)
-            np.log1p(loc),                      # Log LOC
-            np.log1p(wmc),                      # Log WMC
-            np.sqrt(cbo * wmc),                 # Sqrt of coupling-complexity
-            loc ** 0.5 * wmc ** 0.5,            # Geometric mean size-complexity
-        ])
-        X_new.append(features)
-    return np.array(X_new)
+# CK metric columns (defined once, by the CK metrics store)
+CK_COLS = serving.CK_COLS
+
+# Column names of the 20 derived features, in order.
+# Owned by the serving module and written to models/feature_schema.json;
+# predict_smell_extended refuses to load models whose schema differs from
+# what it computes, so there is a single list to keep in sync.
+FEATURE_SCHEMA_VERSION = serving.FEATURE_SCHEMA_VERSION
+DERIVED_FEATURES = serving.DERIVED_FEATURES
+
+# Training derives its features with the same FeaturePlan that serving
+# uses, so the formulas exist only once
+FEATURE_PLAN = serving.FeaturePlan()
+
+def ck_features(records):
+    """(N, 32) feature matrix of dataset rows: CK_COLS values plus the derived features."""
+    return FEATURE_PLAN.transform(FEATURE_PLAN.base_matrix(records))
 
 print()
 print("=" * 90)
@@ -148,14 +124,9 @@ print()
 # ═══════════════════════════════════════════════════════════════════════════════
 print("⚙️  Preparing features...")
 
-X_train = np.array([extract_ck_features(row) for row in train_df.to_dict('records')])
-X_test = np.array([extract_ck_features(row) for row in test_df.to_dict('records')])
-
-X_train = add_derived_features(X_train)
-X_test = add_derived_features(X_test)
-
-X_train = np.nan_to_num(X_train, nan=0.0, posinf=0.0, neginf=0.0)
-X_test = np.nan_to_num(X_test, nan=0.0, posinf=0.0, neginf=0.0)
+X_train = ck_features(train_df.to_dict('records'))
+X_test = ck_features(test_df.to_dict('records'))
+assert X_train.shape[1] == len(CK_COLS) + len(DERIVED_FEATURES), "Feature schema out of sync"
 
 scaler = StandardScaler()
 X_train_scaled = scaler.fit_transform(X_train)
@@ -282,6 +253,70 @@ codebert_f1 = f1_score(y_test, codebert_pred, average='macro')
 print(f"   CodeBERT Macro F1: {codebert_f1:.3f}")
 print()
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# HASHED N-GRAM TEXT MODEL (CPU-cheap CodeBERT substitute for serving)
+# ═══════════════════════════════════════════════════════════════════════════════
+print("🔤 Training hashed n-gram text model...")
+
+# Stateless hashing: nothing to fit or store besides the linear weights, and a
+# single file vectorizes in well under a millisecond at request time.
+text_model = make_pipeline(
+    HashingVectorizer(
+        token_pattern=JAVA_TOKEN_PATTERN,
+        lowercase=False,
+        ngram_range=(1, 3),
+        n_features=TEXT_HASH_FEATURES,
+        alternate_sign=False,
+        norm='l2',
+        dtype=np.float32,
+    ),
+    SGDClassifier(
+        loss='log_loss',
+        alpha=1e-5,
+        max_iter=50,
+        tol=1e-4,
+        class_weight=class_weight_dict,
+        random_state=42,
+    ),
+)
+text_model.fit(train_df["raw_code"].fillna("").values, y_train)
+text_proba = text_model.predict_proba(test_df["raw_code"].fillna("").values)
+text_pred = np.argmax(text_proba, axis=1)
+text_f1 = f1_score(y_test, text_pred, average='macro')
+print(f"   Text n-gram Macro F1: {text_f1:.3f}")
+print()
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# APPROXIMATE-METRICS MODEL (pasted code without CK metrics)
+# ═══════════════════════════════════════════════════════════════════════════════
+print("📝 Training approximate-metrics model...")
+
+# Same 32 features, but computed from raw_code by the regex extractor that
+# predict_smell falls back to when no CK metrics exist for a file.
+def approx_features(codes):
+    return ck_features([serving.extract_metrics(code) for code in codes])
+
+X_train_approx = approx_features(train_df["raw_code"].fillna("").values)
+X_test_approx = approx_features(test_df["raw_code"].fillna("").values)
+
+approx_scaler = StandardScaler()
+X_train_approx_scaled = approx_scaler.fit_transform(X_train_approx)
+X_test_approx_scaled = approx_scaler.transform(X_test_approx)
+
+approx_model = GradientBoostingClassifier(
+    n_estimators=150,
+    max_depth=5,
+    learning_rate=0.1,
+    min_samples_split=5,
+    random_state=42
+)
+approx_model.fit(X_train_approx_scaled, y_train,
+                 sample_weight=np.array([class_weight_dict[y] for y in y_train]))
+approx_pred = approx_model.predict(X_test_approx_scaled)
+approx_f1 = f1_score(y_test, approx_pred, average='macro')
+print(f"   Approx-metrics Macro F1: {approx_f1:.3f}")
+print()
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # STACKING ENSEMBLE
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -331,6 +366,14 @@ for i in range(len(y_test)):
 optimal_ensemble_proba = optimal_ensemble_proba / optimal_ensemble_proba.sum(axis=1, keepdims=True)
 optimal_pred = np.argmax(optimal_ensemble_proba, axis=1)
 
+# Served ensemble: the same per-class blend with the text model standing in for
+# CodeBERT, which is what predict_smell can compute per request
+text_blend_weights = np.array([CLASS_MODEL_WEIGHTS[c]['codebert'] for c in range(6)])
+served_ensemble_proba = text_blend_weights * text_proba + (1 - text_blend_weights) * ck_ensemble_proba
+served_ensemble_proba = served_ensemble_proba / served_ensemble_proba.sum(axis=1, keepdims=True)
+served_pred = np.argmax(served_ensemble_proba, axis=1)
+served_f1 = f1_score(y_test, served_pred, average='macro')
+
 print()
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -357,8 +400,11 @@ print(f"{'Random Forest':<30} {(rf_pred == y_test).mean()*100:>11.1f}% {rf_f1:>1
 print(f"{'Gradient Boosting':<30} {(gb_pred == y_test).mean()*100:>11.1f}% {gb_f1:>12.3f}")
 if HAS_XGBOOST:
     print(f"{'XGBoost':<30} {(xgb_pred == y_test).mean()*100:>11.1f}% {xgb_f1:>12.3f}")
+print(f"{'Approx-metrics (pasted code)':<30} {(approx_pred == y_test).mean()*100:>11.1f}% {approx_f1:>12.3f}")
+print(f"{'Text n-gram':<30} {(text_pred == y_test).mean()*100:>11.1f}% {text_f1:>12.3f}")
 print(f"{'Basic Ensemble':<30} {basic_ensemble_acc*100:>11.1f}% {basic_ensemble_f1:>12.3f}")
 print(f"{'🏆 OPTIMAL ENSEMBLE':<30} {optimal_acc*100:>11.1f}% {optimal_f1:>12.3f}")
+print(f"{'Served (CK + Text) Ensemble':<30} {(served_pred == y_test).mean()*100:>11.1f}% {served_f1:>12.3f}")
 print()
 
 # Per-class breakdown
@@ -411,6 +457,24 @@ joblib.dump(gb, os.path.join(BASE, "models", "ultimate_gb.joblib"))
 if HAS_XGBOOST:
     joblib.dump(xgb, os.path.join(BASE, "models", "ultimate_xgb.joblib"))
 joblib.dump(scaler, os.path.join(BASE, "models", "ultimate_scaler.joblib"))
+with open(os.path.join(BASE, "models", "feature_schema.json"), "w") as f:
+    json.dump({
+        "version": FEATURE_SCHEMA_VERSION,
+        "base_columns": CK_COLS,
+        "derived_features": DERIVED_FEATURES,
+        "labels": SMELLS,
+    }, f, indent=2)
+joblib.dump({
+    "pipeline": text_model,
+    "labels": SMELLS,
+    # Per-class share of the text model in the served blend (rest goes to CK)
+    "blend_weights": {smell: CLASS_MODEL_WEIGHTS[i]['codebert'] for i, smell in enumerate(SMELLS)},
+}, os.path.join(BASE, "models", "ultimate_text.joblib"))
+joblib.dump({
+    "model": approx_model,
+    "scaler": approx_scaler,
+    "labels": SMELLS,
+}, os.path.join(BASE, "models", "ultimate_approx.joblib"))
 
 # Save results
 results = {
@@ -420,6 +484,9 @@ results = {
     "rf_f1": float(rf_f1),
     "gb_f1": float(gb_f1),
     "xgb_f1": float(xgb_f1) if HAS_XGBOOST else None,
+    "text_f1": float(text_f1),
+    "approx_metrics_f1": float(approx_f1),
+    "served_text_ensemble_f1": float(served_f1),
     "per_class_f1": {
         smell: float(f1_score(y_test, optimal_pred, labels=[i], average='macro', zero_division=0))
         for i, smell in enumerate(SMELLS)
@@ -430,6 +497,134 @@ results = {
 with open(os.path.join(BASE, "models", "ultimate_results.json"), "w") as f:
     json.dump(results, f, indent=2)
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# ENSEMBLE PRUNING ANALYSIS (--prune)
+# ═══════════════════════════════════════════════════════════════════════════════
+# predict_smell serves the CK members (RF, GB, XGB) one file at a time, averaging
+# their probabilities. CodeBERT is offline-only, so it is not a pruning candidate.
+
+def single_row_latency_ms(model, X, samples=200):
+    """Median predict_proba latency (ms) for one file, as predict_smell calls it."""
+    model.predict_proba(X[:1])  # Warm-up
+    rows = np.linspace(0, len(X) - 1, num=min(samples, len(X)), dtype=int)
+    timings = []
+    for i in rows:
+        start = time.perf_counter()
+        model.predict_proba(X[i:i + 1])
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+def served_f1(probas):
+    """Macro F1 of the uniform probability average predict_smell computes."""
+    return f1_score(y_test, np.argmax(np.mean(probas, axis=0), axis=1), average='macro')
+
+if PRUNE_MODE:
+    print("=" * 90)
+    print("✂️  ENSEMBLE PRUNING ANALYSIS")
+    print("=" * 90)
+    print()
+
+    member_models = {'rf': serving.truncate_forest(rf, rf.n_estimators), 'gb': gb}
+    member_proba = {'rf': rf_proba, 'gb': gb_proba}
+    if HAS_XGBOOST and xgb is not None:
+        xgb.set_params(n_jobs=1)
+        member_models['xgb'] = xgb
+        member_proba['xgb'] = xgb_proba
+
+    member_latency = {name: single_row_latency_ms(model, X_test_scaled)
+                      for name, model in member_models.items()}
+    full_f1 = served_f1(list(member_proba.values()))
+    marginal_f1 = {
+        name: float(full_f1 - served_f1([p for m, p in member_proba.items() if m != name]))
+        if len(member_proba) > 1 else float(full_f1)
+        for name in member_proba
+    }
+
+    print(f"{'Member':<10} {'Latency (ms)':>14} {'Marginal F1':>14}")
+    print("-" * 40)
+    for name in member_models:
+        print(f"{name:<10} {member_latency[name]:>14.3f} {marginal_f1[name]:>+14.3f}")
+    print(f"   Served CK ensemble Macro F1: {full_f1:.3f}")
+    print()
+
+    # RF pruning curve: the first n trees of the fitted forest
+    rf_curve = []
+    rf_variants = {}
+    for n_trees in sorted(set(t for t in RF_TREE_GRID if t < rf.n_estimators) | {rf.n_estimators}):
+        pruned_rf = serving.truncate_forest(rf, n_trees)
+        proba = pruned_rf.predict_proba(X_test_scaled)
+        latency = single_row_latency_ms(pruned_rf, X_test_scaled)
+        rf_variants[n_trees] = (proba, latency)
+        rf_curve.append({
+            "n_estimators": n_trees,
+            "latency_ms": latency,
+            "macro_f1": float(f1_score(y_test, np.argmax(proba, axis=1), average='macro')),
+        })
+
+    print("RF tree-count pruning curve:")
+    print(f"{'Trees':>8} {'Latency (ms)':>14} {'RF Macro F1':>14}")
+    for point in rf_curve:
+        print(f"{point['n_estimators']:>8} {point['latency_ms']:>14.3f} {point['macro_f1']:>14.3f}")
+    print()
+
+    # Every member subset (and RF size) -> (latency, served F1), then keep the
+    # Pareto frontier: each entry is the cheapest way to reach its F1.
+    candidates = []
+    for k in range(1, len(member_models) + 1):
+        for subset in itertools.combinations(member_models, k):
+            rf_sizes = sorted(rf_variants) if 'rf' in subset else [None]
+            for n_trees in rf_sizes:
+                probas, latency = [], 0.0
+                for name in subset:
+                    if name == 'rf':
+                        proba, rf_latency = rf_variants[n_trees]
+                        probas.append(proba)
+                        latency += rf_latency
+                    else:
+                        probas.append(member_proba[name])
+                        latency += member_latency[name]
+                candidates.append({
+                    "members": list(subset),
+                    "rf_n_estimators": n_trees,
+                    "latency_ms": latency,
+                    "macro_f1": float(served_f1(probas)),
+                })
+
+    frontier = []
+    for cand in sorted(candidates, key=lambda c: (c["latency_ms"], -c["macro_f1"])):
+        if not frontier or cand["macro_f1"] > frontier[-1]["macro_f1"] + 1e-9:
+            frontier.append(cand)
+
+    within_budget = [c for c in frontier
+                     if LATENCY_BUDGET_MS is None or c["latency_ms"] <= LATENCY_BUDGET_MS]
+    selected = within_budget[-1] if within_budget else frontier[0]
+
+    print("Latency / F1 frontier:")
+    for cand in frontier:
+        marker = "  ◀ selected" if cand is selected else ""
+        trees = f" (RF {cand['rf_n_estimators']} trees)" if cand["rf_n_estimators"] else ""
+        print(f"   {cand['latency_ms']:>8.3f} ms  F1={cand['macro_f1']:.3f}  "
+              f"{'+'.join(cand['members'])}{trees}{marker}")
+    if LATENCY_BUDGET_MS is not None and not within_budget:
+        print(f"   ⚠️  Nothing fits {LATENCY_BUDGET_MS} ms - using the cheapest configuration")
+    print()
+
+    ensemble_config = {
+        "latency_budget_ms": LATENCY_BUDGET_MS,
+        "members": selected["members"],
+        "rf_n_estimators": selected["rf_n_estimators"],
+        "expected_latency_ms": selected["latency_ms"],
+        "expected_macro_f1": selected["macro_f1"],
+        "full_ensemble_macro_f1": float(full_f1),
+        "member_latency_ms": member_latency,
+        "marginal_macro_f1": marginal_f1,
+        "rf_pruning_curve": rf_curve,
+        "frontier": frontier,
+    }
+    with open(os.path.join(BASE, "models", "ensemble_config.json"), "w") as f:
+        json.dump(ensemble_config, f, indent=2)
+    print("   Saved models/ensemble_config.json")
+
 print()
 print("=" * 90)
 print("✅ ULTIMATE MODEL COMPLETE!")
@@ -445,5 +640,10 @@ print("      - models/ultimate_gb.joblib")
 if HAS_XGBOOST:
     print("      - models/ultimate_xgb.joblib")
 print("      - models/ultimate_scaler.joblib")
+print("      - models/feature_schema.json")
+print("      - models/ultimate_text.joblib")
+print("      - models/ultimate_approx.joblib")
 print("      - models/ultimate_results.json")
+if PRUNE_MODE:
+    print("      - models/ensemble_config.json")
 print()